@@ -0,0 +1,249 @@
+"""
+Vectorized batch analyses
+Control charts and t-tests for many columns are computed over one 2-D array
+per configuration instead of one pass per column.
+"""
+
+from __future__ import annotations
+
+from collections import defaultdict
+from typing import Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+
+from control_charts import (
+    ATTRIBUTE_CHARTS, CHART_TYPES, SUBGROUP_CHARTS, chart_limits, nelson_rules, parse_rules, valid_rows
+)
+from lazy import lazy_import
+
+pd = lazy_import("pandas")
+stats = lazy_import("scipy.stats")
+
+
+def compact(values: np.ndarray, sizes: Optional[np.ndarray] = None):
+    """
+    Move each column's non-NaN values to the top, preserving order
+    Returns the compacted array and the count of valid values per column,
+    which is the 2-D equivalent of dropna() on every column. A companion
+    `sizes` array drops the same rows and is returned compacted third.
+    """
+    valid = ~np.isnan(values)
+    if sizes is not None:
+        valid &= ~np.isnan(sizes)
+    order = np.argsort(~valid, axis=0, kind="stable")
+    compacted = np.take_along_axis(values, order, axis=0), valid.sum(axis=0)
+    if sizes is None:
+        return compacted
+    return compacted + (np.take_along_axis(sizes, order, axis=0),)
+
+
+def split_by_column(mask: np.ndarray) -> List[List[int]]:
+    """Row indices where mask is true, one list per column"""
+    cols, rows = np.nonzero(mask.T)
+    bounds = np.searchsorted(cols, np.arange(mask.shape[1] + 1))
+    return [rows[bounds[j]:bounds[j + 1]].tolist() for j in range(mask.shape[1])]
+
+
+def chart_spec_error(df: pd.DataFrame, spec: Dict) -> Optional[str]:
+    """Validation message for a control chart spec, or None"""
+    chart_type = spec.get("chart_type", "xbar-r")
+    for col in (spec["column"], spec.get("size_column")):
+        if col and col not in df.columns:
+            return f"Column '{col}' not found"
+        if col and not pd.api.types.is_numeric_dtype(df[col]):
+            return f"Column '{col}' must be numeric"
+    if chart_type not in CHART_TYPES:
+        return f"Unsupported chart type; use one of {', '.join(CHART_TYPES)}"
+    n = int(spec.get("subgroup_size", 5))
+    if chart_type in SUBGROUP_CHARTS and n < 2:
+        return "subgroup_size must be at least 2"
+    if chart_type in ATTRIBUTE_CHARTS and n < 1:
+        return "subgroup_size must be at least 1"
+    try:
+        parse_rules(spec.get("rules"))
+    except ValueError as e:
+        return str(e)
+    return None
+
+
+def control_chart_batch(df: pd.DataFrame, specs: Iterable[Dict]) -> List[Dict]:
+    """
+    Control charts for many {column, chart_type, subgroup_size, size_column, rules} specs
+    Specs sharing a chart type, subgroup size and rule selection are computed together.
+    """
+    specs = list(specs)
+    results: List[Dict] = [None] * len(specs)
+    groups = defaultdict(list)
+    for i, spec in enumerate(specs):
+        error = chart_spec_error(df, spec)
+        if error:
+            results[i] = {"column": spec["column"], "error": error}
+            continue
+        chart_type = spec.get("chart_type", "xbar-r")
+        variable = chart_type in ("p", "np", "u") and bool(spec.get("size_column"))
+        n = 1 if chart_type == "imr" or variable else int(spec.get("subgroup_size", 5))
+        groups[(chart_type, n, variable, tuple(parse_rules(spec.get("rules"))))].append(i)
+
+    for (chart_type, n, variable, rules), members in groups.items():
+        by_pair = defaultdict(list)
+        for i in members:
+            by_pair[(specs[i]["column"], specs[i]["size_column"] if variable else None)].append(i)
+        pairs = list(by_pair)
+        values = df[[col for col, _ in pairs]].to_numpy(dtype=float)
+        if variable:
+            values, counts, sizes = compact(values, df[[size for _, size in pairs]].to_numpy(dtype=float))
+        else:
+            (values, counts), sizes = compact(values), np.full(values.shape, float(n))
+        limits = chart_limits(values, counts, chart_type, n, sizes)
+        items = chart_items(chart_type, limits, rules, variable)
+        if chart_type in ("p", "np"):
+            excess = (valid_rows(values.shape[0], counts) & (values > sizes)).any(axis=0)
+        else:
+            excess = np.zeros(len(pairs), dtype=bool)
+
+        for j, (col, size_column) in enumerate(pairs):
+            if excess[j]:
+                item = {"column": col, "error": "Defective counts cannot exceed the sample size"}
+            elif items[j] is None:
+                item = {"column": col, "error": "Not enough data for the chart"}
+            else:
+                item = {"column": col, **items[j]}
+                if size_column:
+                    item["size_column"] = size_column
+            for i in by_pair[(col, size_column)]:
+                results[i] = item
+    return results
+
+
+def chart_items(chart_type: str, limits: Dict, rules, variable: bool) -> List[Optional[Dict]]:
+    """Per-series result dicts (None where a series has no points) from chart_limits output"""
+    points, counts = limits["points"], limits["counts"]
+    if "point_center" in limits:
+        center, ucl, lcl = limits["point_center"], limits["point_ucl"], limits["point_lcl"]
+    else:
+        center, ucl, lcl = limits["center"], limits["ucl"], limits["lcl"]
+    flags = nelson_rules(points, center, ucl, lcl, counts, sorted(set(rules) | {1}))
+    violations = {rule: split_by_column(flags[rule]) for rule in rules}
+    ooc = split_by_column(flags[1])
+
+    dispersion = limits.get("dispersion")
+    if dispersion is not None:
+        spread = dispersion["points"]
+        in_range = valid_rows(spread.shape[0], dispersion["counts"])
+        spread_ooc = split_by_column(in_range & ((spread > dispersion["ucl"]) | (spread < dispersion["lcl"])))
+
+    subgroup_size = np.broadcast_to(limits["subgroup_size"], counts.shape)
+    items: List[Optional[Dict]] = []
+    for j in range(points.shape[1]):
+        count = int(counts[j])
+        if count == 0:
+            items.append(None)
+            continue
+        item = {
+            "chart_type": chart_type,
+            "center_line": round(float(limits["center"][j]), 4),
+            "ucl": round(float(limits["ucl"][j]), 4),
+            "lcl": round(float(limits["lcl"][j]), 4),
+            "subgroup_size": int(round(float(subgroup_size[j]))),
+            "sigma": round(float(limits["sigma"][j]), 4),
+            "out_of_control_points": ooc[j],
+            "data_points": np.round(points[:count, j], 4),
+            "rule_violations": {str(rule): violations[rule][j] for rule in rules},
+        }
+        if variable:
+            item["point_ucl"] = np.round(ucl[:count, j], 4)
+            item["point_lcl"] = np.round(lcl[:count, j], 4)
+        if dispersion is not None:
+            spread_count = int(dispersion["counts"][j])
+            item["dispersion"] = {
+                "chart_type": dispersion["chart_type"],
+                "center_line": round(float(dispersion["center"][j]), 4),
+                "ucl": round(float(dispersion["ucl"][j]), 4),
+                "lcl": round(float(dispersion["lcl"][j]), 4),
+                "out_of_control_points": spread_ooc[j],
+                "data_points": np.round(spread[:spread_count, j], 4),
+            }
+        items.append(item)
+    return items
+
+
+def ttest_batch(df: pd.DataFrame, specs: Iterable[Dict]) -> List[Dict]:
+    """
+    t-tests for many {column1, column2, test_type, hypothesized_mean, alpha} specs
+    Matches /analyze/ttest: pooled two-sample test, paired test on complete pairs.
+    """
+    specs = list(specs)
+    results: List[Dict] = [None] * len(specs)
+    groups = defaultdict(list)
+    for i, spec in enumerate(specs):
+        test_type = spec.get("test_type", "two-sample")
+        needed = [spec["column1"]] + ([spec["column2"]] if spec.get("column2") else [])
+        missing = [col for col in needed if col not in df.columns]
+        text = [col for col in needed if col in df.columns and not pd.api.types.is_numeric_dtype(df[col])]
+        if missing:
+            results[i] = {"column1": spec["column1"], "error": f"Column '{missing[0]}' not found"}
+        elif text:
+            results[i] = {"column1": spec["column1"], "error": f"Column '{text[0]}' must be numeric"}
+        elif test_type not in ("one-sample", "two-sample", "paired"):
+            results[i] = {"column1": spec["column1"], "error": "Invalid test_type"}
+        elif test_type == "one-sample" and spec.get("hypothesized_mean") is None:
+            results[i] = {"column1": spec["column1"], "error": "hypothesized_mean required for one-sample test"}
+        elif test_type != "one-sample" and not spec.get("column2"):
+            results[i] = {"column1": spec["column1"], "error": f"column2 required for {test_type} test"}
+        else:
+            groups[test_type].append(i)
+
+    with np.errstate(invalid="ignore", divide="ignore"):
+        for test_type, members in groups.items():
+            x = df[[specs[i]["column1"] for i in members]].to_numpy(dtype=float)
+            n1, mean1, var1 = nan_moments(x)
+            alpha = np.array([float(specs[i].get("alpha", 0.05)) for i in members])
+
+            if test_type == "one-sample":
+                mu = np.array([float(specs[i]["hypothesized_mean"]) for i in members])
+                dof = n1 - 1
+                t_stat = (mean1 - mu) / np.sqrt(var1 / n1)
+                mean_diff = mean1 - mu
+            else:
+                y = df[[specs[i]["column2"] for i in members]].to_numpy(dtype=float)
+                if test_type == "two-sample":
+                    n2, mean2, var2 = nan_moments(y)
+                    dof = n1 + n2 - 2
+                    pooled = ((n1 - 1) * var1 + (n2 - 1) * var2) / dof
+                    t_stat = (mean1 - mean2) / np.sqrt(pooled * (1 / n1 + 1 / n2))
+                    mean_diff = mean1 - mean2
+                else:
+                    diff = x - y
+                    nd, mean_d, var_d = nan_moments(diff)
+                    dof = nd - 1
+                    t_stat = mean_d / np.sqrt(var_d / nd)
+                    mean_diff = mean_d
+            p_value = 2 * stats.t.sf(np.abs(t_stat), dof)
+
+            # Confidence interval on the mean of column1, as in /analyze/ttest
+            margin = stats.t.ppf(1 - alpha / 2, dof) * np.sqrt(var1 / n1)
+            for j, i in enumerate(members):
+                md = float(mean_diff[j])
+                results[i] = {
+                    "column1": specs[i]["column1"],
+                    "column2": specs[i].get("column2"),
+                    "test_type": test_type,
+                    "t_statistic": round(float(t_stat[j]), 4),
+                    "p_value": round(float(p_value[j]), 6),
+                    "df": round(float(dof[j]), 2),
+                    "mean_difference": round(md, 4) if md else None,
+                    "confidence_interval": [round(float(mean1[j] - margin[j]), 4), round(float(mean1[j] + margin[j]), 4)],
+                    "significant": bool(p_value[j] < alpha[j]),
+                    "alpha": float(alpha[j]),
+                }
+    return results
+
+
+def nan_moments(values: np.ndarray) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """Per-column count, mean and sample variance ignoring NaN"""
+    valid = ~np.isnan(values)
+    n = valid.sum(axis=0)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        mean = np.where(valid, values, 0.0).sum(axis=0) / n
+        var = (np.where(valid, values - mean, 0.0) ** 2).sum(axis=0) / (n - 1)
+    return n, mean, var
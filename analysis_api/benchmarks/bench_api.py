@@ -0,0 +1,316 @@
+"""
+API benchmark: every /analyze/* endpoint and the compute functions behind them
+Generates synthetic CSV/XLSX datasets over a grid of row and column counts and,
+for each, drives the endpoints in-process through the FastAPI test client (one
+cold upload, then repeated calls by dataset_id with memoization off) and calls
+the compute functions directly. Each dataset runs in a fresh process.
+
+Per case the report gives latency percentiles, rows/s (and MB/s for uploads)
+and peak_alloc_mb, the peak traced allocation (Python and NumPy) while the case
+ran. Results go to a JSON file; --baseline prints the change against an
+earlier report, so two commits can be compared:
+
+    python benchmarks/bench_api.py --output before.json
+    git checkout other-branch
+    python benchmarks/bench_api.py --output after.json --baseline before.json
+
+The full grid (1k/100k/10M rows x 1/50/500 columns) is large; datasets above
+--max-cells (or --xlsx-max-cells for Excel) are skipped and listed as such.
+"""
+
+import argparse
+import json
+import multiprocessing as mp
+import os
+import platform
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from queue import Empty
+from typing import Callable, Dict, List, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(HERE, ".."))
+
+FACTORS = ["F0", "F1", "F2"]
+
+
+def make_dataset(path: str, rows: int, cols: int, seed: int = 0):
+    """Float columns C0..Cn, two-level factors F0..F2 and a text column"""
+    rng = np.random.default_rng(seed)
+    df = pd.DataFrame(rng.normal(10, 1, size=(rows, cols)), columns=[f"C{i}" for i in range(cols)])
+    for factor in FACTORS:
+        df[factor] = rng.choice([-1.0, 1.0], rows)
+    df["Lot"] = rng.choice(["A", "B", "C"], rows)
+    if path.endswith(".csv"):
+        df.to_csv(path, index=False)
+    else:
+        df.to_excel(path, index=False)
+
+
+def peak_rss_mb() -> float:
+    # ru_maxrss is kilobytes on Linux
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def endpoint_cases(cols: int) -> List[Tuple[str, str, Dict]]:
+    """(case, path, form fields) for every analysis endpoint"""
+    columns = [f"C{i}" for i in range(cols)]
+    pair = columns[1] if cols > 1 else FACTORS[0]
+    predictors = ",".join(columns[1:11] or FACTORS)
+    limits = {"usl": 14, "lsl": 6}
+    return [
+        ("descriptive", "/analyze/descriptive", {}),
+        ("descriptive C0", "/analyze/descriptive", {"columns": "C0"}),
+        ("capability", "/analyze/capability", {"column": "C0", **limits}),
+        ("capability intervals", "/analyze/capability",
+         {"column": "C0", **limits, "intervals": "all", "resamples": 1000, "seed": 1}),
+        ("capability non-normal", "/analyze/capability", {"column": "C0", **limits, "distribution": "auto"}),
+        ("regression", "/analyze/regression", {"response": "C0", "predictors": predictors}),
+        ("doe", "/analyze/doe", {"response": "C0", "factors": ",".join(FACTORS)}),
+        ("ttest", "/analyze/ttest", {"column1": "C0", "column2": pair}),
+        ("control-chart xbar-r", "/analyze/control-chart", {"column": "C0", "chart_type": "xbar-r"}),
+        ("control-chart imr", "/analyze/control-chart", {"column": "C0", "chart_type": "imr"}),
+        ("capability batch", "/analyze/capability/batch",
+         {"specs": json.dumps([{"column": c, **limits} for c in columns])}),
+        ("control-chart batch", "/analyze/control-chart/batch",
+         {"specs": json.dumps([{"column": c, "chart_type": "imr"} for c in columns])}),
+        ("ttest batch", "/analyze/ttest/batch",
+         {"specs": json.dumps([{"column1": c, "column2": FACTORS[0]} for c in columns])}),
+    ]
+
+
+def streaming_cases(cols: int) -> List[Tuple[str, str, Dict]]:
+    """Endpoints that read a CSV upload in chunks; they always take the file"""
+    predictors = ",".join([f"C{i}" for i in range(1, min(cols, 11))] or FACTORS)
+    return [
+        ("descriptive streaming", "/analyze/descriptive", {"columns": "C0", "streaming": "true"}),
+        ("regression streaming", "/analyze/regression",
+         {"response": "C0", "predictors": predictors, "streaming": "true"}),
+    ]
+
+
+def compute_cases(cols: int) -> List[Tuple[str, Callable]]:
+    """(case, fn(df)) for the compute functions, without HTTP, parsing or storage"""
+    import engine
+    from batch import control_chart_batch, ttest_batch
+    from capability import capability_batch
+
+    columns = [f"C{i}" for i in range(cols)]
+    pair = columns[1] if cols > 1 else FACTORS[0]
+    predictors = columns[1:11] or FACTORS
+    return [
+        ("compute_descriptive", lambda df: engine.compute_descriptive(df, columns)),
+        ("compute_capability", lambda df: engine.compute_capability(df, "C0", 14, 6)),
+        ("compute_regression", lambda df: engine.compute_regression(df, ["C0"], predictors)),
+        ("compute_doe", lambda df: engine.compute_doe(df, "C0", FACTORS, "factorial", None, 0.05)),
+        ("compute_ttest", lambda df: engine.compute_ttest(df, "C0", pair, "two-sample", None, 0.05)),
+        ("compute_control_chart", lambda df: engine.compute_control_chart(df, "C0", 5, "xbar-r")),
+        ("capability_batch", lambda df: capability_batch(df, [{"column": c, "usl": 14, "lsl": 6} for c in columns])),
+        ("control_chart_batch", lambda df: control_chart_batch(df, [{"column": c, "chart_type": "imr"}
+                                                                    for c in columns])),
+        ("ttest_batch", lambda df: ttest_batch(df, [{"column1": c, "column2": FACTORS[0]} for c in columns])),
+    ]
+
+
+def summarize(seconds: List[float]) -> Dict:
+    values = np.array(seconds)
+    return {
+        "runs": int(values.size),
+        "min": round(float(values.min()), 6),
+        "mean": round(float(values.mean()), 6),
+        "p50": round(float(np.percentile(values, 50)), 6),
+        "p90": round(float(np.percentile(values, 90)), 6),
+        "p99": round(float(np.percentile(values, 99)), 6),
+        "max": round(float(values.max()), 6),
+    }
+
+
+def timed(fn: Callable, repeats: int, budget: float) -> Tuple[List[float], float, object]:
+    """Run fn up to repeats times (at least once, stopping after budget seconds); returns times, peak MB, last value"""
+    seconds = []
+    tracemalloc.reset_peak()
+    base = tracemalloc.get_traced_memory()[0]
+    value = None
+    while len(seconds) < repeats and (not seconds or sum(seconds) < budget):
+        start = time.perf_counter()
+        value = fn()
+        seconds.append(time.perf_counter() - start)
+    peak = (tracemalloc.get_traced_memory()[1] - base) / 1024 ** 2
+    return seconds, peak, value
+
+
+def run_dataset(path: str, rows: int, cols: int, repeats: int, budget: float, queue):
+    # Measure computation, not the memo; each dataset starts with empty caches
+    os.environ["ANALYSIS_MEMO_ENTRIES"] = "0"
+    from fastapi.testclient import TestClient
+    import engine
+    import main
+
+    # Library import time is bench_startup.py's concern; keep it out of the cold cases
+    main.warm_up()
+    client = TestClient(main.app)
+    with open(path, "rb") as f:
+        content = f.read()
+    name = os.path.basename(path)
+    size_mb = len(content) / 1024 ** 2
+    fmt = name.rsplit(".", 1)[1]
+    results = []
+    tracemalloc.start()
+
+    def record(kind: str, case: str, seconds: List[float], peak: float, status: Optional[int] = None,
+               upload: bool = False):
+        summary = summarize(seconds)
+        result = {
+            "format": fmt, "rows": rows, "cols": cols, "kind": kind, "case": case,
+            "seconds": summary,
+            "rows_per_second": round(rows / summary["p50"], 1) if summary["p50"] else None,
+            "peak_alloc_mb": round(peak, 1),
+        }
+        if upload:
+            result["mb_per_second"] = round(size_mb / summary["p50"], 2) if summary["p50"] else None
+        if status is not None:
+            result["status"] = status
+        results.append(result)
+        print(f"{fmt:5} {rows:>9} x {cols:<4} {kind:9} {case:26} p50 {summary['p50']:9.4f} s  "
+              f"p90 {summary['p90']:9.4f} s  peak {peak:8.1f} MB" + (f"  [{status}]" if status not in (None, 200) else ""),
+              flush=True)
+
+    seconds, peak, response = timed(lambda: client.post("/upload", files={"file": (name, content)}), 1, budget)
+    record("upload", "upload", seconds, peak, response.status_code, upload=True)
+    dataset_id = response.json().get("dataset_id")
+
+    for case, url, data in endpoint_cases(cols):
+        # Cold: the upload is hashed and, for projected columns, parsed again
+        main.dataset_store.delete(dataset_id)
+        seconds, peak, response = timed(lambda: client.post(url, data=data, files={"file": (name, content)}), 1, budget)
+        record("cold", case, seconds, peak, response.status_code, upload=True)
+        client.post("/upload", files={"file": (name, content)})
+        seconds, peak, response = timed(lambda: client.post(url, data={**data, "dataset_id": dataset_id}),
+                                        repeats, budget)
+        record("endpoint", case, seconds, peak, response.status_code)
+
+    if fmt == "csv":
+        for case, url, data in streaming_cases(cols):
+            seconds, peak, response = timed(lambda: client.post(url, data=data, files={"file": (name, content)}),
+                                            repeats, budget)
+            record("streaming", case, seconds, peak, response.status_code, upload=True)
+
+    df = engine.parse_content(content, name)
+    for case, fn in compute_cases(cols):
+        try:
+            seconds, peak, _ = timed(lambda: fn(df), repeats, budget)
+        except Exception as exc:
+            print(f"{case}: {exc}", flush=True)
+            continue
+        record("compute", case, seconds, peak)
+
+    tracemalloc.stop()
+    queue.put({"results": results, "peak_rss_mb": round(peak_rss_mb(), 1)})
+
+
+def measure(path: str, rows: int, cols: int, repeats: int, budget: float) -> Dict:
+    ctx = mp.get_context("spawn")
+    queue = ctx.Queue()
+    proc = ctx.Process(target=run_dataset, args=(path, rows, cols, repeats, budget, queue))
+    proc.start()
+    # A worker killed by the OS (e.g. out of memory) never reports; do not wait for it forever
+    while True:
+        try:
+            result = queue.get(timeout=1)
+            break
+        except Empty:
+            if not proc.is_alive():
+                return {"results": [], "error": f"benchmark process exited with code {proc.exitcode}"}
+    proc.join()
+    return result
+
+
+def environment() -> Dict:
+    try:
+        commit = subprocess.run(["git", "rev-parse", "HEAD"], cwd=HERE, capture_output=True, text=True).stdout.strip()
+    except OSError:
+        commit = None
+    return {
+        "commit": commit or None,
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "python": platform.python_version(),
+        "numpy": np.__version__,
+        "pandas": pd.__version__,
+        "platform": platform.platform(),
+        "cpus": os.cpu_count(),
+    }
+
+
+def compare(results: List[Dict], baseline_path: str):
+    """Print the p50 ratio of every case also present in the baseline report"""
+    with open(baseline_path) as f:
+        baseline = json.load(f)
+    key = lambda r: (r["format"], r["rows"], r["cols"], r["kind"], r["case"])
+    previous = {key(r): r for r in baseline["results"]}
+    print(f"\nChange against {baseline_path} (p50 new / old; below 1 is faster)")
+    for result in results:
+        old = previous.get(key(result))
+        if old is None or not old["seconds"]["p50"]:
+            continue
+        ratio = result["seconds"]["p50"] / old["seconds"]["p50"]
+        print(f"{result['format']:5} {result['rows']:>9} x {result['cols']:<4} {result['kind']:9} "
+              f"{result['case']:26} {ratio:6.2f}x")
+
+
+def parse_sizes(text: str) -> List[int]:
+    return [int(float(part)) for part in text.split(",")]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=parse_sizes, default=[1_000, 100_000, 10_000_000])
+    parser.add_argument("--cols", type=parse_sizes, default=[1, 50, 500])
+    parser.add_argument("--formats", default="csv,xlsx")
+    parser.add_argument("--max-cells", type=float, default=50e6, help="skip CSV datasets larger than this")
+    parser.add_argument("--xlsx-max-cells", type=float, default=1e6, help="skip Excel datasets larger than this")
+    parser.add_argument("--repeats", type=int, default=5, help="timed runs per case")
+    parser.add_argument("--budget", type=float, default=30.0, help="stop repeating a case after this many seconds")
+    parser.add_argument("--output", default="bench_api.json", help="write the JSON report to this path")
+    parser.add_argument("--baseline", help="earlier report to compare against")
+    args = parser.parse_args()
+
+    report = {"environment": environment(), "arguments": vars(args), "datasets": [], "results": []}
+    with tempfile.TemporaryDirectory() as tmp:
+        for fmt in args.formats.split(","):
+            limit = args.max_cells if fmt == "csv" else args.xlsx_max_cells
+            for rows in args.rows:
+                for cols in args.cols:
+                    dataset = {"format": fmt, "rows": rows, "cols": cols}
+                    if rows * cols > limit:
+                        report["datasets"].append({**dataset, "skipped": f"more than {limit:.0f} cells"})
+                        continue
+                    path = os.path.join(tmp, f"bench_{rows}x{cols}.{fmt}")
+                    start = time.perf_counter()
+                    make_dataset(path, rows, cols)
+                    dataset.update(generate_seconds=round(time.perf_counter() - start, 2),
+                                   file_mb=round(os.path.getsize(path) / 1024 ** 2, 2))
+                    outcome = measure(path, rows, cols, args.repeats, args.budget)
+                    os.remove(path)
+                    if "error" in outcome:
+                        print(f"{fmt} {rows} x {cols}: {outcome['error']}", flush=True)
+                        report["datasets"].append({**dataset, "error": outcome["error"]})
+                        continue
+                    report["datasets"].append({**dataset, "peak_rss_mb": outcome["peak_rss_mb"]})
+                    report["results"].extend(outcome["results"])
+
+    with open(args.output, "w") as f:
+        json.dump(report, f, indent=2)
+    print(f"\nWrote {len(report['results'])} results to {args.output}")
+    if args.baseline:
+        compare(report["results"], args.baseline)
+
+
+if __name__ == "__main__":
+    main()
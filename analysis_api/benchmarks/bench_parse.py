@@ -0,0 +1,94 @@
+"""
+Parse benchmark: full parse vs column projection
+Generates a wide CSV/XLSX file and times parse_content with and without
+usecols/float pushdown. Each case runs in a fresh process; parse_rss_mb is
+the growth of peak RSS over the process baseline taken just before parsing.
+
+    python benchmarks/bench_parse.py --rows 200000 --cols 300
+"""
+
+import argparse
+import json
+import multiprocessing as mp
+import os
+import resource
+import sys
+import tempfile
+import time
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+
+def make_dataset(path: str, rows: int, cols: int, seed: int = 0):
+    """Write a frame of float columns C0..Cn plus a text column"""
+    rng = np.random.default_rng(seed)
+    df = pd.DataFrame(rng.normal(10, 1, size=(rows, cols)), columns=[f"C{i}" for i in range(cols)])
+    df["Lot"] = rng.choice(["A", "B", "C"], rows)
+    if path.endswith(".csv"):
+        df.to_csv(path, index=False)
+    else:
+        df.to_excel(path, index=False)
+
+
+def peak_rss_mb() -> float:
+    # ru_maxrss is kilobytes on Linux
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def run_case(path: str, usecols, queue):
+    from main import parse_content
+
+    with open(path, "rb") as f:
+        content = f.read()
+    baseline = peak_rss_mb()
+    start = time.perf_counter()
+    df = parse_content(content, os.path.basename(path), usecols, usecols)
+    elapsed = time.perf_counter() - start
+    queue.put({
+        "seconds": round(elapsed, 4),
+        "baseline_rss_mb": round(baseline, 1),
+        "peak_rss_mb": round(peak_rss_mb(), 1),
+        "parse_rss_mb": round(peak_rss_mb() - baseline, 1),
+        "shape": list(df.shape),
+    })
+
+
+def measure(path: str, usecols) -> dict:
+    ctx = mp.get_context("spawn")
+    queue = ctx.Queue()
+    proc = ctx.Process(target=run_case, args=(path, usecols, queue))
+    proc.start()
+    result = queue.get()
+    proc.join()
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, default=100_000)
+    parser.add_argument("--cols", type=int, default=300)
+    parser.add_argument("--xlsx-rows", type=int, default=10_000, help="rows for the Excel case (slow to write)")
+    parser.add_argument("--output", help="write results as JSON to this path")
+    args = parser.parse_args()
+
+    results = []
+    with tempfile.TemporaryDirectory() as tmp:
+        for ext, rows in ((".csv", args.rows), (".xlsx", args.xlsx_rows)):
+            path = os.path.join(tmp, f"bench{ext}")
+            make_dataset(path, rows, args.cols)
+            for label, usecols in (("full", None), ("1 column", ["C0"]), ("2 columns", ["C0", "C1"])):
+                result = {"format": ext[1:], "rows": rows, "cols": args.cols, "case": label, **measure(path, usecols)}
+                results.append(result)
+                print(f"{result['format']:5} {rows:>8} rows  {label:10} {result['seconds']:8.3f} s  "
+                      f"peak RSS {result['peak_rss_mb']:8.1f} MB (+{result['parse_rss_mb']:.1f} MB while parsing)")
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
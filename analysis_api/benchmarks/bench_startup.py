@@ -0,0 +1,172 @@
+"""
+Startup benchmark: import time and first-request latency
+Each run starts a fresh interpreter that imports main, enters the FastAPI
+test client (running startup hooks, so ANALYSIS_WARMUP=1 warms up there) and
+posts the same analysis twice on a small CSV. Per case the report gives
+percentiles of:
+
+- import_seconds - import main
+- startup_seconds - startup hooks
+- first_request_seconds and second_request_seconds - the gap is what the first
+  request pays for loading libraries
+- ready_seconds - import, startup and first request: time to the first result
+- process_seconds - the whole run including interpreter start, seen from outside
+
+Modes are `lazy` (libraries load on first use) and `warmup` (ANALYSIS_WARMUP=1).
+Like bench_api.py, --baseline prints the change against an earlier report:
+
+    python benchmarks/bench_startup.py --output before.json
+    git checkout other-branch
+    python benchmarks/bench_startup.py --output after.json --baseline before.json
+"""
+
+import argparse
+import io
+import json
+import os
+import platform
+import subprocess
+import sys
+import time
+from typing import Dict, List
+
+import numpy as np
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+API = os.path.join(HERE, "..")
+
+CASES = {
+    "descriptive": ("/analyze/descriptive", {}),
+    "capability": ("/analyze/capability", {"column": "C0", "usl": "13", "lsl": "7"}),
+    "control-chart": ("/analyze/control-chart", {"column": "C0", "chart_type": "imr"}),
+    "regression": ("/analyze/regression", {"response": "C0", "predictors": "C1,C2"}),
+}
+MODES = {"lazy": {}, "warmup": {"ANALYSIS_WARMUP": "1"}}
+
+
+def child(case: str):
+    """One measured run, printed as JSON; numpy alone builds the data so nothing heavy loads early"""
+    rng = np.random.default_rng(0)
+    buffer = io.BytesIO()
+    np.savetxt(buffer, rng.normal(10, 1, size=(1000, 4)), delimiter=",", header="C0,C1,C2,C3", comments="", fmt="%.6f")
+    content = buffer.getvalue()
+    url, data = CASES[case]
+
+    start = time.perf_counter()
+    import main
+    imported = time.perf_counter()
+    loaded_at_import = getattr(main, "loaded", dict)()  # absent before lazy imports
+
+    from fastapi.testclient import TestClient
+    with TestClient(main.app) as client:
+        started = time.perf_counter()
+        first = client.post(url, data=data, files={"file": ("bench.csv", content)})
+        answered = time.perf_counter()
+        second = client.post(url, data={**data, "target": "10"} if case == "capability" else data,
+                             files={"file": ("bench.csv", content)})
+        repeated = time.perf_counter()
+    print(json.dumps({
+        "import_seconds": imported - start,
+        "startup_seconds": started - imported,
+        "first_request_seconds": answered - started,
+        "second_request_seconds": repeated - answered,
+        "ready_seconds": answered - start,
+        "status": [first.status_code, second.status_code],
+        "loaded_at_import": [name for name, done in loaded_at_import.items() if done],
+    }))
+
+
+def run(case: str, mode: str) -> Dict:
+    env = {**os.environ, **MODES[mode], "ANALYSIS_MEMO_ENTRIES": "0"}
+    start = time.perf_counter()
+    out = subprocess.run([sys.executable, "-W", "ignore", os.path.abspath(__file__), "--child", case],
+                         cwd=API, env=env, capture_output=True, text=True, check=True)
+    result = json.loads(out.stdout.strip().splitlines()[-1])
+    result["process_seconds"] = time.perf_counter() - start
+    return result
+
+
+def summarize(seconds: List[float]) -> Dict:
+    values = np.array(seconds)
+    return {
+        "runs": int(values.size),
+        "min": round(float(values.min()), 6),
+        "p50": round(float(np.percentile(values, 50)), 6),
+        "p90": round(float(np.percentile(values, 90)), 6),
+        "max": round(float(values.max()), 6),
+    }
+
+
+METRICS = ("import_seconds", "startup_seconds", "first_request_seconds", "second_request_seconds",
+           "ready_seconds", "process_seconds")
+
+
+def environment() -> Dict:
+    try:
+        commit = subprocess.run(["git", "rev-parse", "HEAD"], cwd=HERE, capture_output=True, text=True).stdout.strip()
+    except OSError:
+        commit = None
+    return {
+        "commit": commit or None,
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "python": platform.python_version(),
+        "numpy": np.__version__,
+        "platform": platform.platform(),
+        "cpus": os.cpu_count(),
+    }
+
+
+def compare(results: List[Dict], baseline_path: str):
+    """Print the p50 ratio of every metric of every case also present in the baseline report"""
+    with open(baseline_path) as f:
+        baseline = json.load(f)
+    previous = {(r["mode"], r["case"]): r for r in baseline["results"]}
+    print(f"\nChange against {baseline_path} (p50 new / old; below 1 is faster)")
+    for result in results:
+        old = previous.get((result["mode"], result["case"]))
+        if old is None:
+            continue
+        ratios = [f"{metric.replace('_seconds', '')} {result[metric]['p50'] / old[metric]['p50']:5.2f}x"
+                  for metric in METRICS if old.get(metric, {}).get("p50")]
+        print(f"{result['mode']:7} {result['case']:14} " + "  ".join(ratios))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--cases", default=",".join(CASES))
+    parser.add_argument("--modes", default=",".join(MODES))
+    parser.add_argument("--repeats", type=int, default=5, help="fresh processes per case")
+    parser.add_argument("--output", default="bench_startup.json", help="write the JSON report to this path")
+    parser.add_argument("--baseline", help="earlier report to compare against")
+    parser.add_argument("--child", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    if args.child:
+        sys.path.insert(0, API)
+        child(args.child)
+        return
+
+    report = {"environment": environment(), "arguments": vars(args), "results": []}
+    for mode in args.modes.split(","):
+        for case in args.cases.split(","):
+            runs = [run(case, mode) for _ in range(args.repeats)]
+            result = {"mode": mode, "case": case, "status": runs[-1]["status"],
+                      "loaded_at_import": runs[-1]["loaded_at_import"]}
+            result.update({metric: summarize([r[metric] for r in runs]) for metric in METRICS})
+            report["results"].append(result)
+            print(f"{mode:7} {case:14} import {result['import_seconds']['p50']:7.3f} s  "
+                  f"startup {result['startup_seconds']['p50']:7.3f} s  "
+                  f"first {result['first_request_seconds']['p50']:7.3f} s  "
+                  f"second {result['second_request_seconds']['p50']:7.3f} s  "
+                  f"ready {result['ready_seconds']['p50']:7.3f} s  "
+                  f"process {result['process_seconds']['p50']:7.3f} s"
+                  + (f"  {result['status']}" if result["status"] != [200, 200] else ""), flush=True)
+
+    with open(args.output, "w") as f:
+        json.dump(report, f, indent=2)
+    print(f"\nWrote {len(report['results'])} results to {args.output}")
+    if args.baseline:
+        compare(report["results"], args.baseline)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,342 @@
+"""
+Process capability calculations
+Index formulas work on scalars or NumPy arrays, so one characteristic and
+thousands of characteristics share the same code path, including the
+thousands of resampled (mean, std) pairs behind a bootstrap interval.
+"""
+
+from __future__ import annotations
+
+import os
+import secrets
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+
+from distributions import CRITERIA, best_fit, fit_columns, parse_distribution, percentile_indices
+from lazy import lazy_import
+
+pd = lazy_import("pandas")
+special = lazy_import("scipy.special")
+stats = lazy_import("scipy.stats")
+
+
+CAPABLE_CPK = 1.33
+
+INTERVAL_METHODS = ("exact", "bootstrap", "parametric")
+DEFAULT_RESAMPLES = 10_000
+MAX_RESAMPLES = 1_000_000
+# Seeds stay exact as JSON numbers, also for clients that parse them as doubles
+MAX_SEED = 2 ** 53
+# Resampled values drawn at once; bounds bootstrap memory to about 32 MB of indices
+BOOTSTRAP_BLOCK = 4_000_000
+
+_bootstrap_pool: Optional[ProcessPoolExecutor] = None
+
+
+def calculate_sigma_level(cpk):
+    """Convert Cpk to approximate sigma level"""
+    return cpk * 3 + 1.5  # Approximate with 1.5 sigma shift
+
+
+def capability_indices(mean, std, usl, lsl) -> Dict:
+    """Cp, Cpk, Cpu, Cpl, normal-theory PPM and sigma level for scalar or array inputs"""
+    cp = (usl - lsl) / (6 * std)
+    cpu = (usl - mean) / (3 * std)
+    cpl = (mean - lsl) / (3 * std)
+    cpk = np.minimum(cpu, cpl)
+
+    z_upper = (usl - mean) / std
+    z_lower = (mean - lsl) / std
+    return {
+        "cp": cp,
+        "cpu": cpu,
+        "cpl": cpl,
+        "cpk": cpk,
+        # ndtr is what stats.norm.cdf evaluates; calling it directly spares a cold start importing scipy.stats
+        "ppm_above_usl": (1 - special.ndtr(z_upper)) * 1_000_000,
+        "ppm_below_lsl": special.ndtr(-z_lower) * 1_000_000,
+        "sigma_level": calculate_sigma_level(cpk),
+    }
+
+
+def column_moments(df: pd.DataFrame, columns: List[str], block: int = 256) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """
+    NaN-aware count, mean and sample std per column
+    Columns are processed in blocks so a wide frame is never copied whole.
+    """
+    counts, means, stds = [], [], []
+    for start in range(0, len(columns), block):
+        values = df[columns[start:start + block]].to_numpy(dtype=float)
+        valid = ~np.isnan(values)
+        n = valid.sum(axis=0)
+        total = np.where(valid, values, 0.0).sum(axis=0)
+        with np.errstate(invalid="ignore", divide="ignore"):
+            mean = total / n
+            resid = np.where(valid, values - mean, 0.0)
+            std = np.sqrt((resid ** 2).sum(axis=0) / (n - 1))
+        counts.append(n)
+        means.append(mean)
+        stds.append(std)
+    if not columns:
+        return np.empty(0, int), np.empty(0), np.empty(0)
+    return np.concatenate(counts), np.concatenate(means), np.concatenate(stds)
+
+
+def capability_batch(df: pd.DataFrame, specs: Iterable[Dict]) -> List[Dict]:
+    """
+    Capability for many {column, usl, lsl, target} specs in one vectorized pass
+    Returns one dict per spec, with an "error" key for specs that cannot be computed.
+    """
+    specs = list(specs)
+    columns = list(dict.fromkeys(
+        s["column"] for s in specs if s["column"] in df.columns and pd.api.types.is_numeric_dtype(df[s["column"]])
+    ))
+    position = {col: i for i, col in enumerate(columns)}
+    counts, means, stds = column_moments(df, columns)
+
+    present = [i for i, s in enumerate(specs) if s["column"] in position]
+    idx = np.array([position[specs[i]["column"]] for i in present], dtype=int)
+    usl = np.array([float(specs[i]["usl"]) for i in present])
+    lsl = np.array([float(specs[i]["lsl"]) for i in present])
+    mean, std = means[idx], stds[idx]
+    with np.errstate(invalid="ignore", divide="ignore"):
+        indices = capability_indices(mean, std, usl, lsl)
+
+    results: List[Dict] = [None] * len(specs)
+    for i, spec in enumerate(specs):
+        if spec["column"] not in position:
+            problem = "must be numeric" if spec["column"] in df.columns else "not found"
+            results[i] = {"column": spec["column"], "error": f"Column '{spec['column']}' {problem}"}
+    fitted = fitted_batch(df, specs, present)
+    for j, i in enumerate(present):
+        spec = specs[i]
+        if i in fitted and "error" in fitted[i]:
+            results[i] = {"column": spec["column"], **fitted[i]}
+            continue
+        if i in fitted:
+            results[i] = {"column": spec["column"], "usl": float(spec["usl"]), "lsl": float(spec["lsl"]),
+                          "target": spec.get("target"), "mean": round(float(mean[j]), 4),
+                          "std": round(float(std[j]), 4), **fitted[i]}
+            continue
+        if not std[j] > 0:
+            results[i] = {"column": spec["column"], "error": "Standard deviation is zero"}
+            continue
+        cpk = float(indices["cpk"][j])
+        results[i] = {
+            "column": spec["column"],
+            "usl": float(spec["usl"]),
+            "lsl": float(spec["lsl"]),
+            "target": spec.get("target"),
+            "mean": round(float(mean[j]), 4),
+            "std": round(float(std[j]), 4),
+            "cp": round(float(indices["cp"][j]), 3),
+            "cpk": round(cpk, 3),
+            "cpu": round(float(indices["cpu"][j]), 3),
+            "cpl": round(float(indices["cpl"][j]), 3),
+            "ppm_above_usl": round(float(indices["ppm_above_usl"][j]), 1),
+            "ppm_below_lsl": round(float(indices["ppm_below_lsl"][j]), 1),
+            "sigma_level": round(float(indices["sigma_level"][j]), 2),
+            "capable": cpk >= CAPABLE_CPK,
+        }
+    return results
+
+
+# ==================== NON-NORMAL CAPABILITY ====================
+
+def fitted_capability(entries: List[Dict], usl: float, lsl: float, criterion: str = "ad") -> Dict:
+    """Percentile-method capability of the best-fitting candidate, or an error"""
+    fit = best_fit(entries, criterion)
+    if fit is None:
+        return {"error": "No candidate distribution fits the data"}
+    indices = percentile_indices(fit, usl, lsl)
+    ppk = indices["ppk"]
+    ranked = sorted(entries, key=lambda entry: getattr(entry["fit"], criterion) if "fit" in entry else np.inf)
+    return {
+        "cp": round(indices["pp"], 3),
+        "cpk": round(ppk, 3),
+        "cpu": round(indices["ppu"], 3),
+        "cpl": round(indices["ppl"], 3),
+        "ppm_above_usl": round(indices["ppm_above_usl"], 1),
+        "ppm_below_lsl": round(indices["ppm_below_lsl"], 1),
+        "sigma_level": round(calculate_sigma_level(ppk), 2),
+        "capable": bool(ppk >= CAPABLE_CPK),
+        "distribution": fit.distribution,
+        "distribution_fit": {
+            "criterion": criterion,
+            "median": round(indices["median"], 4),
+            "percentile_0.135": round(indices["p_low"], 4),
+            "percentile_99.865": round(indices["p_high"], 4),
+            "candidates": [entry["fit"].summary() if "fit" in entry else entry for entry in ranked],
+        },
+    }
+
+
+def fitted_batch(df: pd.DataFrame, specs: List[Dict], present: List[int]) -> Dict[int, Dict]:
+    """Non-normal results for the specs that name a distribution, fitting each candidate set once"""
+    groups: Dict[Tuple[str, ...], List[int]] = {}
+    results: Dict[int, Dict] = {}
+    for i in present:
+        distribution = specs[i].get("distribution") or "normal"
+        if distribution == "normal":
+            continue
+        try:
+            groups.setdefault(tuple(parse_distribution(distribution)), []).append(i)
+        except ValueError as exc:
+            results[i] = {"error": str(exc)}
+    for candidates, members in groups.items():
+        columns = {col: df[col].dropna().to_numpy(dtype=float)
+                   for col in dict.fromkeys(specs[i]["column"] for i in members)}
+        fits = fit_columns(columns, candidates)
+        for i in members:
+            spec = specs[i]
+            criterion = spec.get("criterion", "ad")
+            if criterion not in CRITERIA:
+                results[i] = {"error": "criterion must be 'ad' or 'aic'"}
+                continue
+            results[i] = fitted_capability(fits[spec["column"]], float(spec["usl"]), float(spec["lsl"]), criterion)
+    return results
+
+
+# ==================== CONFIDENCE INTERVALS ====================
+
+def parse_intervals(intervals: Optional[str]) -> List[str]:
+    """Interval methods from "all" or a comma-separated list; empty means none"""
+    if not intervals:
+        return []
+    if intervals.strip().lower() == "all":
+        return list(INTERVAL_METHODS)
+    methods = [m.strip().lower() for m in intervals.split(",") if m.strip()]
+    for method in methods:
+        if method not in INTERVAL_METHODS:
+            raise ValueError(f"Unknown interval method '{method}'; use {', '.join(INTERVAL_METHODS)} or all")
+    return list(dict.fromkeys(methods))
+
+
+def check_seed(seed: Optional[int]):
+    if seed is not None and not 0 <= seed < MAX_SEED:
+        raise ValueError("seed must be between 0 and 2**53 - 1")
+
+
+def exact_intervals(n: int, cp: float, cpk: float, confidence: float) -> Dict:
+    """Chi-square interval for Cp and Bissell's normal approximation for Cpk"""
+    alpha = 1 - confidence
+    df = n - 1
+    z = stats.norm.ppf(1 - alpha / 2)
+    cpk_se = np.sqrt(1 / (9 * n) + cpk ** 2 / (2 * df))
+    return {
+        "cp": (cp * np.sqrt(stats.chi2.ppf(alpha / 2, df) / df),
+               cp * np.sqrt(stats.chi2.ppf(1 - alpha / 2, df) / df)),
+        "cpk": (cpk - z * cpk_se, cpk + z * cpk_se),
+    }
+
+
+def index_draws(means: np.ndarray, stds: np.ndarray, usl: float, lsl: float) -> Dict[str, np.ndarray]:
+    """Cp, Cpk and total PPM for every resampled (mean, std) pair"""
+    with np.errstate(invalid="ignore", divide="ignore"):
+        indices = capability_indices(means, stds, usl, lsl)
+    return {
+        "cp": indices["cp"],
+        "cpk": indices["cpk"],
+        "ppm": indices["ppm_above_usl"] + indices["ppm_below_lsl"],
+    }
+
+
+def percentile_intervals(draws: Dict[str, np.ndarray], confidence: float) -> Dict:
+    """Percentile interval of each index over its draws"""
+    alpha = 1 - confidence
+    bounds = {}
+    for name, values in draws.items():
+        values = values[~np.isnan(values)]
+        lower, upper = np.quantile(values, [alpha / 2, 1 - alpha / 2]) if values.size else (np.nan, np.nan)
+        bounds[name] = (float(lower), float(upper))
+    return bounds
+
+
+def bootstrap_moments(data: np.ndarray, blocks: List[Tuple[int, np.random.SeedSequence]]) -> Tuple[np.ndarray, np.ndarray]:
+    """Mean and std of resamples of data; each (draws, seed) block is one batched draw"""
+    means, stds = [], []
+    for draws, seed in blocks:
+        rng = np.random.default_rng(seed)
+        sample = data[rng.integers(0, data.size, size=(draws, data.size))]
+        means.append(sample.mean(axis=1))
+        stds.append(sample.std(axis=1, ddof=1))
+    if not means:
+        return np.empty(0), np.empty(0)
+    return np.concatenate(means), np.concatenate(stds)
+
+
+def bootstrap_workers() -> int:
+    """Processes for large bootstraps from ANALYSIS_BOOTSTRAP_WORKERS (0 or 1 = in-process)"""
+    return int(os.environ.get("ANALYSIS_BOOTSTRAP_WORKERS", 0))
+
+
+def bootstrap_pool() -> ProcessPoolExecutor:
+    global _bootstrap_pool
+    if _bootstrap_pool is None:
+        _bootstrap_pool = ProcessPoolExecutor(max_workers=bootstrap_workers())
+    return _bootstrap_pool
+
+
+def bootstrap_resample(data: np.ndarray, resamples: int,
+                       seed: np.random.SeedSequence) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Nonparametric bootstrap of the mean and std
+    Resamples are split into fixed blocks with their own child seeds, so the draws
+    are identical whether the blocks run here or across the process pool.
+    """
+    per_block = max(1, BOOTSTRAP_BLOCK // data.size)
+    sizes = [min(per_block, resamples - start) for start in range(0, resamples, per_block)]
+    blocks = list(zip(sizes, seed.spawn(len(sizes))))
+
+    workers = bootstrap_workers()
+    if workers <= 1 or len(blocks) < 2:
+        return bootstrap_moments(data, blocks)
+    step = -(-len(blocks) // workers)
+    groups = [blocks[i:i + step] for i in range(0, len(blocks), step)]
+    parts = list(bootstrap_pool().map(bootstrap_moments, [data] * len(groups), groups))
+    return np.concatenate([m for m, _ in parts]), np.concatenate([s for _, s in parts])
+
+
+def parametric_resample(n: int, mean: float, std: float, resamples: int,
+                        seed: np.random.SeedSequence) -> Tuple[np.ndarray, np.ndarray]:
+    """Monte Carlo draws from the exact normal-theory distribution of the sample mean and std"""
+    rng = np.random.default_rng(seed)
+    means = mean + std / np.sqrt(n) * rng.standard_normal(resamples)
+    stds = std * np.sqrt(rng.chisquare(n - 1, resamples) / (n - 1))
+    return means, stds
+
+
+def capability_intervals(data: np.ndarray, usl: float, lsl: float, methods: List[str],
+                         confidence: float = 0.95, resamples: int = DEFAULT_RESAMPLES,
+                         seed: Optional[int] = None) -> Dict:
+    """
+    Confidence intervals for Cp, Cpk and total PPM by each requested method
+    The seed actually used is returned so any result can be reproduced.
+    """
+    n = data.size
+    mean, std = float(np.mean(data)), float(np.std(data, ddof=1))
+    # A drawn seed is kept below MAX_SEED too, or the returned seed could not reproduce the result
+    root = np.random.SeedSequence(secrets.randbits(53) if seed is None else seed)
+    bootstrap_seed, parametric_seed = root.spawn(2)
+
+    result: Dict = {"confidence": confidence, "seed": int(root.entropy)}
+    if any(method != "exact" for method in methods):
+        result["resamples"] = resamples
+    for method in methods:
+        if method == "exact":
+            point = capability_indices(mean, std, usl, lsl)
+            bounds = exact_intervals(n, float(point["cp"]), float(point["cpk"]), confidence)
+        elif method == "bootstrap":
+            bounds = percentile_intervals(index_draws(*bootstrap_resample(data, resamples, bootstrap_seed),
+                                                      usl, lsl), confidence)
+        else:
+            bounds = percentile_intervals(index_draws(*parametric_resample(n, mean, std, resamples, parametric_seed),
+                                                      usl, lsl), confidence)
+        result[method] = {
+            name: {"lower": round(float(lower), 1 if name == "ppm" else 3),
+                   "upper": round(float(upper), 1 if name == "ppm" else 3)}
+            for name, (lower, upper) in bounds.items()
+        }
+    return result
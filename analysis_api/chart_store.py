@@ -0,0 +1,365 @@
+"""
+Live control charts for phase II monitoring
+A chart is created from a phase I baseline whose limits are then frozen. New
+measurements are scored against those limits as they arrive; only the last
+RULE_WINDOW plotted points are kept, so an append costs O(new points) and run
+rules (runs, trends, zone counts) continue across appends. The SQLite backend
+keeps charts in a table shared by every worker on the host.
+"""
+
+from __future__ import annotations
+
+import os
+import pickle
+import sqlite3
+import threading
+import uuid
+from dataclasses import dataclass, field
+from datetime import datetime
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+from fastapi import HTTPException
+
+from batch import chart_items, chart_spec_error, compact
+from control_charts import (
+    ATTRIBUTE_CHARTS, RULE_WINDOW, SUBGROUP_CHARTS, attribute_points, chart_limits, nelson_rules,
+    parse_rules, subgroup_spread
+)
+from lazy import lazy_import
+
+pd = lazy_import("pandas")
+
+
+DEFAULT_MAX_CHARTS = 1000
+
+
+@dataclass
+class LiveChart:
+    column: str
+    chart_type: str
+    subgroup_size: int
+    size_column: Optional[str]
+    rules: List[int]
+    center: float
+    ucl: float
+    lcl: float
+    sigma: float
+    baseline_points: int
+    rate: Optional[float] = None  # frozen defect rate of attribute charts
+    dispersion: Optional[Dict] = None  # frozen R, S or MR chart limits
+    chart_id: Optional[str] = None
+    points: int = 0  # phase II points plotted so far
+    tail: Dict[str, np.ndarray] = field(default_factory=dict, repr=False)
+    last_value: Optional[float] = None  # previous individual, for the moving range
+    pending: np.ndarray = field(default_factory=lambda: np.empty(0), repr=False)
+    violations: Dict[str, int] = field(default_factory=dict)
+    out_of_control: int = 0
+    created: str = field(default_factory=lambda: datetime.now().isoformat())
+    updated: Optional[str] = None
+    lock: Optional[threading.Lock] = field(default=None, repr=False)
+
+    def summary(self) -> Dict:
+        return {
+            "chart_id": self.chart_id,
+            "column": self.column,
+            "chart_type": self.chart_type,
+            "subgroup_size": self.subgroup_size,
+            "size_column": self.size_column,
+            "rules": self.rules,
+            "center_line": round(self.center, 4),
+            "ucl": round(self.ucl, 4),
+            "lcl": round(self.lcl, 4),
+            "sigma": round(self.sigma, 4),
+            "dispersion": None if self.dispersion is None else {
+                key: round(value, 4) if isinstance(value, float) else value
+                for key, value in self.dispersion.items()
+            },
+            "baseline_points": self.baseline_points,
+            "points": self.points,
+            "pending_values": int(self.pending.size),
+            "out_of_control": self.out_of_control,
+            "violations": dict(self.violations),
+            "created": self.created,
+            "updated": self.updated,
+        }
+
+    def remember(self, points: np.ndarray, center: np.ndarray, ucl: np.ndarray, lcl: np.ndarray):
+        """Keep the last RULE_WINDOW plotted points and their limits"""
+        self.tail = {
+            "points": points[-RULE_WINDOW:],
+            "center": center[-RULE_WINDOW:],
+            "ucl": ucl[-RULE_WINDOW:],
+            "lcl": lcl[-RULE_WINDOW:],
+        }
+
+    def append(self, values: np.ndarray, sizes: Optional[np.ndarray] = None) -> Dict:
+        """Score new measurements (or counts, for attribute charts) against the frozen limits"""
+        values = np.asarray(values, dtype=float)
+        if self.chart_type in ("p", "np", "u") and self.size_column:
+            if sizes is None or len(sizes) != len(values):
+                raise HTTPException(status_code=400, detail="sizes must give a sample size for every value")
+            sizes = np.asarray(sizes, dtype=float)
+        else:
+            sizes = np.full(values.shape, float(self.subgroup_size))
+        keep = ~(np.isnan(values) | np.isnan(sizes))
+        values, sizes = values[keep], sizes[keep]
+
+        spread, spread_first = None, self.baseline_points + self.points
+        if self.chart_type in SUBGROUP_CHARTS:
+            n = self.subgroup_size
+            raw = np.concatenate([self.pending, values])
+            full = raw.size // n * n
+            subgroups = raw[:full].reshape(-1, n)
+            self.pending = raw[full:]
+            new = subgroups.mean(axis=1)
+            spread = subgroup_spread(subgroups, self.chart_type)
+            center, ucl, lcl = (np.full(new.shape, value) for value in (self.center, self.ucl, self.lcl))
+        elif self.chart_type == "imr":
+            new = values
+            previous = [] if self.last_value is None else [self.last_value]
+            spread = np.abs(np.diff(np.concatenate([previous, values])))
+            # Moving range i spans points i and i + 1, as on the phase I chart
+            spread_first -= len(previous)
+            if values.size:
+                self.last_value = float(values[-1])
+            center, ucl, lcl = (np.full(new.shape, value) for value in (self.center, self.ucl, self.lcl))
+        else:
+            if self.chart_type in ("p", "np") and (values > sizes).any():
+                raise HTTPException(status_code=400, detail="Defective counts cannot exceed the sample size")
+            if self.chart_type == "c":
+                sizes = np.ones(values.shape)
+            new, center, ucl, lcl = attribute_points(self.chart_type, values, sizes, self.rate)
+
+        # Prefix the retained tail so patterns that started earlier are completed here
+        offset = self.tail["points"].size
+        joined = [np.concatenate([self.tail[key], part]) for key, part in
+                  (("points", new), ("center", center), ("ucl", ucl), ("lcl", lcl))]
+        flags = nelson_rules(*(part[:, None] for part in joined), np.array([joined[0].size]),
+                             sorted(set(self.rules) | {1}))
+        first = self.baseline_points + self.points
+        hits = {rule: (np.nonzero(mask[offset:, 0])[0] + first).tolist() for rule, mask in flags.items()}
+
+        self.remember(*joined)
+        self.points += int(new.size)
+        self.out_of_control += len(hits[1])
+        for rule in self.rules:
+            self.violations[str(rule)] = self.violations.get(str(rule), 0) + len(hits[rule])
+        self.updated = datetime.now().isoformat()
+
+        result = {
+            "chart_id": self.chart_id,
+            "first_point": first,
+            "points": int(new.size),
+            "data_points": np.round(new, 4).tolist(),
+            "out_of_control_points": hits[1],
+            "rule_violations": {str(rule): hits[rule] for rule in self.rules},
+            "pending_values": int(self.pending.size),
+        }
+        if self.chart_type in ("p", "np", "u") and self.size_column:
+            result["point_ucl"] = np.round(ucl, 4).tolist()
+            result["point_lcl"] = np.round(lcl, 4).tolist()
+        if spread is not None:
+            beyond = (spread > self.dispersion["ucl"]) | (spread < self.dispersion["lcl"])
+            result["dispersion"] = {
+                "first_point": spread_first,
+                "data_points": np.round(spread, 4).tolist(),
+                "out_of_control_points": (np.nonzero(beyond)[0] + spread_first).tolist(),
+            }
+        return result
+
+
+def baseline_chart(df: pd.DataFrame, column: str, subgroup_size: int, chart_type: str,
+                   size_column: Optional[str] = None, rules: str = "all") -> Tuple[Dict, LiveChart]:
+    """Phase I chart result and the live chart that freezes its limits"""
+    spec = {"column": column, "subgroup_size": subgroup_size, "chart_type": chart_type,
+            "size_column": size_column, "rules": rules}
+    error = chart_spec_error(df, spec)
+    if error:
+        raise HTTPException(status_code=400, detail=error)
+    rules = parse_rules(rules)
+    variable = chart_type in ("p", "np", "u") and bool(size_column)
+    n = 1 if chart_type == "imr" or variable else int(subgroup_size)
+
+    values = df[[column]].to_numpy(dtype=float)
+    if variable:
+        values, counts, sizes = compact(values, df[[size_column]].to_numpy(dtype=float))
+    else:
+        (values, counts), sizes = compact(values), np.full(values.shape, float(n))
+    limits = chart_limits(values, counts, chart_type, n, sizes)
+    item = chart_items(chart_type, limits, rules, variable)[0]
+    if item is None:
+        raise HTTPException(status_code=400, detail="Not enough data for the chart")
+    if chart_type in ("p", "np") and (values[:int(counts[0])] > sizes[:int(counts[0])]).any():
+        raise HTTPException(status_code=400, detail="Defective counts cannot exceed the sample size")
+
+    dispersion = limits.get("dispersion")
+    chart = LiveChart(
+        column=column,
+        chart_type=chart_type,
+        subgroup_size=n,
+        size_column=size_column if variable else None,
+        rules=rules,
+        center=float(limits["center"][0]),
+        ucl=float(limits["ucl"][0]),
+        lcl=float(limits["lcl"][0]),
+        sigma=float(limits["sigma"][0]),
+        baseline_points=int(limits["counts"][0]),
+        rate=float(limits["rate"][0]) if "rate" in limits else None,
+        dispersion=None if dispersion is None else {
+            "chart_type": dispersion["chart_type"],
+            "center_line": float(dispersion["center"][0]),
+            "ucl": float(dispersion["ucl"][0]),
+            "lcl": float(dispersion["lcl"][0]),
+        },
+    )
+    count = chart.baseline_points
+    if chart_type in ATTRIBUTE_CHARTS:
+        center, ucl, lcl = (limits[key][:count, 0] for key in ("point_center", "point_ucl", "point_lcl"))
+    else:
+        center, ucl, lcl = (np.full(count, value) for value in (chart.center, chart.ucl, chart.lcl))
+    chart.remember(limits["points"][:count, 0], center, ucl, lcl)
+    if chart_type == "imr":
+        chart.last_value = float(values[count - 1, 0])
+    return item, chart
+
+
+class ChartStore:
+    """Live charts by id; appends to one chart are serialised by its lock"""
+
+    backend = "memory"
+
+    def __init__(self, max_charts: int = DEFAULT_MAX_CHARTS):
+        self.max_charts = max_charts
+        self._charts: Dict[str, LiveChart] = {}
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._charts)
+
+    def add(self, chart: LiveChart) -> LiveChart:
+        with self._lock:
+            if self.max_charts and len(self._charts) >= self.max_charts:
+                raise HTTPException(
+                    status_code=429,
+                    detail=f"Live chart limit reached ({self.max_charts}); delete unused charts"
+                )
+            chart.chart_id = str(uuid.uuid4())[:8]
+            chart.lock = threading.Lock()
+            self._charts[chart.chart_id] = chart
+        return chart
+
+    def get(self, chart_id: str) -> LiveChart:
+        chart = self._charts.get(chart_id)
+        if chart is None:
+            raise HTTPException(status_code=404, detail="Chart not found")
+        return chart
+
+    def append(self, chart_id: str, values, sizes=None) -> Dict:
+        chart = self.get(chart_id)
+        with chart.lock:
+            return chart.append(values, sizes)
+
+    def delete(self, chart_id: str) -> bool:
+        with self._lock:
+            return self._charts.pop(chart_id, None) is not None
+
+    def list(self) -> List[Dict]:
+        return [chart.summary() for chart in list(self._charts.values())]
+
+    def stats(self) -> Dict:
+        return {"backend": self.backend, "charts": len(self._charts), "max_charts": self.max_charts}
+
+
+class SQLiteChartStore(ChartStore):
+    """
+    Live charts pickled into a WAL-mode SQLite table shared by every worker on the host
+    An append reads, scores and writes the chart inside one write transaction, so
+    appends to a chart from different workers are serialised like local ones.
+    """
+
+    backend = "sqlite"
+
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS charts (
+            chart_id TEXT PRIMARY KEY,
+            created TEXT NOT NULL,
+            payload BLOB NOT NULL
+        );
+    """
+
+    def __init__(self, path: str, max_charts: int = DEFAULT_MAX_CHARTS):
+        super().__init__(max_charts)
+        self.path = path
+        self._local = threading.local()
+        with self._connect() as conn:
+            conn.executescript(self.SCHEMA)
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def __len__(self) -> int:
+        return self._connect().execute("SELECT COUNT(*) FROM charts").fetchone()[0]
+
+    def add(self, chart: LiveChart) -> LiveChart:
+        conn = self._connect()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            if self.max_charts and len(self) >= self.max_charts:
+                raise HTTPException(
+                    status_code=429,
+                    detail=f"Live chart limit reached ({self.max_charts}); delete unused charts"
+                )
+            chart.chart_id = str(uuid.uuid4())[:8]
+            conn.execute("INSERT INTO charts VALUES (?, ?, ?)", (chart.chart_id, chart.created, pickle.dumps(chart)))
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        return chart
+
+    def get(self, chart_id: str) -> LiveChart:
+        row = self._connect().execute("SELECT payload FROM charts WHERE chart_id = ?", (chart_id,)).fetchone()
+        if row is None:
+            raise HTTPException(status_code=404, detail="Chart not found")
+        return pickle.loads(row[0])
+
+    def append(self, chart_id: str, values, sizes=None) -> Dict:
+        conn = self._connect()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            chart = self.get(chart_id)
+            result = chart.append(values, sizes)
+            conn.execute("UPDATE charts SET payload = ? WHERE chart_id = ?", (pickle.dumps(chart), chart_id))
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        return result
+
+    def delete(self, chart_id: str) -> bool:
+        return self._connect().execute("DELETE FROM charts WHERE chart_id = ?", (chart_id,)).rowcount > 0
+
+    def list(self) -> List[Dict]:
+        rows = self._connect().execute("SELECT payload FROM charts ORDER BY created, chart_id")
+        return [pickle.loads(payload).summary() for payload, in rows]
+
+    def stats(self) -> Dict:
+        return {"backend": self.backend, "charts": len(self), "max_charts": self.max_charts}
+
+
+def create_chart_store() -> ChartStore:
+    """Build the live chart store from ANALYSIS_CHART_STORE (memory or sqlite), ANALYSIS_CHART_DB and ANALYSIS_MAX_CHARTS"""
+    backend = os.environ.get("ANALYSIS_CHART_STORE", "memory")
+    max_charts = int(os.environ.get("ANALYSIS_MAX_CHARTS", DEFAULT_MAX_CHARTS))
+    if backend == "memory":
+        return ChartStore(max_charts)
+    if backend == "sqlite":
+        return SQLiteChartStore(os.environ.get("ANALYSIS_CHART_DB", "analysis_charts.db"), max_charts)
+    raise ValueError(f"Unknown ANALYSIS_CHART_STORE '{backend}'; use 'memory' or 'sqlite'")
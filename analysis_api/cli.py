@@ -0,0 +1,167 @@
+"""
+Command-line runner for the analysis engine
+Runs analyses over many files without the API: every file matching the glob
+patterns is parsed once, in a process pool, and every analysis of the spec runs
+on it. Records stream to JSON Lines or Parquet in input order as files finish,
+and their results are byte for byte what the matching /analyze request returns
+for that file.
+
+    python cli.py "data/**/*.csv" --spec nightly.json --output results.jsonl --workers 8
+
+The spec is a JSON object or list of objects, given inline or as a file, naming
+the analysis and its form fields as the endpoint takes them:
+
+    [{"analysis": "capability", "column": "diameter", "usl": 10.2, "lsl": 9.8},
+     {"analysis": "control-chart", "column": "diameter", "chart_type": "imr"}]
+
+The exit status is 1 when any analysis failed; its record carries the error.
+"""
+
+import argparse
+import glob
+import json
+import os
+import sys
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, Iterator, List
+
+from engine import HAS_PYARROW, analysis_params, analyze_file
+from serialization import dumps
+
+ROW_GROUP = 1000  # records per Parquet row group
+RECORD_FIELDS = ("file", "dataset_id", "analysis_type", "params", "results", "error")
+
+
+def expand(patterns: List[str]) -> List[str]:
+    """Files matching any pattern (** recurses), each once, sorted"""
+    paths = set()
+    for pattern in patterns:
+        paths.update(path for path in glob.glob(pattern, recursive=True) if os.path.isfile(path))
+    return sorted(paths)
+
+
+def load_specs(value: str) -> List[Dict]:
+    """Analysis specs from inline JSON or a JSON file; raises ValueError if one is invalid"""
+    if os.path.isfile(value):
+        with open(value) as f:
+            value = f.read()
+    try:
+        specs = json.loads(value)
+    except json.JSONDecodeError as exc:
+        raise ValueError(f"spec is not valid JSON: {exc.msg}")
+    specs = [specs] if isinstance(specs, dict) else specs
+    if not isinstance(specs, list) or not specs or not all(isinstance(spec, dict) for spec in specs):
+        raise ValueError("spec must be a JSON object or a non-empty list of objects")
+    for spec in specs:
+        analysis_params(spec)
+    return specs
+
+
+class JsonLinesWriter:
+    """One JSON object per record"""
+
+    def __init__(self, path: str):
+        self.out = sys.stdout.buffer if path == "-" else open(path, "wb")
+
+    def write(self, record: Dict):
+        self.out.write(dumps(record) + b"\n")
+
+    def close(self):
+        self.out.flush()
+        if self.out is not sys.stdout.buffer:
+            self.out.close()
+
+
+class ParquetWriter:
+    """One row per record, params and results as JSON text, written a row group at a time"""
+
+    def __init__(self, path: str):
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+
+        self.schema = pa.schema([(name, pa.string()) for name in RECORD_FIELDS])
+        self.writer = pq.ParquetWriter(path, self.schema)
+        self.rows: List[Dict] = []
+
+    def write(self, record: Dict):
+        row = dict(record)
+        for name in ("params", "results"):
+            if name in row:
+                row[name] = dumps(row[name]).decode()
+        self.rows.append(row)
+        if len(self.rows) >= ROW_GROUP:
+            self.flush()
+
+    def flush(self):
+        import pyarrow as pa
+
+        if self.rows:
+            self.writer.write_table(pa.Table.from_pylist(self.rows, schema=self.schema))
+            self.rows = []
+
+    def close(self):
+        self.flush()
+        self.writer.close()
+
+
+def open_writer(path: str):
+    if path.endswith(".parquet"):
+        if not HAS_PYARROW:
+            raise ValueError("Parquet output requires pyarrow")
+        return ParquetWriter(path)
+    return JsonLinesWriter(path)
+
+
+def run(paths: List[str], specs: List[Dict], workers: int) -> Iterator[Dict]:
+    """Records of every file in input order, at most a few files per worker in flight"""
+    if workers == 1:
+        for path in paths:
+            yield from analyze_file(path, specs)
+        return
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        queued = iter(paths)
+        pending = deque(pool.submit(analyze_file, path, specs) for _, path in zip(range(workers * 4), queued))
+        while pending:
+            done = pending.popleft().result()
+            path = next(queued, None)
+            if path is not None:
+                pending.append(pool.submit(analyze_file, path, specs))
+            yield from done
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("patterns", nargs="+", help="files or glob patterns, quoted so the shell does not expand them")
+    parser.add_argument("--spec", required=True, help="analysis spec: inline JSON or a JSON file")
+    parser.add_argument("--output", default="-", help="a .jsonl or .parquet path; - writes JSON Lines to stdout")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1, help="worker processes")
+    args = parser.parse_args()
+
+    output = os.path.abspath(args.output)
+    paths = [path for path in expand(args.patterns) if os.path.abspath(path) != output]
+    if not paths:
+        parser.error("no files match " + " ".join(args.patterns))
+    try:
+        specs = load_specs(args.spec)
+        writer = open_writer(args.output)
+    except (OSError, ValueError) as exc:
+        parser.error(str(exc))
+
+    start = time.perf_counter()
+    records = failed = 0
+    try:
+        for record in run(paths, specs, max(args.workers, 1)):
+            writer.write(record)
+            records += 1
+            failed += "error" in record
+    finally:
+        writer.close()
+    print(f"{len(paths)} files, {records} analyses, {failed} failed in {time.perf_counter() - start:.2f} s",
+          file=sys.stderr)
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
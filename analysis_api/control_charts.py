@@ -0,0 +1,303 @@
+"""
+Shewhart control charts
+Constants are derived from the normal range and standard deviation distributions
+for any subgroup size, and limits and Western Electric/Nelson rules are evaluated
+on 2-D arrays (one column per series) with cumulative-sum rolling windows.
+"""
+
+from functools import lru_cache
+from typing import Dict, Iterable, Optional
+
+import numpy as np
+
+from lazy import lazy_import
+
+special = lazy_import("scipy.special")
+
+
+CHART_TYPES = ("xbar-r", "xbar-s", "imr", "p", "np", "c", "u")
+SUBGROUP_CHARTS = ("xbar-r", "xbar-s")
+ATTRIBUTE_CHARTS = ("p", "np", "c", "u")
+
+# Nelson's numbering; rules 1-4 and 5-8 cover the Western Electric zone tests
+RULES = {
+    1: "One point beyond 3 sigma",
+    2: "Nine points in a row on the same side of the center line",
+    3: "Six points in a row steadily increasing or decreasing",
+    4: "Fourteen points in a row alternating up and down",
+    5: "Two out of three points beyond 2 sigma on the same side",
+    6: "Four out of five points beyond 1 sigma on the same side",
+    7: "Fifteen points in a row within 1 sigma",
+    8: "Eight points in a row beyond 1 sigma on either side",
+}
+
+# Longest pattern any rule looks back over (rule 7), including the flagged point
+RULE_WINDOW = 15
+
+_GRID = np.linspace(-10, 10, 1001)
+_STEP = _GRID[1] - _GRID[0]
+
+
+# ==================== CONSTANTS ====================
+
+@lru_cache(maxsize=None)
+def d2(n: int) -> float:
+    """Expected range of n standard normal values"""
+    cdf = special.ndtr(_GRID)
+    return float((1 - cdf ** n - (1 - cdf) ** n).sum() * _STEP)
+
+
+@lru_cache(maxsize=None)
+def d3(n: int) -> float:
+    """Standard deviation of the range of n standard normal values"""
+    cdf = special.ndtr(_GRID)
+    lower, upper = cdf[:, None], cdf[None, :]
+    # E[R^2] = 2 * double integral over x < y of P(X(1) < x, X(n) > y)
+    inside = 1 - upper ** n - (1 - lower) ** n + np.clip(upper - lower, 0, None) ** n
+    # Trapezoid over the triangle: the diagonal carries half weight
+    second_moment = (2 * np.triu(inside, 1).sum() + np.trace(inside)) * _STEP ** 2
+    return float(np.sqrt(second_moment - d2(n) ** 2))
+
+
+@lru_cache(maxsize=None)
+def c4(n: int) -> float:
+    """Bias of the sample standard deviation of n normal values"""
+    return float(np.sqrt(2 / (n - 1)) * np.exp(special.gammaln(n / 2) - special.gammaln((n - 1) / 2)))
+
+
+@lru_cache(maxsize=None)
+def chart_constants(n: int) -> Dict[str, float]:
+    """A2/D3/D4 (range) and A3/B3/B4 (standard deviation) factors for subgroups of n"""
+    if n < 2:
+        raise ValueError("subgroup_size must be at least 2")
+    r_spread = 3 * d3(n) / d2(n)
+    s_spread = 3 * np.sqrt(1 - c4(n) ** 2) / c4(n)
+    return {
+        "d2": d2(n),
+        "d3": d3(n),
+        "c4": c4(n),
+        "A2": 3 / (d2(n) * np.sqrt(n)),
+        "D3": max(0.0, 1 - r_spread),
+        "D4": 1 + r_spread,
+        "A3": 3 / (c4(n) * np.sqrt(n)),
+        "B3": max(0.0, 1 - s_spread),
+        "B4": 1 + s_spread,
+    }
+
+
+# ==================== LIMITS ====================
+# Every function takes a compacted (rows x series) array whose valid values sit
+# above row `counts[j]` in column j, and returns per-series arrays.
+
+def valid_rows(depth: int, counts: np.ndarray) -> np.ndarray:
+    return np.arange(depth)[:, None] < counts
+
+
+def masked_mean(values: np.ndarray, valid: np.ndarray, counts: np.ndarray) -> np.ndarray:
+    with np.errstate(invalid="ignore", divide="ignore"):
+        return np.where(valid, values, 0.0).sum(axis=0) / counts
+
+
+def dispersion_chart(chart_type: str, points: np.ndarray, counts: np.ndarray,
+                     center: np.ndarray, lower: float, upper: float) -> Dict:
+    return {
+        "chart_type": chart_type,
+        "points": points,
+        "counts": counts,
+        "center": center,
+        "ucl": upper * center,
+        "lcl": lower * center,
+    }
+
+
+def imr_limits(values: np.ndarray, counts: np.ndarray) -> Dict:
+    """Individuals chart with its moving-range chart"""
+    k = chart_constants(2)
+    mr = np.abs(np.diff(values, axis=0))
+    mr_counts = np.maximum(counts - 1, 0)
+    center = masked_mean(values, valid_rows(values.shape[0], counts), counts)
+    mr_bar = masked_mean(mr, valid_rows(mr.shape[0], mr_counts), mr_counts)
+    sigma = mr_bar / k["d2"]
+    return {
+        "points": values,
+        "counts": counts,
+        "center": center,
+        "ucl": center + 3 * sigma,
+        "lcl": center - 3 * sigma,
+        "sigma": sigma,
+        "subgroup_size": 1,
+        "dispersion": dispersion_chart("mr", mr, mr_counts, mr_bar, k["D3"], k["D4"]),
+    }
+
+
+def subgroup_spread(subgroups: np.ndarray, chart_type: str) -> np.ndarray:
+    """Range (xbar-r) or standard deviation (xbar-s) of subgroups laid out along axis 1"""
+    if chart_type == "xbar-r":
+        return subgroups.max(axis=1) - subgroups.min(axis=1)
+    return subgroups.std(axis=1, ddof=1)
+
+
+def subgroup_limits(values: np.ndarray, counts: np.ndarray, n: int, chart_type: str) -> Dict:
+    """Xbar chart with its range (xbar-r) or standard deviation (xbar-s) chart"""
+    k = chart_constants(n)
+    n_subgroups = counts // n
+    depth = int(n_subgroups.max()) if n_subgroups.size else 0
+    subgroups = values[:depth * n].reshape(depth, n, values.shape[1])
+    valid = valid_rows(depth, n_subgroups)
+    xbar = subgroups.mean(axis=1)
+    center = masked_mean(xbar, valid, n_subgroups)
+
+    spread = subgroup_spread(subgroups, chart_type)
+    spread_bar = masked_mean(spread, valid, n_subgroups)
+    if chart_type == "xbar-r":
+        sigma = spread_bar / k["d2"]
+        dispersion = dispersion_chart("r", spread, n_subgroups, spread_bar, k["D3"], k["D4"])
+    else:
+        sigma = spread_bar / k["c4"]
+        dispersion = dispersion_chart("s", spread, n_subgroups, spread_bar, k["B3"], k["B4"])
+
+    width = 3 * sigma / np.sqrt(n)
+    return {
+        "points": xbar,
+        "counts": n_subgroups,
+        "center": center,
+        "ucl": center + width,
+        "lcl": center - width,
+        "sigma": sigma,
+        "subgroup_size": n,
+        "dispersion": dispersion,
+    }
+
+
+def attribute_points(chart_type: str, values: np.ndarray, sizes: np.ndarray, rate):
+    """
+    Plotted points with per-point center and limits for an attribute chart
+    `rate` is the defective fraction (p, np) or defects per unit (c, u).
+    """
+    with np.errstate(invalid="ignore", divide="ignore"):
+        unit_var = rate * (1 - rate) if chart_type in ("p", "np") else rate
+        if chart_type in ("p", "u"):
+            points = values / sizes
+            center, sigma = np.broadcast_to(rate, np.shape(values)), np.sqrt(unit_var / sizes)
+        else:
+            points = values
+            center, sigma = rate * sizes, np.sqrt(unit_var * sizes)
+    return points, center, center + 3 * sigma, np.maximum(center - 3 * sigma, 0.0)
+
+
+def attribute_limits(values: np.ndarray, counts: np.ndarray, chart_type: str,
+                     sizes: np.ndarray) -> Dict:
+    """
+    p, np, c and u charts from defective (p, np) or defect (c, u) counts
+    `sizes` holds the sample size of every point; limits vary per point when it does.
+    """
+    if chart_type == "c":
+        sizes = np.ones(values.shape)
+    valid = valid_rows(values.shape[0], counts)
+    total_size = np.where(valid, sizes, 0.0).sum(axis=0)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        rate = np.where(valid, values, 0.0).sum(axis=0) / total_size
+        mean_size = total_size / counts
+    points, point_center, point_ucl, point_lcl = attribute_points(chart_type, values, sizes, rate)
+    # Summary limits are those of a point with the average sample size
+    _, center, ucl, lcl = attribute_points(chart_type, rate, mean_size, rate)
+    return {
+        "points": points,
+        "counts": counts,
+        "center": center,
+        "ucl": ucl,
+        "lcl": lcl,
+        "sigma": (ucl - center) / 3,
+        "subgroup_size": mean_size,
+        "rate": rate,
+        "point_center": point_center,
+        "point_ucl": point_ucl,
+        "point_lcl": point_lcl,
+    }
+
+
+def chart_limits(values: np.ndarray, counts: np.ndarray, chart_type: str, n: int = 1,
+                 sizes: Optional[np.ndarray] = None) -> Dict:
+    """Limits for one chart type over every column of a compacted array"""
+    if chart_type == "imr":
+        return imr_limits(values, counts)
+    if chart_type in SUBGROUP_CHARTS:
+        return subgroup_limits(values, counts, n, chart_type)
+    if chart_type in ATTRIBUTE_CHARTS:
+        if sizes is None:
+            sizes = np.full(values.shape, float(n))
+        return attribute_limits(values, counts, chart_type, sizes)
+    raise ValueError("Unsupported chart type")
+
+
+# ==================== RULES ====================
+
+def window_count(cond: np.ndarray, k: int) -> np.ndarray:
+    """Number of true values in the k rows ending at each row (fewer at the top)"""
+    cum = np.cumsum(cond, axis=0, dtype=np.int64)
+    out = cum.copy()
+    out[k:] -= cum[:-k]
+    return out
+
+
+def run_of(cond: np.ndarray, k: int) -> np.ndarray:
+    """True where the k rows ending at each row are all true"""
+    return window_count(cond, k) >= k
+
+
+def shift_down(values: np.ndarray, by: int, fill=False) -> np.ndarray:
+    """Align row i with row i - by, padding the top"""
+    out = np.full(values.shape, fill, dtype=values.dtype)
+    if by < values.shape[0]:
+        out[by:] = values[:values.shape[0] - by]
+    return out
+
+
+def parse_rules(rules: Optional[Iterable] = None):
+    """Normalise a rule selection ("all", "1,2,5" or a list of numbers)"""
+    if rules is None or rules == "all":
+        return sorted(RULES)
+    if isinstance(rules, str):
+        rules = [part for part in rules.split(",") if part.strip()]
+    selected = sorted({int(rule) for rule in rules})
+    unknown = [rule for rule in selected if rule not in RULES]
+    if unknown:
+        raise ValueError(f"Unknown rule {unknown[0]}; rules are numbered 1-8")
+    return selected
+
+
+def nelson_rules(points: np.ndarray, center, ucl, lcl, counts: np.ndarray,
+                 rules: Optional[Iterable[int]] = None) -> Dict[int, np.ndarray]:
+    """
+    Boolean (rows x series) mask of the points that complete each rule's pattern
+    Zones are thirds of the distance from the center line to the upper limit;
+    center/ucl/lcl may be per-series or per-point.
+    """
+    rules = parse_rules(rules)
+    valid = valid_rows(points.shape[0], counts)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        z = (points - center) / ((ucl - center) / 3)
+    above, below = z > 0, z < 0
+    flags = {}
+    for rule in rules:
+        if rule == 1:
+            hit = (points > ucl) | (points < lcl)
+        elif rule == 2:
+            hit = run_of(above, 9) | run_of(below, 9)
+        elif rule in (3, 4):
+            diff = np.diff(points, axis=0, prepend=np.nan)
+            if rule == 3:
+                hit = run_of(diff > 0, 5) | run_of(diff < 0, 5)
+            else:
+                alternating = diff * shift_down(diff, 1, np.nan) < 0
+                hit = run_of(alternating, 12)
+        elif rule == 5:
+            hit = ((z > 2) & (window_count(z > 2, 3) >= 2)) | ((z < -2) & (window_count(z < -2, 3) >= 2))
+        elif rule == 6:
+            hit = ((z > 1) & (window_count(z > 1, 5) >= 4)) | ((z < -1) & (window_count(z < -1, 5) >= 4))
+        elif rule == 7:
+            hit = run_of(np.abs(z) < 1, 15)
+        else:
+            hit = run_of(np.abs(z) > 1, 8)
+        flags[rule] = hit & valid
+    return flags
@@ -0,0 +1,437 @@
+"""
+Dataset cache for the analysis API
+Parsed uploads are kept server-side, keyed by the SHA-256 of the file content,
+so repeated analyses over the same file parse it only once. The memory backend
+lives in one process; the shared backend writes each dataset once as per-column
+.npy files that every worker on the host memory-maps.
+"""
+
+from __future__ import annotations
+
+import fcntl
+import hashlib
+import json
+import os
+import shutil
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from datetime import datetime
+from typing import Dict, List, Optional
+
+import numpy as np
+
+from lazy import lazy_import
+
+pd = lazy_import("pandas")
+
+
+DEFAULT_BUDGET_MB = 1024
+DEFAULT_DIRECTORY = "analysis_datasets"
+MANIFEST = "manifest.json"
+OPEN_ENTRIES = 64  # memory-mapped datasets each worker keeps open
+
+
+def content_digest(content: bytes) -> str:
+    """SHA-256 hex digest of raw upload bytes"""
+    return hashlib.sha256(content).hexdigest()
+
+
+def file_digest(path: str) -> str:
+    """SHA-256 hex digest of a file, read in 1 MB blocks"""
+    hasher = hashlib.sha256()
+    with open(path, "rb") as f:
+        while block := f.read(1 << 20):
+            hasher.update(block)
+    return hasher.hexdigest()
+
+
+def to_columnar(df: pd.DataFrame) -> pd.DataFrame:
+    """Consolidate a parsed frame into one contiguous array per column"""
+    return pd.DataFrame({col: df[col].to_numpy(copy=True) for col in df.columns}, index=df.index)
+
+
+@dataclass
+class DatasetEntry:
+    dataset_id: str
+    filename: str
+    df: pd.DataFrame
+    nbytes: int
+    complete: bool = True  # False when only some columns were parsed
+    created: str = field(default_factory=lambda: datetime.now().isoformat())
+    hits: int = 0
+
+    def summary(self) -> Dict:
+        return {
+            "dataset_id": self.dataset_id,
+            "filename": self.filename,
+            "rows": len(self.df),
+            "columns": list(self.df.columns),
+            "bytes": self.nbytes,
+            "complete": self.complete,
+            "created": self.created,
+            "hits": self.hits,
+        }
+
+
+class DatasetStore:
+    """Content-hash keyed LRU cache of parsed DataFrames bounded by a memory budget"""
+
+    backend = "memory"
+
+    def __init__(self, budget_bytes: int):
+        self.budget_bytes = budget_bytes
+        self.total_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self._entries: "OrderedDict[str, DatasetEntry]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __contains__(self, dataset_id: str) -> bool:
+        with self._lock:
+            return dataset_id in self._entries
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def get(self, dataset_id: str) -> Optional[DatasetEntry]:
+        """Return a cached dataset and mark it most recently used"""
+        with self._lock:
+            entry = self._entries.get(dataset_id)
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(dataset_id)
+            entry.hits += 1
+            self.hits += 1
+            return entry
+
+    def put(self, dataset_id: str, filename: str, df: pd.DataFrame, complete: bool = True,
+            columnar: bool = False) -> DatasetEntry:
+        """
+        Cache a parsed dataset, evicting least recently used entries over budget
+        columnar frames (one array per column, e.g. memory-mapped Arrow) are kept as-is.
+        """
+        if not columnar:
+            df = to_columnar(df)
+        nbytes = int(df.memory_usage(deep=True).sum())
+        entry = DatasetEntry(dataset_id=dataset_id, filename=filename, df=df, nbytes=nbytes, complete=complete)
+        with self._lock:
+            old = self._entries.pop(dataset_id, None)
+            if old is not None:
+                self.total_bytes -= old.nbytes
+            self._entries[dataset_id] = entry
+            self.total_bytes += nbytes
+            self._evict()
+        return entry
+
+    def extend(self, dataset_id: str, filename: str, df: pd.DataFrame, columnar: bool = False) -> DatasetEntry:
+        """Add newly parsed columns to a partially cached dataset"""
+        with self._lock:
+            current = self._entries.get(dataset_id)
+        if current is not None and current.complete:
+            return current
+        if current is None:
+            return self.put(dataset_id, filename, df, complete=False, columnar=columnar)
+        if not columnar:
+            df = to_columnar(df)
+        # Cached columns are already contiguous (or mapped), so merge without copying them
+        merged = pd.DataFrame({**{col: current.df[col].to_numpy() for col in current.df.columns},
+                               **{col: df[col].to_numpy() for col in df.columns}}, index=current.df.index, copy=False)
+        return self.put(dataset_id, filename, merged, complete=False, columnar=True)
+
+    def delete(self, dataset_id: str) -> bool:
+        with self._lock:
+            entry = self._entries.pop(dataset_id, None)
+            if entry is None:
+                return False
+            self.total_bytes -= entry.nbytes
+            return True
+
+    def list(self) -> List[Dict]:
+        with self._lock:
+            return [entry.summary() for entry in self._entries.values()]
+
+    def stats(self) -> Dict:
+        return {
+            "backend": self.backend,
+            "datasets": len(self._entries),
+            "bytes": self.total_bytes,
+            "budget_bytes": self.budget_bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+        }
+
+    def _evict(self):
+        # Always keep the newest entry, even if it alone exceeds the budget
+        while self.total_bytes > self.budget_bytes and len(self._entries) > 1:
+            _, entry = self._entries.popitem(last=False)
+            self.total_bytes -= entry.nbytes
+
+
+# ==================== SHARED BACKEND ====================
+
+def write_column(directory: str, position: int, series: pd.Series) -> Dict:
+    """
+    Save one column as .npy and return its manifest entry
+    Numeric, boolean and datetime columns are saved as-is; anything else (text,
+    mixed) as integer category codes with the categories in the manifest.
+    """
+    values = series.to_numpy()
+    name = f"{position}.npy"
+    if values.dtype.kind in "biufcmM":
+        np.save(os.path.join(directory, name), np.ascontiguousarray(values))
+        return {"name": series.name, "file": name, "nbytes": int(values.nbytes)}
+    codes, categories = pd.factorize(series)
+    codes = codes.astype(np.int32)
+    np.save(os.path.join(directory, name), codes)
+    categories = categories.tolist()
+    return {"name": series.name, "file": name, "categories": categories,
+            "nbytes": int(codes.nbytes + len(json.dumps(categories, default=str)))}
+
+
+def read_column(directory: str, column: Dict):
+    values = np.load(os.path.join(directory, column["file"]), mmap_mode="r")
+    if "categories" in column:
+        return pd.Categorical.from_codes(values, categories=pd.Index(column["categories"]))
+    return values
+
+
+def write_manifest(directory: str, manifest: Dict):
+    """Replace the manifest atomically, so readers see the old or the new one"""
+    temporary = os.path.join(directory, f".{MANIFEST}.{uuid.uuid4().hex}")
+    with open(temporary, "w") as f:
+        json.dump(manifest, f, default=str)
+    os.replace(temporary, os.path.join(directory, MANIFEST))
+
+
+class SharedDatasetStore(DatasetStore):
+    """
+    Datasets as memory-mapped column files in a directory shared by every worker on the host
+    Each dataset is written once to <directory>/<dataset_id>/ and renamed into place, so
+    workers never see a half-written dataset. Readers map the column files, so the page
+    cache holds one copy however many workers use it. Text columns are stored as
+    category codes. The budget bounds bytes on disk, evicting the least recently used.
+    """
+
+    backend = "shared"
+
+    def __init__(self, directory: str, budget_bytes: int):
+        super().__init__(budget_bytes)
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+        # dataset_id -> (manifest mtime, entry): open mappings, reopened when the manifest changes
+        self._open: "OrderedDict[str, tuple]" = OrderedDict()
+
+    def _path(self, dataset_id: str, *parts: str) -> str:
+        return os.path.join(self.directory, dataset_id, *parts)
+
+    def _ids(self) -> List[str]:
+        return [name for name in os.listdir(self.directory)
+                if not name.startswith(".") and os.path.exists(self._path(name, MANIFEST))]
+
+    def _manifest(self, dataset_id: str) -> Optional[Dict]:
+        try:
+            with open(self._path(dataset_id, MANIFEST)) as f:
+                return json.load(f)
+        except (FileNotFoundError, NotADirectoryError):
+            return None
+
+    def __contains__(self, dataset_id: str) -> bool:
+        return os.path.exists(self._path(dataset_id, MANIFEST))
+
+    def __len__(self) -> int:
+        return len(self._ids())
+
+    def get(self, dataset_id: str) -> Optional[DatasetEntry]:
+        """Map a stored dataset (reusing this worker's open mapping) and mark it most recently used"""
+        try:
+            version = os.stat(self._path(dataset_id, MANIFEST)).st_mtime_ns
+            os.utime(self._path(dataset_id))
+        except (FileNotFoundError, NotADirectoryError):
+            with self._lock:
+                self._open.pop(dataset_id, None)
+                self.misses += 1
+            return None
+        with self._lock:
+            cached = self._open.get(dataset_id)
+        entry = cached[1] if cached is not None and cached[0] == version else self._load(dataset_id, version)
+        if entry is None:
+            with self._lock:
+                self.misses += 1
+            return None
+        with self._lock:
+            entry.hits += 1
+            self.hits += 1
+        return entry
+
+    def _load(self, dataset_id: str, version: int) -> Optional[DatasetEntry]:
+        manifest = self._manifest(dataset_id)
+        if manifest is None:
+            return None
+        try:
+            columns = {column["name"]: read_column(self._path(dataset_id), column) for column in manifest["columns"]}
+        except FileNotFoundError:  # deleted or evicted by another worker meanwhile
+            return None
+        df = pd.DataFrame(columns, index=pd.RangeIndex(manifest["rows"]), copy=False)
+        entry = DatasetEntry(dataset_id=dataset_id, filename=manifest["filename"], df=df,
+                             nbytes=manifest["nbytes"], complete=manifest["complete"], created=manifest["created"])
+        with self._lock:
+            self._open[dataset_id] = (version, entry)
+            self._open.move_to_end(dataset_id)
+            while len(self._open) > OPEN_ENTRIES:
+                self._open.popitem(last=False)
+        return entry
+
+    def put(self, dataset_id: str, filename: str, df: pd.DataFrame, complete: bool = True,
+            columnar: bool = False) -> DatasetEntry:
+        """Write a parsed dataset once; a complete copy already stored by any worker is kept"""
+        existing = self._manifest(dataset_id)
+        if existing is None or not existing["complete"]:
+            staging = os.path.join(self.directory, f".{dataset_id}.{uuid.uuid4().hex}")
+            os.makedirs(staging)
+            columns = [write_column(staging, i, df[col]) for i, col in enumerate(df.columns)]
+            write_manifest(staging, {
+                "dataset_id": dataset_id,
+                "filename": filename,
+                "rows": len(df),
+                "columns": columns,
+                "nbytes": sum(column["nbytes"] for column in columns),
+                "complete": complete,
+                "created": datetime.now().isoformat(),
+            })
+            self._install(dataset_id, staging)
+            self._evict(keep=dataset_id)
+        return self.get(dataset_id)
+
+    def _install(self, dataset_id: str, staging: str):
+        """Rename a staged dataset into place, replacing a partial one"""
+        target = self._path(dataset_id)
+        try:
+            os.rename(staging, target)
+            return
+        except OSError:
+            pass
+        current = self._manifest(dataset_id)
+        if current is not None and current["complete"]:
+            shutil.rmtree(staging, ignore_errors=True)  # another worker stored it first
+            return
+        retired = os.path.join(self.directory, f".{dataset_id}.{uuid.uuid4().hex}.old")
+        try:
+            os.rename(target, retired)
+        except OSError:
+            pass
+        try:
+            os.rename(staging, target)
+        except OSError:
+            shutil.rmtree(staging, ignore_errors=True)
+        shutil.rmtree(retired, ignore_errors=True)
+
+    def extend(self, dataset_id: str, filename: str, df: pd.DataFrame, columnar: bool = False) -> DatasetEntry:
+        """Add newly parsed columns to a partially stored dataset, under a per-dataset file lock"""
+        if dataset_id not in self:
+            return self.put(dataset_id, filename, df, complete=False)
+        try:
+            lock = open(self._path(dataset_id, ".lock"), "a")
+        except FileNotFoundError:  # evicted meanwhile
+            return self.put(dataset_id, filename, df, complete=False)
+        with lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            manifest = self._manifest(dataset_id)
+            if manifest is None:
+                return self.put(dataset_id, filename, df, complete=False)
+            if not manifest["complete"]:
+                present = {column["name"] for column in manifest["columns"]}
+                position = len(manifest["columns"])
+                for col in df.columns:
+                    if col not in present:
+                        manifest["columns"].append(write_column(self._path(dataset_id), position, df[col]))
+                        position += 1
+                manifest["nbytes"] = sum(column["nbytes"] for column in manifest["columns"])
+                write_manifest(self._path(dataset_id), manifest)
+        self._evict(keep=dataset_id)
+        return self.get(dataset_id)
+
+    def delete(self, dataset_id: str) -> bool:
+        if dataset_id not in self:
+            return False
+        retired = os.path.join(self.directory, f".{dataset_id}.{uuid.uuid4().hex}.old")
+        try:
+            os.rename(self._path(dataset_id), retired)
+        except OSError:
+            return False
+        # Workers that still map the files keep reading them until they drop the mapping
+        shutil.rmtree(retired, ignore_errors=True)
+        with self._lock:
+            self._open.pop(dataset_id, None)
+        return True
+
+    def list(self) -> List[Dict]:
+        summaries = []
+        for dataset_id in self._ids():
+            manifest = self._manifest(dataset_id)
+            if manifest is not None:
+                summaries.append({
+                    "dataset_id": dataset_id,
+                    "filename": manifest["filename"],
+                    "rows": manifest["rows"],
+                    "columns": [column["name"] for column in manifest["columns"]],
+                    "bytes": manifest["nbytes"],
+                    "complete": manifest["complete"],
+                    "created": manifest["created"],
+                })
+        return summaries
+
+    def usage(self) -> List[tuple]:
+        """(last used, bytes, dataset_id) of every stored dataset"""
+        usage = []
+        for dataset_id in self._ids():
+            manifest = self._manifest(dataset_id)
+            try:
+                used = os.stat(self._path(dataset_id)).st_mtime
+            except FileNotFoundError:
+                continue
+            if manifest is not None:
+                usage.append((used, manifest["nbytes"], dataset_id))
+        return usage
+
+    def stats(self) -> Dict:
+        usage = self.usage()
+        return {
+            "backend": self.backend,
+            "directory": self.directory,
+            "datasets": len(usage),
+            "bytes": sum(nbytes for _, nbytes, _ in usage),
+            "budget_bytes": self.budget_bytes,
+            "open": len(self._open),
+            "hits": self.hits,
+            "misses": self.misses,
+        }
+
+    def _evict(self, keep: Optional[str] = None):
+        usage = sorted(self.usage())
+        total = sum(nbytes for _, nbytes, _ in usage)
+        for _, nbytes, dataset_id in usage:
+            if total <= self.budget_bytes:
+                break
+            if dataset_id != keep and self.delete(dataset_id):
+                total -= nbytes
+        # Staging directories left by a worker that died mid-write
+        cutoff = time.time() - 3600
+        for name in os.listdir(self.directory):
+            path = os.path.join(self.directory, name)
+            if name.startswith(".") and os.path.isdir(path) and os.stat(path).st_mtime < cutoff:
+                shutil.rmtree(path, ignore_errors=True)
+
+
+def create_dataset_store() -> DatasetStore:
+    """Build the dataset cache from ANALYSIS_DATASET_STORE, ANALYSIS_DATASET_DIR and ANALYSIS_DATASET_CACHE_MB"""
+    backend = os.environ.get("ANALYSIS_DATASET_STORE", "memory")
+    budget = int(float(os.environ.get("ANALYSIS_DATASET_CACHE_MB", DEFAULT_BUDGET_MB)) * 1024 * 1024)
+    if backend == "memory":
+        return DatasetStore(budget)
+    if backend == "shared":
+        return SharedDatasetStore(os.environ.get("ANALYSIS_DATASET_DIR", DEFAULT_DIRECTORY), budget)
+    raise ValueError(f"Unknown ANALYSIS_DATASET_STORE '{backend}'; use 'memory' or 'shared'")
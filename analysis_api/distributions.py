@@ -0,0 +1,318 @@
+"""
+Distribution fitting for non-normal capability
+Each candidate is fitted by maximum likelihood and scored by Anderson-Darling
+and AIC on the full data. Johnson fits search only loc and scale, the shapes
+having closed forms, and iterative fits run on at most FIT_SAMPLE evenly spaced
+order statistics, which keeps their cost flat in the row count. Fits are cached
+by column content, so re-running with other spec limits costs only a few
+quantile evaluations.
+"""
+
+import hashlib
+import os
+import threading
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from lazy import lazy_import
+
+optimize = lazy_import("scipy.optimize")
+special = lazy_import("scipy.special")
+stats = lazy_import("scipy.stats")
+
+
+CANDIDATES = ("normal", "lognormal", "weibull", "gamma", "johnson-su", "johnson-sb", "box-cox")
+CRITERIA = ("ad", "aic")
+POSITIVE_ONLY = ("lognormal", "weibull", "gamma", "box-cox")
+FIT_SAMPLE = 5_000
+DEFAULT_CACHE_SIZE = 4096
+SCIPY_DISTRIBUTIONS = {
+    "normal": "norm",
+    "lognormal": "lognorm",
+    "weibull": "weibull_min",
+    "gamma": "gamma",
+    "johnson-su": "johnsonsu",
+    "johnson-sb": "johnsonsb",
+}
+
+_fit_pool: Optional[ProcessPoolExecutor] = None
+
+
+def scipy_distribution(distribution: str):
+    return getattr(stats, SCIPY_DISTRIBUTIONS[distribution])
+
+
+@dataclass
+class DistributionFit:
+    distribution: str
+    params: Tuple[float, ...]  # scipy shape(s), loc, scale; (lambda, mean, std) for box-cox
+    log_likelihood: float
+    aic: float
+    ad: float
+
+    def cdf(self, x):
+        if self.distribution == "box-cox":
+            lmbda, mean, std = self.params
+            with np.errstate(invalid="ignore", divide="ignore"):
+                y = special.boxcox(np.maximum(x, 0.0), lmbda)
+            return np.where(np.asarray(x) > 0, stats.norm.cdf(y, mean, std), 0.0)
+        return scipy_distribution(self.distribution).cdf(x, *self.params)
+
+    def sf(self, x):
+        if self.distribution == "box-cox":
+            return 1 - self.cdf(x)
+        return scipy_distribution(self.distribution).sf(x, *self.params)
+
+    def ppf(self, q):
+        if self.distribution == "box-cox":
+            lmbda, mean, std = self.params
+            return special.inv_boxcox(stats.norm.ppf(q, mean, std), lmbda)
+        return scipy_distribution(self.distribution).ppf(q, *self.params)
+
+    def summary(self) -> Dict:
+        names = ("lambda", "mean", "std") if self.distribution == "box-cox" else \
+            parameter_names(self.distribution)
+        return {
+            "distribution": self.distribution,
+            "parameters": {name: round(float(value), 6) for name, value in zip(names, self.params)},
+            "log_likelihood": round(self.log_likelihood, 4),
+            "aic": round(self.aic, 4),
+            "ad": round(self.ad, 4),
+        }
+
+
+def parameter_names(distribution: str) -> List[str]:
+    shapes = scipy_distribution(distribution).shapes
+    return ([s.strip() for s in shapes.split(",")] if shapes else []) + ["loc", "scale"]
+
+
+def parse_distribution(distribution: str) -> List[str]:
+    """Candidates from "auto" (all of them), one name or a comma-separated list"""
+    if distribution.strip().lower() == "auto":
+        return list(CANDIDATES)
+    names = [d.strip().lower() for d in distribution.split(",") if d.strip()]
+    for name in names:
+        if name not in CANDIDATES:
+            raise ValueError(f"Unknown distribution '{name}'; use auto or {', '.join(CANDIDATES)}")
+    if not names:
+        raise ValueError("No distribution given")
+    return list(dict.fromkeys(names))
+
+
+def fit_sample(data: np.ndarray) -> np.ndarray:
+    """Evenly spaced order statistics of sorted data, keeping the minimum and maximum"""
+    if data.size <= FIT_SAMPLE:
+        return data
+    return data[np.linspace(0, data.size - 1, FIT_SAMPLE).astype(int)]
+
+
+def anderson_darling(cdf: np.ndarray) -> float:
+    """A^2 statistic from the fitted CDF at the sorted data"""
+    n = cdf.size
+    cdf = np.clip(cdf, 1e-300, 1 - 1e-16)
+    weights = 2 * np.arange(1, n + 1) - 1
+    return float(-n - (weights * (np.log(cdf) + np.log1p(-cdf[::-1]))).sum() / n)
+
+
+def fit_parameters(data: np.ndarray, distribution: str) -> Tuple[float, ...]:
+    """Maximum likelihood parameters of one candidate"""
+    if distribution == "normal":
+        return float(data.mean()), float(data.std())
+    if distribution == "lognormal":
+        logs = np.log(data)
+        return float(logs.std()), 0.0, float(np.exp(logs.mean()))
+
+    sample = fit_sample(data)
+    if distribution == "box-cox":
+        lmbda = float(stats.boxcox_normmax(sample, method="mle"))
+        transformed = special.boxcox(data, lmbda)
+        return lmbda, float(transformed.mean()), float(transformed.std())
+    if distribution in ("weibull", "gamma"):
+        return tuple(float(p) for p in scipy_distribution(distribution).fit(sample, floc=0))
+    return fit_johnson(sample, bounded=distribution == "johnson-sb")
+
+
+def johnson_profile(sample: np.ndarray, loc: float, scale: float, bounded: bool) -> Tuple[float, float, float]:
+    """
+    Shapes (a, b) and log-likelihood of a Johnson fit with loc and scale held fixed
+    z = a + b * g((x - loc) / scale) is standard normal, so a and b follow from the
+    mean and std of g, leaving only loc and scale to search.
+    """
+    y = (sample - loc) / scale
+    if bounded:
+        w = np.log(y) - np.log1p(-y)
+        log_jacobian = np.log(y * (1 - y)).sum()
+    else:
+        w = np.arcsinh(y)
+        log_jacobian = 0.5 * np.log1p(y * y).sum()
+    b = 1 / w.std()
+    n = sample.size
+    log_likelihood = n * np.log(b) - n * np.log(scale) - log_jacobian - 0.5 * n * (1 + np.log(2 * np.pi))
+    return float(-w.mean() * b), float(b), float(log_likelihood)
+
+
+def fit_johnson(sample: np.ndarray, bounded: bool) -> Tuple[float, ...]:
+    """Johnson SU or SB (a, b, loc, scale) by maximizing the two-parameter profile likelihood"""
+    low, high = float(sample.min()), float(sample.max())
+    spread = float(sample.std()) or 1.0
+
+    if bounded:
+        # Bounds sit outside the data: loc = min - e^u, loc + scale = max + e^v
+        def unpack(theta):
+            loc = low - np.exp(theta[0])
+            return loc, high + np.exp(theta[1]) - loc
+        start = np.log([0.1 * spread, 0.1 * spread])
+    else:
+        def unpack(theta):
+            return theta[0], np.exp(theta[1])
+        start = np.array([float(np.median(sample)), np.log(spread)])
+
+    def objective(theta):
+        loc, scale = unpack(theta)
+        value = johnson_profile(sample, loc, scale, bounded)[2]
+        return -value if np.isfinite(value) else np.inf
+
+    theta = optimize.minimize(objective, start, method="Nelder-Mead",
+                              options={"xatol": 1e-6, "fatol": 1e-8, "maxiter": 2000}).x
+    loc, scale = unpack(theta)
+    a, b, _ = johnson_profile(sample, loc, scale, bounded)
+    return a, b, float(loc), float(scale)
+
+
+def fit_candidate(data: np.ndarray, distribution: str) -> Dict:
+    """Fit one candidate to sorted data and score it on all of it; failures are reported, not raised"""
+    if distribution in POSITIVE_ONLY and not (data > 0).all():
+        return {"distribution": distribution, "error": "Requires strictly positive data"}
+    try:
+        with np.errstate(all="ignore"):
+            params = fit_parameters(data, distribution)
+            if distribution == "box-cox":
+                lmbda, mean, std = params
+                log_likelihood = float(stats.norm.logpdf(special.boxcox(data, lmbda), mean, std).sum()
+                                       + (lmbda - 1) * np.log(data).sum())
+            else:
+                log_likelihood = float(scipy_distribution(distribution).logpdf(data, *params).sum())
+            # Location is fixed at zero for the positive two-parameter families
+            k = len(params) - (distribution in ("lognormal", "weibull", "gamma"))
+            fit = DistributionFit(distribution, params, log_likelihood, 2 * k - 2 * log_likelihood, 0.0)
+            fit.ad = anderson_darling(fit.cdf(data))
+    except Exception as exc:  # scipy raises a variety of errors on degenerate data
+        return {"distribution": distribution, "error": str(exc)}
+    if not (np.isfinite(fit.log_likelihood) and np.isfinite(fit.ad)):
+        return {"distribution": distribution, "error": "Fit does not cover the data"}
+    return {"distribution": distribution, "fit": fit}
+
+
+def content_key(data: np.ndarray) -> str:
+    return hashlib.blake2b(np.ascontiguousarray(data, dtype=float).tobytes(), digest_size=16).hexdigest()
+
+
+class FitCache:
+    """LRU cache of fits keyed by (column content digest, distribution)"""
+
+    def __init__(self, max_entries: int = DEFAULT_CACHE_SIZE):
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._entries: "OrderedDict[Tuple[str, str], Dict]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: Tuple[str, str]) -> Optional[Dict]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self._entries.move_to_end(key)
+            return entry
+
+    def put(self, key: Tuple[str, str], entry: Dict):
+        with self._lock:
+            self._entries[key] = entry
+            self._entries.move_to_end(key)
+            while self.max_entries and len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def stats(self) -> Dict:
+        return {"entries": len(self._entries), "max_entries": self.max_entries,
+                "hits": self.hits, "misses": self.misses}
+
+
+fit_cache = FitCache(int(os.environ.get("ANALYSIS_FIT_CACHE_SIZE", DEFAULT_CACHE_SIZE)))
+
+
+def fit_workers() -> int:
+    """Processes for distribution fitting from ANALYSIS_FIT_WORKERS (0 or 1 = in-process)"""
+    return int(os.environ.get("ANALYSIS_FIT_WORKERS", 0))
+
+
+def fit_pool() -> ProcessPoolExecutor:
+    global _fit_pool
+    if _fit_pool is None:
+        _fit_pool = ProcessPoolExecutor(max_workers=fit_workers())
+    return _fit_pool
+
+
+def fit_columns(columns: Dict[str, np.ndarray], candidates: Sequence[str]) -> Dict[str, List[Dict]]:
+    """
+    Fit every candidate to every column, reusing cached fits
+    Uncached (column, candidate) pairs are spread over the fit pool when one is configured.
+    """
+    columns = {name: np.sort(data) for name, data in columns.items()}
+    keys = {name: content_key(data) for name, data in columns.items()}
+    fits: Dict[str, Dict[str, Dict]] = {name: {} for name in columns}
+    todo = []
+    for name in columns:
+        for distribution in candidates:
+            entry = fit_cache.get((keys[name], distribution))
+            if entry is None:
+                todo.append((name, distribution))
+            else:
+                fits[name][distribution] = entry
+
+    if fit_workers() > 1 and len(todo) > 1:
+        chunk = max(1, len(todo) // (4 * fit_workers()))
+        done = fit_pool().map(fit_candidate, [columns[name] for name, _ in todo], [d for _, d in todo],
+                              chunksize=chunk)
+    else:
+        done = (fit_candidate(columns[name], distribution) for name, distribution in todo)
+    for (name, distribution), entry in zip(todo, done):
+        fit_cache.put((keys[name], distribution), entry)
+        fits[name][distribution] = entry
+    return {name: [fits[name][d] for d in candidates] for name in columns}
+
+
+def best_fit(entries: List[Dict], criterion: str = "ad") -> Optional[DistributionFit]:
+    """Candidate with the lowest Anderson-Darling statistic or AIC"""
+    fitted = [entry["fit"] for entry in entries if "fit" in entry]
+    if not fitted:
+        return None
+    return min(fitted, key=lambda fit: getattr(fit, criterion))
+
+
+def percentile_indices(fit: DistributionFit, usl: float, lsl: float) -> Dict:
+    """
+    Percentile-method Pp, Ppk, Ppu, Ppl and expected PPM from a fitted distribution
+    The 0.135% and 99.865% quantiles take the place of mean -+ 3 sigma.
+    """
+    # Normal-equivalent tails of the percentile method (+-3 sigma)
+    tail = float(stats.norm.cdf(-3))
+    low, median, high = fit.ppf(np.array([tail, 0.5, 1 - tail]))
+    ppu = (usl - median) / (high - median)
+    ppl = (median - lsl) / (median - low)
+    return {
+        "median": float(median),
+        "p_low": float(low),
+        "p_high": float(high),
+        "pp": float((usl - lsl) / (high - low)),
+        "ppu": float(ppu),
+        "ppl": float(ppl),
+        "ppk": float(min(ppu, ppl)),
+        "ppm_above_usl": float(fit.sf(usl)) * 1_000_000,
+        "ppm_below_lsl": float(fit.cdf(lsl)) * 1_000_000,
+    }
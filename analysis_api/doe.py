@@ -0,0 +1,362 @@
+"""
+Designed experiment analysis
+Factors are coded to -1/+1 (0 at center points). Complete, balanced two-level
+factorials get every effect at once from a fast Walsh-Hadamard (Yates) transform
+of the cell means; fractional, unbalanced and response-surface designs are fitted
+by least squares, with exactly aliased terms detected and folded together first.
+"""
+
+from __future__ import annotations
+
+from itertools import combinations
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+from fastapi import HTTPException
+
+from lazy import lazy_import
+from regression import INTERCEPT, solve
+from streaming_stats import RunningComoments
+
+pd = lazy_import("pandas")
+stats = lazy_import("scipy.stats")
+
+
+MODELS = ("factorial", "quadratic")
+
+# Largest design whose defining relation is searched (a transform of length 2^k)
+MAX_ALIAS_FACTORS = 20
+
+
+# ==================== CODING ====================
+
+def code_factors(df: pd.DataFrame, factors: List[str]) -> Tuple[np.ndarray, Dict[str, Dict]]:
+    """Coded (rows x factors) matrix and the natural low/high of each factor"""
+    coded = np.empty((len(df), len(factors)))
+    levels = {}
+    for i, name in enumerate(factors):
+        values = df[name]
+        if pd.api.types.is_numeric_dtype(values):
+            low, high = float(values.min()), float(values.max())
+            if not high > low:
+                raise HTTPException(status_code=400, detail=f"Factor '{name}' has a single level")
+            coded[:, i] = (values.to_numpy(dtype=float) - (low + high) / 2) / ((high - low) / 2)
+        else:
+            distinct = sorted(values.unique().tolist())
+            if len(distinct) != 2:
+                raise HTTPException(
+                    status_code=400,
+                    detail=f"Text factor '{name}' must have exactly 2 levels, found {len(distinct)}"
+                )
+            low, high = distinct
+            coded[:, i] = np.where(values.to_numpy() == high, 1.0, -1.0)
+        levels[name] = {"low": low, "high": high}
+    return coded, levels
+
+
+def term_name(mask: int, factors: List[str]) -> str:
+    return "*".join(factors[i] for i in range(len(factors)) if mask >> i & 1)
+
+
+def factorial_masks(k: int, max_order: int) -> List[int]:
+    """Factor subsets as bitmasks, main effects first, then by interaction order"""
+    return [sum(1 << i for i in subset) for order in range(1, max_order + 1)
+            for subset in combinations(range(k), order)]
+
+
+def interaction_columns(coded: np.ndarray, masks: List[int]) -> np.ndarray:
+    """Product of the coded factors in each mask, built from lower-order products"""
+    products = {0: np.ones(coded.shape[0])}
+    
+    def column(mask: int) -> np.ndarray:
+        if mask not in products:
+            low_bit = mask & -mask
+            products[mask] = column(mask ^ low_bit) * coded[:, low_bit.bit_length() - 1]
+        return products[mask]
+    
+    if not masks:
+        return np.empty((coded.shape[0], 0))
+    return np.column_stack([column(mask) for mask in masks])
+
+
+# ==================== FAST TRANSFORM ====================
+
+def walsh_hadamard(values: np.ndarray) -> np.ndarray:
+    """
+    Unnormalised Walsh-Hadamard transform of a length 2^k vector
+    Entry m of the result is sum over cells c of values[c] * prod_{i in m} (+1 if bit i of c else -1).
+    """
+    out = np.asarray(values, dtype=float).copy()
+    half = 1
+    while half < out.size:
+        pairs = out.reshape(-1, 2, half)
+        out = np.stack([pairs[:, 0] + pairs[:, 1], pairs[:, 1] - pairs[:, 0]], axis=1).reshape(-1)
+        half *= 2
+    return out
+
+
+def balanced_full_factorial(coded: np.ndarray) -> Optional[np.ndarray]:
+    """Cell index of every run when the design is a complete 2^k with equal replicates, else None"""
+    if not np.isin(coded, (-1.0, 1.0)).all():
+        return None
+    k = coded.shape[1]
+    cells = (coded > 0).astype(np.int64) @ (1 << np.arange(k, dtype=np.int64))
+    counts = np.bincount(cells, minlength=1 << k)
+    if counts.min() == 0 or counts.min() != counts.max():
+        return None
+    return cells
+
+
+def yates_fit(y: np.ndarray, cells: np.ndarray, k: int, masks: List[int],
+              names: List[str]) -> Dict:
+    """All 2^k coefficients from cell means; unreported terms pool into the error"""
+    n = y.size
+    cell_means = np.bincount(cells, weights=y, minlength=1 << k) / (n >> k)
+    coef = walsh_hadamard(cell_means) / (1 << k)
+    selected = coef[masks]
+    tss = float(((y - y.mean()) ** 2).sum())
+    model_ss = n * selected ** 2
+    df_resid = n - 1 - len(masks)
+    rss = max(tss - float(model_ss.sum()), 0.0)
+
+    with np.errstate(invalid="ignore", divide="ignore"):
+        sigma2 = rss / df_resid if df_resid > 0 else np.nan
+        se = np.sqrt(sigma2 / n)
+        t_values = np.concatenate([[coef[0]], selected]) / se
+        p_values = 2 * stats.t.sf(np.abs(t_values), df_resid) if df_resid > 0 else np.full(t_values.shape, np.nan)
+        r_squared = 1 - rss / tss
+        f_statistic = (model_ss.sum() / len(masks)) / sigma2
+    values = np.concatenate([[coef[0]], selected])
+    return {
+        "r_squared": float(r_squared),
+        "adj_r_squared": float(1 - (1 - r_squared) * (n - 1) / df_resid) if df_resid > 0 else np.nan,
+        "f_statistic": float(f_statistic),
+        "f_pvalue": float(stats.f.sf(f_statistic, len(masks), df_resid)) if df_resid > 0 else np.nan,
+        "coefficients": {
+            name: {
+                "coefficient": float(values[i]),
+                "std_error": float(se),
+                "t_value": float(t_values[i]),
+                "p_value": float(p_values[i]),
+            }
+            for i, name in enumerate([INTERCEPT] + names)
+        },
+        "residual_std_error": float(np.sqrt(sigma2)),
+        "observations": n,
+        "df_resid": df_resid,
+        "rss": rss,
+    }
+
+
+# ==================== ALIASING ====================
+
+def alias_groups(columns: np.ndarray, names: List[str]) -> Tuple[List[int], Dict[str, List[str]]]:
+    """
+    Indices of the columns to estimate and the aliases folded into each
+    Columns equal up to sign are aliased; the first (lowest-order) one is kept.
+    Column 0 must be the intercept.
+    """
+    signs = np.sign(columns[np.argmax(columns != 0, axis=0), np.arange(columns.shape[1])])
+    signs[signs == 0] = 1
+    normalised = columns * signs
+    keep, aliases, seen = [], {}, {}
+    for j in range(columns.shape[1]):
+        key = normalised[:, j].tobytes()
+        if key in seen:
+            aliases.setdefault(names[seen[key]], []).append(names[j])
+        else:
+            seen[key] = j
+            keep.append(j)
+    return keep, aliases
+
+
+def defining_relation(coded: np.ndarray, factors: List[str]) -> List[str]:
+    """
+    Words of a regular two-level fraction: interactions constant over the corner runs
+    The Walsh-Hadamard transform of the run indicator is +/- the run count exactly there.
+    """
+    k = len(factors)
+    corners = coded[np.isin(coded, (-1.0, 1.0)).all(axis=1)]
+    if k > MAX_ALIAS_FACTORS or corners.shape[0] == 0:
+        return []
+    cells = np.unique((corners > 0).astype(np.int64) @ (1 << np.arange(k, dtype=np.int64)))
+    if cells.size == 1 << k:
+        return []
+    present = np.zeros(1 << k)
+    present[cells] = 1
+    transform = walsh_hadamard(present)
+    words = np.nonzero(np.abs(transform[1:]) == cells.size)[0] + 1
+    return [term_name(int(mask), factors) for mask in sorted(words, key=lambda m: (bin(m).count("1"), m))]
+
+
+# ==================== ANALYSIS ====================
+
+def lenth_pse(effects: np.ndarray) -> Optional[float]:
+    """Lenth's pseudo standard error for an unreplicated, saturated design"""
+    absolute = np.abs(effects[np.isfinite(effects)])
+    if absolute.size == 0:
+        return None
+    s0 = 1.5 * np.median(absolute)
+    trimmed = absolute[absolute < 2.5 * s0]
+    return float(1.5 * np.median(trimmed)) if trimmed.size else None
+
+
+def pure_error(coded: np.ndarray, y: np.ndarray) -> Tuple[float, int]:
+    """Sum of squares and degrees of freedom between replicates of identical settings"""
+    _, runs = np.unique(coded, axis=0, return_inverse=True)
+    runs = runs.reshape(-1)
+    counts = np.bincount(runs)
+    means = np.bincount(runs, weights=y) / counts
+    return float(((y - means[runs]) ** 2).sum()), int(y.size - counts.size)
+
+
+def anova_table(fit: Dict, names: List[str], y: np.ndarray, pure: Tuple[float, int]) -> List[Dict]:
+    """One-df rows per term (adjusted SS = t^2 * MSE) plus error, lack of fit and total"""
+    df_resid, rss, n = fit["df_resid"], fit["rss"], y.size
+    mse = rss / df_resid if df_resid > 0 else np.nan
+    rows = []
+    for name in names:
+        t_value = fit["coefficients"][name]["t_value"]
+        ss = t_value ** 2 * mse if df_resid > 0 else n * fit["coefficients"][name]["coefficient"] ** 2
+        rows.append(anova_row(name, 1, ss, mse, df_resid))
+    rows.append(anova_row("Error", df_resid, rss))
+    pure_ss, pure_df = pure
+    if 0 < pure_df < df_resid:
+        lack_df = df_resid - pure_df
+        rows.append(anova_row("Lack of fit", lack_df, rss - pure_ss, pure_ss / pure_df, pure_df))
+        rows.append(anova_row("Pure error", pure_df, pure_ss))
+    rows.append(anova_row("Total", n - 1, float(((y - y.mean()) ** 2).sum())))
+    return rows
+
+
+def anova_row(source: str, df: int, ss: float, error_ms: float = None, error_df: int = None) -> Dict:
+    ms = ss / df if df > 0 else None
+    f_value = ms / error_ms if ms is not None and error_ms and np.isfinite(error_ms) else None
+    return {
+        "source": source,
+        "df": int(df),
+        "ss": float(ss),
+        "ms": ms,
+        "f_value": f_value,
+        "p_value": float(stats.f.sf(f_value, df, error_df)) if f_value is not None else None,
+    }
+
+
+def stationary_point(coef: Dict[str, float], factors: List[str], levels: Dict[str, Dict]) -> Optional[Dict]:
+    """Stationary point of a fitted quadratic surface in coded and natural units"""
+    k = len(factors)
+    b = np.array([coef.get(name, 0.0) for name in factors])
+    B = np.zeros((k, k))
+    for i, name in enumerate(factors):
+        B[i, i] = coef.get(f"{name}^2", 0.0)
+        for j in range(i + 1, k):
+            B[i, j] = B[j, i] = coef.get(f"{name}*{factors[j]}", 0.0) / 2
+    try:
+        x = np.linalg.solve(B, -b / 2)
+    except np.linalg.LinAlgError:
+        return None
+    eigenvalues = np.linalg.eigvalsh(B)
+    kind = "maximum" if (eigenvalues < 0).all() else "minimum" if (eigenvalues > 0).all() else "saddle"
+    natural = {}
+    for i, name in enumerate(factors):
+        low, high = levels[name]["low"], levels[name]["high"]
+        natural[name] = float((low + high) / 2 + x[i] * (high - low) / 2) if isinstance(low, (int, float)) else None
+    return {
+        "type": kind,
+        "coded": {name: float(x[i]) for i, name in enumerate(factors)},
+        "natural": natural,
+        "predicted": float(coef[INTERCEPT] + b @ x + x @ B @ x),
+        "eigenvalues": eigenvalues.tolist(),
+    }
+
+
+def analyze_doe(df: pd.DataFrame, response: str, factors: List[str], model: str = "factorial",
+                max_order: Optional[int] = None, alpha: float = 0.05) -> Dict:
+    """Effects, ANOVA and alias structure of a two-level factorial or response-surface experiment"""
+    if model not in MODELS:
+        raise HTTPException(status_code=400, detail=f"model must be one of {', '.join(MODELS)}")
+    data = df[[response] + factors].dropna()
+    y = data[response].to_numpy(dtype=float)
+    coded, levels = code_factors(data, factors)
+    k = len(factors)
+    order = k if max_order is None else max(1, min(int(max_order), k))
+    if model == "quadratic":
+        order = min(order, 2)
+
+    masks = factorial_masks(k, order)
+    names = [term_name(mask, factors) for mask in masks]
+    center = np.all(coded == 0, axis=1)
+    cells = balanced_full_factorial(coded) if model == "factorial" else None
+
+    aliases: Dict[str, List[str]] = {}
+    if cells is not None:
+        method = "yates"
+        fit = yates_fit(y, cells, k, masks, names)
+    else:
+        method = "least-squares"
+        columns = interaction_columns(coded, masks)
+        if model == "quadratic":
+            columns = np.column_stack([columns, coded ** 2])
+            names = names + [f"{name}^2" for name in factors]
+        elif center.any() and not center.all():
+            columns = np.column_stack([columns, center.astype(float)])
+            names = names + ["Curvature"]
+        keep, aliases = alias_groups(np.column_stack([np.ones(y.size), columns]), [INTERCEPT] + names)
+        names = [names[j - 1] for j in keep[1:]]
+        columns = columns[:, [j - 1 for j in keep[1:]]]
+
+        moments = RunningComoments(columns.shape[1] + 1)
+        moments.update(np.column_stack([columns, y]))
+        fit = solve(moments, names, [response], min_df_resid=0)[response]
+
+    coefficients = {name: values["coefficient"] for name, values in fit["coefficients"].items()}
+    effects = []
+    for name in names:
+        values = fit["coefficients"][name]
+        factorial_term = not name.endswith("^2") and name != "Curvature"
+        effects.append({
+            "term": name,
+            "effect": 2 * values["coefficient"] if factorial_term else None,
+            "coefficient": values["coefficient"],
+            "std_error": values["std_error"],
+            "t_value": values["t_value"],
+            "p_value": values["p_value"],
+            "significant": bool(values["p_value"] < alpha) if np.isfinite(values["p_value"]) else None,
+            "aliases": aliases.get(name, []),
+        })
+
+    pse = None
+    if fit["df_resid"] <= 0:
+        # Saturated design: judge effects against Lenth's margin of error instead
+        pse = lenth_pse(np.array([e["effect"] for e in effects if e["effect"] is not None]))
+        if pse:
+            margin = stats.t.ppf(1 - alpha / 2, len(effects) / 3) * pse
+            for effect in effects:
+                if effect["effect"] is not None:
+                    effect["significant"] = bool(abs(effect["effect"]) > margin)
+
+    corners = np.isin(coded, (-1.0, 1.0)).all(axis=1)
+    words = defining_relation(coded, factors) if model == "factorial" else []
+    design = {
+        "factors": levels,
+        "runs": int(y.size),
+        "distinct_runs": int(np.unique(coded, axis=0).shape[0]),
+        "center_points": int(center.sum()),
+        "corner_runs": int(corners.sum()),
+        "fraction": f"2^({k}-{int(np.log2(len(words) + 1))})" if words else None,
+        "defining_relation": words,
+        "resolution": min(len(word.split("*")) for word in words) if words else None,
+    }
+    return {
+        "model": model,
+        "method": method,
+        "design": design,
+        "effects": effects,
+        "anova": anova_table(fit, names, y, pure_error(coded, y)),
+        "r_squared": fit["r_squared"],
+        "adj_r_squared": fit["adj_r_squared"],
+        "residual_std_error": fit["residual_std_error"],
+        "lenth_pse": pse,
+        "aliases": {INTERCEPT: aliases[INTERCEPT]} if INTERCEPT in aliases else {},
+        "stationary_point": stationary_point(coefficients, factors, levels) if model == "quadratic" else None,
+    }
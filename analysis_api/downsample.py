@@ -0,0 +1,97 @@
+"""
+Downsampling of stored chart series for display
+LTTB (largest triangle three buckets) keeps the visual shape of a series with few
+points; min/max buckets keep every local extreme. Both always keep the first and
+last points and every out-of-control point, so a chart drawn from the reduced
+series shows the same limit violations as the full one.
+"""
+
+from typing import Any, Dict, Iterable
+
+import numpy as np
+
+
+METHODS = ("lttb", "minmax")
+
+
+def lttb_indices(values: np.ndarray, threshold: int) -> np.ndarray:
+    """Indices of threshold points chosen by LTTB, with the point index as x"""
+    n = len(values)
+    threshold = max(threshold, 3)
+    if threshold >= n:
+        return np.arange(n)
+    y = np.nan_to_num(values.astype(float), nan=float(np.nanmean(values)) if np.isfinite(values).any() else 0.0)
+    edges = np.linspace(1, n - 1, threshold - 1).astype(int)  # threshold - 2 inner buckets
+    selected = np.empty(threshold, dtype=np.int64)
+    selected[0], selected[-1] = 0, n - 1
+    previous = 0
+    for b in range(threshold - 2):
+        start, end = edges[b], max(edges[b + 1], edges[b] + 1)
+        if b + 2 < len(edges):
+            next_start, next_end = edges[b + 1], max(edges[b + 2], edges[b + 1] + 1)
+            avg_x, avg_y = (next_start + next_end - 1) / 2, y[next_start:next_end].mean()
+        else:
+            avg_x, avg_y = n - 1, y[n - 1]
+        xs = np.arange(start, end)
+        # Twice the triangle area formed with the previous pick and the next bucket's mean
+        area = np.abs((previous - avg_x) * (y[start:end] - y[previous]) - (previous - xs) * (avg_y - y[previous]))
+        previous = start + int(np.argmax(area))
+        selected[b + 1] = previous
+    return selected
+
+
+def minmax_indices(values: np.ndarray, threshold: int) -> np.ndarray:
+    """Indices of the minimum and maximum of threshold // 2 equal buckets, plus the ends"""
+    n = len(values)
+    buckets = max(threshold // 2, 1)
+    if threshold >= n:
+        return np.arange(n)
+    size = -(-n // buckets)
+    padded = np.full(buckets * size, np.nan)
+    padded[:n] = values
+    padded = padded.reshape(buckets, size)
+    valid = ~np.isnan(padded).all(axis=1)
+    offsets = np.arange(buckets)[valid] * size
+    filled = padded[valid]
+    lows = np.nanargmin(filled, axis=1) + offsets
+    highs = np.nanargmax(filled, axis=1) + offsets
+    return np.unique(np.concatenate([[0, n - 1], lows, highs]))
+
+
+def downsample_indices(values: np.ndarray, max_points: int, method: str = "lttb",
+                       keep: Iterable[int] = ()) -> np.ndarray:
+    """Sorted indices to show at most about max_points, always including keep"""
+    keep = np.unique(np.asarray(list(keep), dtype=np.int64))
+    keep = keep[(keep >= 0) & (keep < len(values))]
+    budget = max(max_points - len(keep), 3)
+    chosen = lttb_indices(values, budget) if method == "lttb" else minmax_indices(values, budget)
+    return np.union1d(chosen, keep)
+
+
+def downsample_chart(chart: Dict, max_points: int, method: str) -> Dict:
+    """Chart dict with data_points (and per-point limits) reduced; point_index maps back to the full series"""
+    values = np.asarray(chart["data_points"], dtype=float)
+    reduced = dict(chart)
+    if "dispersion" in chart and isinstance(chart["dispersion"], dict):
+        reduced["dispersion"] = downsample_chart(chart["dispersion"], max_points, method)
+    if len(values) <= max_points:
+        return reduced
+    index = downsample_indices(values, max_points, method, chart.get("out_of_control_points") or [])
+    reduced["data_points"] = values[index]
+    for key in ("point_ucl", "point_lcl"):
+        if chart.get(key) is not None:
+            reduced[key] = np.asarray(chart[key], dtype=float)[index]
+    reduced["point_index"] = index
+    reduced["downsampled"] = {"method": method, "points": len(index), "original_points": len(values)}
+    return reduced
+
+
+def downsample_results(value: Any, max_points: int, method: str = "lttb") -> Any:
+    """Copy of a stored result with every chart series (including batch items) downsampled"""
+    if isinstance(value, dict):
+        if "data_points" in value:
+            return downsample_chart(value, max_points, method)
+        return {key: downsample_results(item, max_points, method) for key, item in value.items()}
+    if isinstance(value, list):
+        return [downsample_results(item, max_points, method) for item in value]
+    return value
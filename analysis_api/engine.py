@@ -0,0 +1,822 @@
+"""
+Analysis engine
+Parsing and the statistics behind the /analyze endpoints, free of the web layer:
+every function takes a DataFrame (or a file) and returns plain results, so the
+API, the command-line runner (cli.py) and other Python code share one code path
+and produce the same results for the same file and parameters.
+"""
+
+from __future__ import annotations
+
+from fastapi import HTTPException
+from pydantic import BaseModel, ConfigDict, ValidationError, create_model
+from typing import Optional, List, Dict, Any, Union
+import numpy as np
+from io import BytesIO
+import functools
+import importlib.util
+import inspect
+import typing
+
+from batch import control_chart_batch
+from capability import (
+    CAPABLE_CPK, DEFAULT_RESAMPLES, MAX_RESAMPLES, calculate_sigma_level, capability_indices,
+    capability_intervals, check_seed, fitted_capability, parse_intervals
+)
+from dataset_store import file_digest, to_columnar
+from distributions import CRITERIA, fit_columns, parse_distribution
+from doe import analyze_doe
+from gage_rr import DESIGNS as GAGE_DESIGNS, METHODS as GAGE_METHODS, gage_rr_studies
+from grouping import group_rows, grouped_capability, grouped_control_chart, grouped_descriptive, parse_group_by
+from lazy import lazy_import
+from regression import fit_chunks, fit_frame
+from serialization import FloatArray
+from streaming_stats import exact_quantiles_from_bracket, summarize_chunks
+
+pd = lazy_import("pandas")
+stats = lazy_import("scipy.stats")
+
+# ==================== MODELS ====================
+
+class DescriptiveResult(BaseModel):
+    column: str
+    count: int
+    mean: float
+    std: float
+    min: float
+    max: float
+    median: float
+    q1: float
+    q3: float
+    variance: float
+
+class CapabilityResult(BaseModel):
+    column: str
+    usl: float
+    lsl: float
+    target: Optional[float]
+    mean: float
+    std: float
+    cp: float
+    cpk: float
+    cpu: float
+    cpl: float
+    ppm_above_usl: float
+    ppm_below_lsl: float
+    sigma_level: float
+    capable: bool
+    confidence_intervals: Optional[Dict[str, Any]] = None
+    distribution: str = "normal"
+    distribution_fit: Optional[Dict[str, Any]] = None
+
+class RegressionResult(BaseModel):
+    r_squared: float
+    adj_r_squared: float
+    f_statistic: float
+    f_pvalue: float
+    coefficients: Dict[str, Dict[str, float]]
+    residual_std_error: float
+    observations: int
+
+class MultiRegressionResult(BaseModel):
+    predictors: List[str]
+    observations: int
+    responses: Dict[str, RegressionResult]
+
+class TTestResult(BaseModel):
+    test_type: str
+    t_statistic: float
+    p_value: float
+    df: float
+    mean_difference: Optional[float]
+    confidence_interval: List[float]
+    significant: bool
+    alpha: float
+
+class DispersionChartResult(BaseModel):
+    chart_type: str  # r, s, mr
+    center_line: float
+    ucl: float
+    lcl: float
+    out_of_control_points: List[int]
+    data_points: FloatArray
+
+class ControlChartResult(BaseModel):
+    chart_type: str
+    center_line: float
+    ucl: float
+    lcl: float
+    subgroup_size: int
+    out_of_control_points: List[int]
+    data_points: FloatArray
+    sigma: Optional[float] = None
+    rule_violations: Dict[str, List[int]] = {}
+    dispersion: Optional[DispersionChartResult] = None
+    size_column: Optional[str] = None
+    point_ucl: Optional[FloatArray] = None  # per-point limits when sample sizes vary
+    point_lcl: Optional[FloatArray] = None
+
+class GageRRResult(BaseModel):
+    study: Optional[Any] = None
+    design: str  # crossed, nested
+    method: str  # anova, xbar-r
+    parts: int
+    operators: int
+    replicates: int
+    tolerance: Optional[float]
+    components: Dict[str, Dict[str, Optional[float]]]  # variance, %contribution, study var, %study var, %tolerance
+    ndc: Optional[int]
+    assessment: str  # acceptable, marginal, unacceptable
+    anova: Optional[List[Dict[str, Any]]] = None
+    interaction_p_value: Optional[float] = None
+    interaction_removed: Optional[bool] = None
+
+class DOEResult(BaseModel):
+    model: str
+    method: str  # yates, least-squares
+    design: Dict[str, Any]
+    effects: List[Dict[str, Any]]
+    anova: List[Dict[str, Any]]
+    r_squared: Optional[float]
+    adj_r_squared: Optional[float]
+    residual_std_error: Optional[float]
+    lenth_pse: Optional[float] = None
+    aliases: Dict[str, List[str]] = {}
+    stationary_point: Optional[Dict[str, Any]] = None
+
+class BatchResult(BaseModel):
+    count: int
+    failed: int
+    items: List[Dict[str, Any]]
+
+class GroupedResult(BaseModel):
+    group_by: List[str]
+    groups: int
+    table: Dict[str, Any]  # columnar: key columns, then one array per statistic
+    overall: Any  # the ungrouped result for the whole dataset
+
+# ==================== PARSING ====================
+
+# Optional faster readers, used for projected reads when installed
+HAS_PYARROW = importlib.util.find_spec("pyarrow") is not None
+HAS_CALAMINE = importlib.util.find_spec("python_calamine") is not None
+
+SPREADSHEET_FORMATS = ('.csv', '.xlsx', '.xls')
+ARROW_FORMATS = ('.arrow', '.feather', '.ipc')
+COLUMNAR_FORMATS = ('.parquet',) + ARROW_FORMATS
+SUPPORTED_FORMATS = SPREADSHEET_FORMATS + COLUMNAR_FORMATS
+
+# pd.read_csv's default missing-value strings, so the pyarrow reader parses cells alike
+PANDAS_NA_VALUES = [
+    "", "#N/A", "#N/A N/A", "#NA", "-1.#IND", "-1.#QNAN", "-NaN", "-nan", "1.#IND", "1.#QNAN",
+    "<NA>", "N/A", "NA", "NULL", "NaN", "None", "n/a", "nan", "null"
+]
+
+def as_input(content: Union[bytes, str]):
+    """File-like input for the readers: upload bytes, or the path of a spooled upload"""
+    return BytesIO(content) if isinstance(content, bytes) else content
+
+def parse_content(content: Union[bytes, str], filename: str, usecols: Optional[List[str]] = None,
+                  numeric: Optional[List[str]] = None) -> pd.DataFrame:
+    """
+    Parse raw CSV, Excel, Parquet or Arrow IPC/Feather data, given as bytes or a file path
+    usecols limits parsing to those columns (missing ones are skipped) and numeric
+    columns are read straight into float64. Without usecols the whole file is parsed.
+    """
+    if not filename.endswith(SUPPORTED_FORMATS):
+        raise HTTPException(status_code=400, detail="Unsupported file format. Use CSV, Excel, Parquet or Arrow.")
+    if filename.endswith(COLUMNAR_FORMATS):
+        return read_columnar(content, filename, usecols)
+    if usecols is None:
+        if filename.endswith('.csv'):
+            return pd.read_csv(as_input(content))
+        return pd.read_excel(as_input(content))
+    
+    wanted = set(usecols)
+    dtype = {col: "float64" for col in numeric or [] if col in wanted}
+    try:
+        return read_projected(content, filename, wanted, dtype)
+    except (ValueError, TypeError):
+        # A "numeric" column holds text; parse it as-is and let the analysis report it
+        return read_projected(content, filename, wanted, {})
+
+def read_projected(content: Union[bytes, str], filename: str, wanted: set, dtype: Dict[str, str]) -> pd.DataFrame:
+    if filename.endswith('.csv'):
+        header = pd.read_csv(as_input(content), nrows=0).columns
+        present = [col for col in header if col in wanted]
+        if not present:
+            return pd.DataFrame()
+        if HAS_PYARROW:
+            return read_csv_arrow(content, present, dtype)
+        return pd.read_csv(as_input(content), usecols=present, dtype=dtype)
+    engine = "calamine" if HAS_CALAMINE and filename.endswith('.xlsx') else None
+    return pd.read_excel(as_input(content), usecols=lambda col: col in wanted, dtype=dtype, engine=engine)
+
+def read_csv_arrow(content: Union[bytes, str], columns: List[str], dtype: Dict[str, str]) -> pd.DataFrame:
+    """Projected CSV read with pyarrow's block-streaming reader, which keeps peak memory low"""
+    import pyarrow as pa
+    import pyarrow.csv as pa_csv
+    
+    reader = pa_csv.open_csv(
+        pa.BufferReader(content) if isinstance(content, bytes) else content,
+        read_options=pa_csv.ReadOptions(block_size=1 << 22),
+        convert_options=pa_csv.ConvertOptions(
+            include_columns=columns,
+            column_types={col: pa.float64() for col in dtype},
+            null_values=PANDAS_NA_VALUES,
+            strings_can_be_null=True,
+            quoted_strings_can_be_null=True
+        )
+    )
+    return reader.read_all().to_pandas()
+
+def read_columnar(content: Union[bytes, str], filename: str, usecols: Optional[List[str]] = None) -> pd.DataFrame:
+    """
+    Read Parquet or Arrow IPC/Feather, only the usecols columns when given
+    Arrow files on disk are memory-mapped, so only the pages of the selected
+    columns are read; see arrow_values for when no copy is made at all.
+    """
+    if not HAS_PYARROW:
+        raise HTTPException(status_code=400, detail="Parquet and Arrow uploads require pyarrow")
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+    
+    source = pa.BufferReader(content) if isinstance(content, bytes) else pa.memory_map(content)
+    try:
+        if filename.endswith('.parquet'):
+            parquet = pq.ParquetFile(source)
+            names = parquet.schema_arrow.names
+            table = parquet.read(columns=None if usecols is None else [c for c in names if c in set(usecols)])
+        else:
+            table = read_arrow_table(source)
+            if usecols is not None:
+                table = table.select([c for c in table.column_names if c in set(usecols)])
+    except (pa.ArrowInvalid, OSError) as e:
+        raise HTTPException(status_code=400, detail=f"Could not read {filename}: {e}")
+    return pd.DataFrame({name: arrow_values(table.column(name)) for name in table.column_names}, copy=False)
+
+def read_arrow_table(source):
+    """Arrow IPC file (Feather v2), falling back to the IPC stream format and Feather v1"""
+    import pyarrow as pa
+    import pyarrow.feather as feather
+    
+    try:
+        return pa.ipc.open_file(source).read_all()
+    except pa.ArrowInvalid:
+        source.seek(0)
+    try:
+        return pa.ipc.open_stream(source).read_all()
+    except pa.ArrowInvalid:
+        source.seek(0)
+    return feather.read_table(source)
+
+def arrow_values(column):
+    """
+    NumPy view of a single-chunk numeric column without nulls, otherwise a converted copy
+    Over a memory-mapped file the view reads the column's pages on demand.
+    """
+    import pyarrow as pa
+    
+    if column.num_chunks == 1 and column.null_count == 0 and (
+            pa.types.is_floating(column.type) or pa.types.is_integer(column.type)):
+        return column.chunk(0).to_numpy(zero_copy_only=True)
+    return column.to_pandas()
+
+# ==================== UTILITIES ====================
+
+def rounded(value: Any, digits: int = 4) -> Any:
+    """Round every float in a nested result, mapping NaN and infinities to None"""
+    if isinstance(value, dict):
+        return {key: rounded(item, digits) for key, item in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [rounded(item, digits) for item in value]
+    if isinstance(value, (float, np.floating)):
+        return round(float(value), digits) if np.isfinite(value) else None
+    return value
+
+def require_columns(df: pd.DataFrame, columns: List[str]):
+    """Raise 400 for the first column missing from the dataset"""
+    for col in columns:
+        if col not in df.columns:
+            raise HTTPException(status_code=400, detail=f"Column '{col}' not found")
+
+# ==================== ANALYSES ====================
+# Pure functions of (DataFrame, parameters); endpoints run them in the executor
+
+def compute_descriptive(df: pd.DataFrame, cols: Optional[List[str]] = None) -> List[DescriptiveResult]:
+    """Descriptive statistics for each requested column present in the dataset (default: all numeric)"""
+    if cols is None:
+        cols = list(df.select_dtypes(include=[np.number]).columns)
+    
+    results = []
+    for col in cols:
+        if col in df.columns:
+            data = df[col].dropna()
+            results.append(DescriptiveResult(
+                column=col,
+                count=int(len(data)),
+                mean=round(float(data.mean()), 4),
+                std=round(float(data.std()), 4),
+                min=round(float(data.min()), 4),
+                max=round(float(data.max()), 4),
+                median=round(float(data.median()), 4),
+                q1=round(float(data.quantile(0.25)), 4),
+                q3=round(float(data.quantile(0.75)), 4),
+                variance=round(float(data.var()), 4)
+            ))
+    return results
+
+QUARTILES = (0.25, 0.5, 0.75)
+
+def iter_csv_columns(path: str, cols: List[str], chunk_rows: int):
+    """Yield {column: float array} for each chunk of a CSV file"""
+    for chunk in pd.read_csv(path, usecols=cols, chunksize=chunk_rows):
+        yield {col: pd.to_numeric(chunk[col], errors="coerce").to_numpy(dtype=float) for col in cols}
+
+def streaming_columns(path: str, cols: Optional[List[str]]) -> List[str]:
+    """Requested columns present in the CSV header, or the numeric columns of its first rows"""
+    if cols is None:
+        head = pd.read_csv(path, nrows=1000)
+        return list(head.select_dtypes(include=[np.number]).columns)
+    header = set(pd.read_csv(path, nrows=0).columns)
+    return [col for col in cols if col in header]
+
+def exact_csv_quantiles(path: str, summaries: Dict, chunk_rows: int) -> Dict[str, np.ndarray]:
+    """
+    Exact quartiles via extra passes that keep only values near each sketch estimate
+    Memory is proportional to the sketch rank error times the row count, not the file size.
+    """
+    cols = list(summaries)
+    exact: Dict[str, np.ndarray] = {}
+    margin = 3 * next(iter(summaries.values())).sketch.rank_error if summaries else 0
+    pending = [(col, q) for col in cols for q in QUARTILES if summaries[col].moments.count]
+    
+    while pending:
+        bounds = {}
+        for col, q in pending:
+            if margin >= 1:
+                bounds[(col, q)] = (-np.inf, np.inf)
+            else:
+                bounds[(col, q)] = tuple(summaries[col].sketch.quantiles([max(q - margin, 0), min(q + margin, 1)]))
+        below = {key: 0 for key in bounds}
+        inside = {key: [] for key in bounds}
+        
+        for chunk in iter_csv_columns(path, sorted({col for col, _ in pending}), chunk_rows):
+            for (col, q), (lo, hi) in bounds.items():
+                values = chunk[col][np.isfinite(chunk[col])]
+                below[(col, q)] += int((values < lo).sum())
+                inside[(col, q)].append(values[(values >= lo) & (values <= hi)])
+        
+        retry = []
+        for key in pending:
+            col, q = key
+            found = exact_quantiles_from_bracket(
+                [q], summaries[col].moments.count, below[key], np.concatenate(inside[key])
+            )
+            if found is None:
+                retry.append(key)
+            else:
+                exact.setdefault(col, {})[q] = float(found[0])
+        pending = retry
+        margin *= 4
+    
+    return {col: np.array([values[q] for q in QUARTILES]) for col, values in exact.items()}
+
+def compute_descriptive_streaming(path: str, cols: Optional[List[str]] = None, chunk_rows: int = 100_000,
+                                  exact_quantiles: bool = False) -> List[DescriptiveResult]:
+    """Descriptive statistics of a CSV read in chunks, in memory independent of its size"""
+    cols = streaming_columns(path, cols)
+    if not cols:
+        return []
+    
+    summaries = summarize_chunks(iter_csv_columns(path, cols, chunk_rows))
+    quartiles = exact_csv_quantiles(path, summaries, chunk_rows) if exact_quantiles else {
+        col: summary.sketch.quantiles(QUARTILES) for col, summary in summaries.items()
+    }
+    
+    results = []
+    for col in cols:
+        moments = summaries[col].moments
+        q1, median, q3 = quartiles.get(col, [np.nan] * 3)
+        results.append(DescriptiveResult(
+            column=col,
+            count=int(moments.count),
+            mean=round(float(moments.mean), 4) if moments.count else np.nan,
+            std=round(moments.std, 4),
+            min=round(float(moments.min), 4) if moments.count else np.nan,
+            max=round(float(moments.max), 4) if moments.count else np.nan,
+            median=round(float(median), 4),
+            q1=round(float(q1), 4),
+            q3=round(float(q3), 4),
+            variance=round(moments.variance, 4)
+        ))
+    return results
+
+def compute_capability(df: pd.DataFrame, column: str, usl: float, lsl: float,
+                       target: Optional[float] = None, intervals: Optional[str] = None,
+                       confidence: float = 0.95, resamples: int = DEFAULT_RESAMPLES,
+                       seed: Optional[int] = None, distribution: str = "normal",
+                       criterion: str = "ad") -> CapabilityResult:
+    """
+    Process capability indices (Cp, Cpk) assuming normality, with optional confidence intervals
+    Any other distribution gives percentile-method indices from the best-fitting candidate.
+    """
+    require_columns(df, [column])
+    try:
+        methods = parse_intervals(intervals)
+        candidates = [] if distribution == "normal" else parse_distribution(distribution)
+        check_seed(seed)
+    except ValueError as exc:
+        raise HTTPException(status_code=400, detail=str(exc))
+    if candidates and methods:
+        raise HTTPException(status_code=400, detail="Confidence intervals assume normality; use distribution=normal")
+    if criterion not in CRITERIA:
+        raise HTTPException(status_code=400, detail="criterion must be 'ad' or 'aic'")
+    if methods and not 0 < confidence < 1:
+        raise HTTPException(status_code=400, detail="confidence must be between 0 and 1")
+    if set(methods) - {"exact"} and not 100 <= resamples <= MAX_RESAMPLES:
+        raise HTTPException(status_code=400, detail=f"resamples must be between 100 and {MAX_RESAMPLES}")
+    
+    data = df[column].dropna().values.astype(float)
+    mean = float(np.mean(data))
+    std = float(np.std(data, ddof=1))
+    
+    if std == 0:
+        raise HTTPException(status_code=400, detail="Standard deviation is zero")
+    
+    if candidates:
+        fitted = fitted_capability(fit_columns({column: data}, candidates)[column], usl, lsl, criterion)
+        if "error" in fitted:
+            raise HTTPException(status_code=400, detail=fitted["error"])
+        return CapabilityResult(column=column, usl=usl, lsl=lsl, target=target,
+                                mean=round(mean, 4), std=round(std, 4), **fitted)
+    
+    confidence_intervals = None
+    if methods:
+        confidence_intervals = capability_intervals(data, usl, lsl, methods, confidence, resamples, seed)
+    
+    indices = capability_indices(mean, std, usl, lsl)
+    cpk = float(indices["cpk"])
+    
+    return CapabilityResult(
+        column=column,
+        usl=usl,
+        lsl=lsl,
+        target=target,
+        mean=round(mean, 4),
+        std=round(std, 4),
+        cp=round(float(indices["cp"]), 3),
+        cpk=round(cpk, 3),
+        cpu=round(float(indices["cpu"]), 3),
+        cpl=round(float(indices["cpl"]), 3),
+        ppm_above_usl=round(float(indices["ppm_above_usl"]), 1),
+        ppm_below_lsl=round(float(indices["ppm_below_lsl"]), 1),
+        sigma_level=round(calculate_sigma_level(cpk), 2),
+        capable=cpk >= CAPABLE_CPK,
+        confidence_intervals=confidence_intervals
+    )
+
+def regression_formula(response: str, pred_cols: List[str]) -> str:
+    return f"{response} ~ " + " + ".join(pred_cols)
+
+def regression_result(fit: Dict) -> RegressionResult:
+    """Round a fit from the regression module into the API model"""
+    coefficients = {}
+    for term, values in fit["coefficients"].items():
+        coefficients[term] = {
+            "coefficient": round(values["coefficient"], 4),
+            "std_error": round(values["std_error"], 4),
+            "t_value": round(values["t_value"], 4),
+            "p_value": round(values["p_value"], 4),
+            "significant": values["p_value"] < 0.05
+        }
+    
+    return RegressionResult(
+        r_squared=round(fit["r_squared"], 4),
+        adj_r_squared=round(fit["adj_r_squared"], 4),
+        f_statistic=round(fit["f_statistic"], 4),
+        f_pvalue=round(fit["f_pvalue"], 6),
+        coefficients=coefficients,
+        residual_std_error=round(fit["residual_std_error"], 4),
+        observations=fit["observations"]
+    )
+
+def regression_response(fits: Dict[str, Dict], pred_cols: List[str]):
+    """A RegressionResult for one response, a MultiRegressionResult for several"""
+    if len(fits) == 1:
+        return regression_result(next(iter(fits.values())))
+    results = {name: regression_result(fit) for name, fit in fits.items()}
+    return MultiRegressionResult(
+        predictors=pred_cols,
+        observations=next(iter(results.values())).observations,
+        responses=results
+    )
+
+def compute_regression(df: pd.DataFrame, responses: List[str], pred_cols: List[str],
+                       chunk_rows: int = 100_000):
+    """Multiple linear regression of one or more responses on the same predictors"""
+    require_columns(df, responses + pred_cols)
+    return regression_response(fit_frame(df, responses, pred_cols, chunk_rows), pred_cols)
+
+def compute_regression_streaming(path: str, responses: List[str], pred_cols: List[str], chunk_rows: int = 100_000):
+    """Regression over a CSV read in chunks, in memory independent of its row count"""
+    missing = [col for col in responses + pred_cols if col not in streaming_columns(path, responses + pred_cols)]
+    if missing:
+        raise HTTPException(status_code=400, detail=f"Column '{missing[0]}' not found")
+    fits = fit_chunks(iter_csv_columns(path, pred_cols + responses, chunk_rows), responses, pred_cols)
+    return regression_response(fits, pred_cols)
+
+def compute_ttest(df: pd.DataFrame, column1: str, column2: Optional[str], test_type: str,
+                  hypothesized_mean: Optional[float], alpha: float) -> TTestResult:
+    """One-sample, two-sample or paired t-test"""
+    data1 = df[column1].dropna().values
+    
+    if test_type == "one-sample":
+        if hypothesized_mean is None:
+            raise HTTPException(status_code=400, detail="hypothesized_mean required for one-sample test")
+        t_stat, p_value = stats.ttest_1samp(data1, hypothesized_mean)
+        df_val = len(data1) - 1
+        mean_diff = float(np.mean(data1)) - hypothesized_mean
+        
+    elif test_type == "two-sample":
+        if column2 is None:
+            raise HTTPException(status_code=400, detail="column2 required for two-sample test")
+        data2 = df[column2].dropna().values
+        t_stat, p_value = stats.ttest_ind(data1, data2)
+        df_val = len(data1) + len(data2) - 2
+        mean_diff = float(np.mean(data1) - np.mean(data2))
+        
+    elif test_type == "paired":
+        if column2 is None:
+            raise HTTPException(status_code=400, detail="column2 required for paired test")
+        pairs = df[[column1, column2]].dropna()  # complete pairs, as in /analyze/ttest/batch
+        before, after = pairs[column1].values, pairs[column2].values
+        t_stat, p_value = stats.ttest_rel(before, after)
+        df_val = len(pairs) - 1
+        mean_diff = float(np.mean(before - after))
+    else:
+        raise HTTPException(status_code=400, detail="Invalid test_type")
+    
+    # Confidence interval
+    se = float(np.std(data1, ddof=1) / np.sqrt(len(data1)))
+    ci_margin = stats.t.ppf(1 - alpha/2, df_val) * se
+    ci = [float(np.mean(data1)) - ci_margin, float(np.mean(data1)) + ci_margin]
+    
+    return TTestResult(
+        test_type=test_type,
+        t_statistic=round(float(t_stat), 4),
+        p_value=round(float(p_value), 6),
+        df=round(float(df_val), 2),
+        mean_difference=round(mean_diff, 4) if mean_diff else None,
+        confidence_interval=[round(ci[0], 4), round(ci[1], 4)],
+        significant=float(p_value) < alpha,
+        alpha=alpha
+    )
+
+def compute_control_chart(df: pd.DataFrame, column: str, subgroup_size: int, chart_type: str,
+                          size_column: Optional[str] = None, rules: str = "all") -> ControlChartResult:
+    """Control chart limits, out-of-control points and run-rule violations"""
+    spec = {"column": column, "subgroup_size": subgroup_size, "chart_type": chart_type,
+            "size_column": size_column, "rules": rules}
+    item = control_chart_batch(df, [spec])[0]
+    if "error" in item:
+        raise HTTPException(status_code=400, detail=item["error"])
+    
+    item.pop("column")
+    return ControlChartResult(**item)
+
+def compute_doe(df: pd.DataFrame, response: str, factors: List[str], model: str,
+                max_order: Optional[int], alpha: float) -> DOEResult:
+    """Factorial effects or response-surface fit with ANOVA"""
+    require_columns(df, [response] + factors)
+    result = analyze_doe(df, response, factors, model, max_order, alpha)
+    # p-values keep more precision, as in the other analyses
+    for effect in result["effects"]:
+        effect["p_value"] = rounded(effect["p_value"], 6)
+    return DOEResult(**rounded(result))
+
+def gage_rr_spec(part: str, operator: str, measurement: str, design: str, method: str,
+                 tolerance: Optional[float], study_var: float, interaction_alpha: float,
+                 study: Optional[str] = None, tolerance_column: Optional[str] = None) -> Dict:
+    """Validated Gage R&R settings, or 400"""
+    if design not in GAGE_DESIGNS:
+        raise HTTPException(status_code=400, detail="design must be 'crossed' or 'nested'")
+    if method not in GAGE_METHODS:
+        raise HTTPException(status_code=400, detail="method must be 'anova' or 'xbar-r'")
+    if method == "xbar-r" and design != "crossed":
+        raise HTTPException(status_code=400, detail="The Xbar-R method requires a crossed design")
+    if tolerance is not None and not tolerance > 0:
+        raise HTTPException(status_code=400, detail="tolerance must be positive")
+    if not study_var > 0:
+        raise HTTPException(status_code=400, detail="study_var must be positive")
+    if not 0 <= interaction_alpha <= 1:
+        raise HTTPException(status_code=400, detail="interaction_alpha must be between 0 and 1")
+    return {"part": part, "operator": operator, "measurement": measurement, "study": study, "design": design,
+            "method": method, "tolerance": tolerance, "tolerance_column": tolerance_column,
+            "study_var": study_var, "interaction_alpha": interaction_alpha}
+
+def compute_gage_rr(df: pd.DataFrame, spec: Dict) -> GageRRResult:
+    """Gage R&R of one study: ANOVA or Xbar-R variance components, %StudyVar, %Tolerance and ndc"""
+    require_columns(df, [spec["part"], spec["operator"], spec["measurement"]])
+    result = gage_rr_studies(df, **spec)[0]
+    if "error" in result:
+        raise HTTPException(status_code=400, detail=result["error"])
+    return GageRRResult(**result)
+
+# Grouped variants: one pass over rows sorted by group, never a loop over groups
+
+def grouping(df: pd.DataFrame, keys: List[str]):
+    """Group codes for the key columns, or 400 if one is missing"""
+    require_columns(df, keys)
+    return group_rows(df, keys)
+
+def compute_grouped_descriptive(df: pd.DataFrame, keys: List[str], cols: Optional[List[str]] = None) -> GroupedResult:
+    """Descriptive statistics per group of the key columns, with the ungrouped statistics as the rollup"""
+    groups = grouping(df, keys)
+    if cols is None:
+        cols = list(df.select_dtypes(include=[np.number]).columns)
+    cols = [col for col in cols if col in df.columns and col not in keys]
+    return GroupedResult(
+        group_by=keys,
+        groups=groups.count,
+        table=grouped_descriptive(df, groups, cols),
+        overall=[r.dict() for r in compute_descriptive(df, cols)]
+    )
+
+def compute_grouped_capability(df: pd.DataFrame, keys: List[str], column: str, usl: float, lsl: float,
+                               target: Optional[float] = None) -> GroupedResult:
+    """Normal-theory capability per group of the key columns, with the ungrouped capability as the rollup"""
+    overall = compute_capability(df, column, usl, lsl, target)
+    groups = grouping(df, keys)
+    return GroupedResult(
+        group_by=keys,
+        groups=groups.count,
+        table=grouped_capability(df, groups, column, usl, lsl),
+        overall=overall.dict()
+    )
+
+def compute_grouped_control_chart(df: pd.DataFrame, keys: List[str], column: str, subgroup_size: int,
+                                  chart_type: str, size_column: Optional[str] = None,
+                                  rules: str = "all") -> GroupedResult:
+    """Control chart limits and violation counts per group of the key columns, with the ungrouped chart as the rollup"""
+    overall = compute_control_chart(df, column, subgroup_size, chart_type, size_column, rules)
+    groups = grouping(df, keys)
+    try:
+        table = grouped_control_chart(df, groups, column, chart_type, subgroup_size, size_column, rules)
+    except ValueError as exc:
+        raise HTTPException(status_code=400, detail=str(exc))
+    return GroupedResult(
+        group_by=keys,
+        groups=groups.count,
+        table=table,
+        overall=overall.dict()
+    )
+# ==================== ENGINE ====================
+# One function per /analyze endpoint, taking the endpoint's form fields and returning
+# the "results" of its response; the endpoints call these same functions
+
+def split_columns(value: Optional[str]) -> Optional[List[str]]:
+    """Comma-separated column names, or None when empty"""
+    return [name.strip() for name in value.split(',')] if value else None
+
+def check_chunk_rows(chunk_rows: int):
+    if chunk_rows < 1:
+        raise HTTPException(status_code=400, detail="chunk_rows must be at least 1")
+
+def check_capability_grouping(keys: List[str], intervals: Optional[str], distribution: str):
+    if keys and (intervals or distribution != "normal"):
+        raise HTTPException(status_code=400, detail="group_by supports normal capability without intervals")
+
+def descriptive_results(df: pd.DataFrame, columns: Optional[str] = None, group_by: Optional[str] = None) -> Any:
+    cols = split_columns(columns)
+    keys = parse_group_by(group_by)
+    if keys:
+        return compute_grouped_descriptive(df, keys, cols).dict()
+    return [r.dict() for r in compute_descriptive(df, cols)]
+
+def capability_results(df: pd.DataFrame, column: str, usl: float, lsl: float, target: Optional[float] = None,
+                       intervals: Optional[str] = None, confidence: float = 0.95,
+                       resamples: int = DEFAULT_RESAMPLES, seed: Optional[int] = None,
+                       distribution: str = "normal", criterion: str = "ad",
+                       group_by: Optional[str] = None) -> Dict:
+    keys = parse_group_by(group_by)
+    check_capability_grouping(keys, intervals, distribution)
+    if keys:
+        return compute_grouped_capability(df, keys, column, usl, lsl, target).dict()
+    return compute_capability(df, column, usl, lsl, target, intervals, confidence, resamples, seed,
+                              distribution, criterion).dict()
+
+def regression_results(df: pd.DataFrame, response: str, predictors: str, chunk_rows: int = 100_000) -> Dict:
+    check_chunk_rows(chunk_rows)
+    return compute_regression(df, split_columns(response), split_columns(predictors), chunk_rows).dict()
+
+def doe_results(df: pd.DataFrame, response: str, factors: str, model: str = "factorial",
+                max_order: Optional[int] = None, alpha: float = 0.05) -> Dict:
+    return compute_doe(df, response, split_columns(factors), model, max_order, alpha).dict()
+
+def ttest_results(df: pd.DataFrame, column1: str, column2: Optional[str] = None, test_type: str = "two-sample",
+                  hypothesized_mean: Optional[float] = None, alpha: float = 0.05) -> Dict:
+    return compute_ttest(df, column1, column2, test_type, hypothesized_mean, alpha).dict()
+
+def control_chart_results(df: pd.DataFrame, column: str, subgroup_size: int = 5, chart_type: str = "xbar-r",
+                          size_column: Optional[str] = None, rules: str = "all",
+                          group_by: Optional[str] = None) -> Dict:
+    keys = parse_group_by(group_by)
+    if keys:
+        return compute_grouped_control_chart(df, keys, column, subgroup_size, chart_type, size_column, rules).dict()
+    return compute_control_chart(df, column, subgroup_size, chart_type, size_column, rules).dict()
+
+def gage_rr_results(df: pd.DataFrame, part: str, operator: str, measurement: str, design: str = "crossed",
+                    method: str = "anova", tolerance: Optional[float] = None, study_var: float = 6.0,
+                    interaction_alpha: float = 0.05) -> Dict:
+    spec = gage_rr_spec(part, operator, measurement, design, method, tolerance, study_var, interaction_alpha)
+    return compute_gage_rr(df, spec).dict()
+
+ANALYSES = {
+    "descriptive": descriptive_results,
+    "capability": capability_results,
+    "regression": regression_results,
+    "doe": doe_results,
+    "ttest": ttest_results,
+    "control-chart": control_chart_results,
+    "gage-rr": gage_rr_results,
+}
+
+def analysis_columns(analysis_type: str, params: Dict) -> Optional[List[str]]:
+    """Columns an analysis reads, as its endpoint projects an upload; None parses the whole file"""
+    keys = parse_group_by(params.get("group_by"))
+    if analysis_type == "descriptive":
+        cols = split_columns(params.get("columns"))
+        return cols + keys if cols else None
+    if analysis_type == "capability":
+        return [params["column"]] + keys
+    if analysis_type == "regression":
+        return split_columns(params["response"]) + split_columns(params["predictors"])
+    if analysis_type == "doe":
+        return [params["response"]] + split_columns(params["factors"])
+    if analysis_type == "ttest":
+        return [params["column1"]] + ([params["column2"]] if params.get("column2") else [])
+    if analysis_type == "control-chart":
+        return [params["column"]] + ([params["size_column"]] if params.get("size_column") else []) + keys
+    return [params["part"], params["operator"], params["measurement"]]
+
+@functools.lru_cache(maxsize=None)
+def params_model(analysis_type: str):
+    """Pydantic model of an analysis' parameters, converting values as the endpoint's form fields do"""
+    function = ANALYSES[analysis_type]
+    hints = typing.get_type_hints(function)
+    fields = {
+        name: (hints[name], ... if param.default is inspect.Parameter.empty else param.default)
+        for name, param in list(inspect.signature(function).parameters.items())[1:]
+    }
+    config = ConfigDict(extra="forbid", protected_namespaces=())
+    return create_model(f"{analysis_type.title().replace('-', '')}Params", __config__=config, **fields)
+
+def analysis_params(spec: Dict) -> Dict:
+    """
+    Validated parameters of an analysis spec, {"analysis": type, **form fields}
+    Raises ValueError for an unknown analysis or invalid, missing or unexpected fields.
+    """
+    spec = dict(spec)
+    analysis_type = spec.pop("analysis", None)
+    if analysis_type not in ANALYSES:
+        raise ValueError(f"analysis must be one of {', '.join(ANALYSES)}, not {analysis_type!r}")
+    try:
+        return params_model(analysis_type)(**spec).model_dump()
+    except ValidationError as exc:
+        problems = "; ".join(f"{'.'.join(map(str, error['loc']))}: {error['msg']}" for error in exc.errors())
+        raise ValueError(f"Invalid {analysis_type} spec: {problems}") from None
+
+def load_file(path: str, columns: Optional[List[str]] = None) -> pd.DataFrame:
+    """Parse a file as an upload to the API is parsed and cached, only the given columns when any"""
+    df = parse_content(path, path) if columns is None else parse_content(path, path, columns, columns)
+    return df if path.endswith(COLUMNAR_FORMATS) else to_columnar(df)
+
+def analyze_file(path: str, specs: List[Dict]) -> List[Dict]:
+    """
+    Run analysis specs over one file, parsed once for all of them
+    Returns one record per spec: file, dataset_id, analysis_type, params and either
+    results, exactly as the API would return them for that upload, or an error.
+    """
+    typed = [(spec["analysis"], analysis_params(spec)) for spec in specs]
+    needed = [analysis_columns(analysis_type, params) for analysis_type, params in typed]
+    columns = None if any(cols is None for cols in needed) else list(dict.fromkeys(sum(needed, [])))
+    
+    records = [{"file": path, "dataset_id": None, "analysis_type": analysis_type, "params": params}
+               for analysis_type, params in typed]
+    try:
+        dataset_id = file_digest(path)[:16]
+        df = load_file(path, columns)
+    except (HTTPException, OSError, ValueError) as exc:
+        return [{**record, "error": error_detail(exc)} for record in records]
+    
+    for record in records:
+        record["dataset_id"] = dataset_id
+        try:
+            record["results"] = ANALYSES[record["analysis_type"]](df, **record["params"])
+        except Exception as exc:  # one failing analysis must not stop the rest of the run
+            record["error"] = error_detail(exc)
+    return records
+
+def error_detail(exc: Exception) -> str:
+    return str(exc.detail) if isinstance(exc, HTTPException) else f"{type(exc).__name__}: {exc}"
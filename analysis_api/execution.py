@@ -0,0 +1,119 @@
+"""
+Execution layer for the analysis API
+Runs CPU-bound parsing and statistics off the event loop in a bounded
+thread or process pool, rejecting work with 429 once the pool is saturated.
+"""
+
+import asyncio
+import os
+import threading
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from typing import Any, Callable, Dict, Optional
+
+from fastapi import HTTPException
+
+
+class WorkerHTTPError(Exception):
+    """Picklable stand-in for HTTPException raised inside a worker process"""
+
+    def __init__(self, status_code: int, detail: Any):
+        super().__init__(status_code, detail)
+        self.status_code = status_code
+        self.detail = detail
+
+
+def _invoke(fn: Callable, args: tuple, kwargs: dict) -> Any:
+    # HTTPException does not survive pickling, so translate it at the process boundary
+    try:
+        return fn(*args, **kwargs)
+    except HTTPException as exc:
+        raise WorkerHTTPError(exc.status_code, exc.detail) from None
+
+
+class AnalysisExecutor:
+    """Bounded worker pool with admission control"""
+
+    def __init__(self, kind: str = "thread", workers: Optional[int] = None, max_queue: Optional[int] = None):
+        if kind not in ("thread", "process"):
+            raise ValueError(f"Unknown executor kind '{kind}'; use 'thread' or 'process'")
+        self.kind = kind
+        self.workers = workers or os.cpu_count() or 1
+        self.max_queue = self.workers * 4 if max_queue is None else max_queue
+        self.pending = 0
+        self.rejected = 0
+        self.completed = 0
+        self._lock = threading.Lock()
+        self._pool: Optional[Executor] = None
+
+    @property
+    def capacity(self) -> int:
+        """Tasks allowed in flight: one per worker plus the queue"""
+        return self.workers + self.max_queue
+
+    @property
+    def pool(self) -> Executor:
+        if self._pool is None:
+            if self.kind == "process":
+                self._pool = ProcessPoolExecutor(max_workers=self.workers)
+            else:
+                self._pool = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="analysis")
+        return self._pool
+
+    def try_acquire(self) -> bool:
+        with self._lock:
+            if self.pending >= self.capacity:
+                self.rejected += 1
+                return False
+            self.pending += 1
+            return True
+
+    def release(self):
+        with self._lock:
+            self.pending -= 1
+            self.completed += 1
+
+    async def run(self, fn: Callable, *args, **kwargs) -> Any:
+        """Run fn(*args, **kwargs) in the pool, or raise 429 if saturated"""
+        if not self.try_acquire():
+            raise HTTPException(
+                status_code=429,
+                detail="Analysis workers are saturated; retry shortly",
+                headers={"Retry-After": "1"}
+            )
+        try:
+            future = self.pool.submit(_invoke, fn, args, kwargs)
+        except Exception:
+            self.release()
+            raise
+        # The slot frees when the worker finishes, even if the awaiting task was cancelled
+        future.add_done_callback(lambda _: self.release())
+        try:
+            return await asyncio.wrap_future(future)
+        except WorkerHTTPError as exc:
+            raise HTTPException(status_code=exc.status_code, detail=exc.detail)
+
+    def stats(self) -> Dict:
+        return {
+            "kind": self.kind,
+            "workers": self.workers,
+            "max_queue": self.max_queue,
+            "pending": self.pending,
+            "completed": self.completed,
+            "rejected": self.rejected,
+        }
+
+    def shutdown(self):
+        if self._pool is not None:
+            self._pool.shutdown(wait=False, cancel_futures=True)
+            self._pool = None
+
+
+def create_executor() -> AnalysisExecutor:
+    """Build the executor from ANALYSIS_EXECUTOR, ANALYSIS_POOL_WORKERS and ANALYSIS_POOL_QUEUE"""
+    workers = os.environ.get("ANALYSIS_POOL_WORKERS")
+    max_queue = os.environ.get("ANALYSIS_POOL_QUEUE")
+    return AnalysisExecutor(
+        kind=os.environ.get("ANALYSIS_EXECUTOR", "thread"),
+        workers=int(workers) if workers else None,
+        max_queue=int(max_queue) if max_queue else None,
+    )
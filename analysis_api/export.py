@@ -0,0 +1,435 @@
+"""
+Streaming exports of stored analyses
+A stored result is flattened into two tables: summary, one row per result (or
+batch item) with nested fields as dotted columns, and series, one row per chart
+point. Every format writes those rows in chunks while the response is sent, so
+memory stays flat however long the series are and nothing touches the disk.
+"""
+
+from __future__ import annotations
+
+import importlib.util
+import io
+import zipfile
+from functools import lru_cache
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+from xml.sax.saxutils import escape
+
+import numpy as np
+
+from downsample import downsample_indices
+from lazy import lazy_import
+from serialization import dumps
+
+pd = lazy_import("pandas")
+jinja2 = lazy_import("jinja2")
+
+
+CHUNK_ROWS = 65_536
+SERIES_FIELDS = ("data_points", "point_ucl", "point_lcl", "point_index")
+SERIES_COLUMNS = ["item", "chart", "index", "value", "ucl", "lcl", "out_of_control"]
+TABLES = ("summary", "series")
+XLSX_MAX_ROWS = 1_048_576  # per sheet, including the header row
+XLSX_CHUNK_ROWS = 16_384  # cell XML is built as Python strings, so smaller pieces keep memory down
+REPORT_BUFFER = 1 << 16  # bytes of HTML per response chunk
+
+HAS_PYARROW = importlib.util.find_spec("pyarrow") is not None
+
+
+# ==================== TABLES ====================
+
+def grouped_table(record: Dict) -> Optional[Dict[str, Any]]:
+    """Columnar per-group table of a grouped result, or None"""
+    results = record["results"]
+    if isinstance(results, dict) and "group_by" in results and isinstance(results.get("table"), dict):
+        return results["table"]
+    return None
+
+
+def result_items(record: Dict) -> List[Any]:
+    """Rows of a result: each entry of a list result or batch, the rollup of a grouped result, else the result itself"""
+    results = record["results"]
+    if grouped_table(record) is not None:
+        results = results["overall"]
+    if isinstance(results, list):
+        return results
+    if isinstance(results, dict) and isinstance(results.get("items"), list):
+        return results["items"]
+    return [results]
+
+
+def flatten(value: Dict, prefix: str = "") -> Dict[str, Any]:
+    """Scalars keep their value, nested dicts become dotted columns, other lists become JSON text"""
+    row: Dict[str, Any] = {}
+    for key, item in value.items():
+        name = f"{prefix}{key}"
+        if key in SERIES_FIELDS:
+            continue
+        if isinstance(item, dict):
+            row.update(flatten(item, name + "."))
+        elif isinstance(item, (list, tuple, np.ndarray)):
+            row[name] = dumps(item).decode()
+        else:
+            row[name] = item
+    return row
+
+
+def summary_frame(record: Dict) -> pd.DataFrame:
+    """One row per result item, or per group (and column) for a grouped result"""
+    table = grouped_table(record)
+    if table is not None:
+        return pd.DataFrame(table)
+    rows = []
+    for item, value in enumerate(result_items(record)):
+        rows.append({"item": item, **(flatten(value) if isinstance(value, dict) else {"value": value})})
+    return pd.DataFrame(rows)
+
+
+def charts(record: Dict) -> Iterator[Tuple[int, str, Dict]]:
+    """(item, chart name, chart dict) for every chart with a series in the result"""
+    for item, value in enumerate(result_items(record)):
+        if isinstance(value, dict) and value.get("data_points") is not None:
+            yield item, "main", value
+            dispersion = value.get("dispersion")
+            if isinstance(dispersion, dict) and dispersion.get("data_points") is not None:
+                yield item, "dispersion", dispersion
+
+
+def chart_limits(chart: Dict, start: int, stop: int, count: int) -> Dict[str, np.ndarray]:
+    """ucl and lcl for points start:stop, per point when the chart has them"""
+    limits = {}
+    for key, field in (("ucl", "point_ucl"), ("lcl", "point_lcl")):
+        per_point = chart.get(field)
+        if per_point is not None:
+            limits[key] = np.asarray(per_point[start:stop], dtype=float)
+        else:
+            limits[key] = np.full(count, np.nan if chart.get(key) is None else float(chart[key]))
+    return limits
+
+
+def series_chunks(record: Dict, chunk_rows: int = CHUNK_ROWS) -> Iterator[pd.DataFrame]:
+    """Series table in frames of at most chunk_rows rows, built one frame at a time"""
+    for item, name, chart in charts(record):
+        values = chart["data_points"]
+        positions = chart.get("point_index")
+        ooc = np.asarray(chart.get("out_of_control_points") or [], dtype=np.int64)
+        for start in range(0, len(values), chunk_rows):
+            stop = min(start + chunk_rows, len(values))
+            index = np.asarray(positions[start:stop]) if positions is not None else np.arange(start, stop)
+            yield pd.DataFrame({
+                "item": item,
+                "chart": name,
+                "index": index,
+                "value": np.asarray(values[start:stop], dtype=float),
+                **chart_limits(chart, start, stop, stop - start),
+                "out_of_control": np.isin(index, ooc),
+            })
+
+
+def table_chunks(record: Dict, table: str) -> Iterator[pd.DataFrame]:
+    if table == "summary":
+        yield summary_frame(record)
+    else:
+        yield from series_chunks(record)
+
+
+class ChunkSink(io.RawIOBase):
+    """Write-only stream whose contents are taken out with drain()"""
+
+    def __init__(self):
+        self._chunks: List[bytes] = []
+        self._position = 0
+
+    def writable(self) -> bool:
+        return True
+
+    def write(self, data) -> int:
+        self._chunks.append(bytes(data))
+        self._position += len(data)
+        return len(data)
+
+    def tell(self) -> int:
+        return self._position
+
+    def drain(self) -> bytes:
+        data = b"".join(self._chunks)
+        self._chunks.clear()
+        return data
+
+
+# ==================== CSV ====================
+
+def csv_stream(record: Dict, table: str = "summary") -> Iterator[bytes]:
+    header = True
+    for frame in table_chunks(record, table):
+        yield csv_chunk(frame, header)
+        header = False
+    if header:
+        yield (",".join(SERIES_COLUMNS if table == "series" else ["item"]) + "\n").encode()
+
+
+def csv_chunk(frame: pd.DataFrame, header: bool) -> bytes:
+    """CSV text of a frame; pyarrow's writer is several times faster than pandas for long series"""
+    if HAS_PYARROW and not frame.empty:
+        import pyarrow as pa
+        import pyarrow.csv as pa_csv
+
+        sink = pa.BufferOutputStream()
+        options = pa_csv.WriteOptions(include_header=header, quoting_style="needed")
+        pa_csv.write_csv(arrow_table(frame), sink, options)
+        return sink.getvalue().to_pybytes()
+    return frame.to_csv(index=False, header=header).encode()
+
+
+# ==================== PARQUET ====================
+
+def arrow_table(frame: pd.DataFrame):
+    import pyarrow as pa
+
+    try:
+        return pa.Table.from_pandas(frame, preserve_index=False)
+    except (pa.ArrowInvalid, pa.ArrowTypeError):
+        # Columns mixing types (e.g. a field that is a number in one item and text in another)
+        mixed = {col: "string" for col in frame.columns if frame[col].dtype == object}
+        return pa.Table.from_pandas(frame.astype(mixed), preserve_index=False)
+
+
+def parquet_stream(record: Dict, table: str = "summary") -> Iterator[bytes]:
+    """One row group per chunk, written to the response as it is encoded"""
+    import pyarrow.parquet as pq
+
+    sink = ChunkSink()
+    writer: Optional[pq.ParquetWriter] = None
+    for frame in table_chunks(record, table):
+        chunk = arrow_table(frame)
+        if writer is None:
+            writer = pq.ParquetWriter(sink, chunk.schema)
+        writer.write_table(chunk.cast(writer.schema))
+        yield sink.drain()
+    if writer is None:
+        writer = pq.ParquetWriter(sink, arrow_table(pd.DataFrame(
+            {col: pd.Series(dtype=float) for col in (SERIES_COLUMNS if table == "series" else ["item"])})).schema)
+    writer.close()
+    yield sink.drain()
+
+
+# ==================== XLSX ====================
+
+XLSX_CONTENT_TYPES = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+    '<Types xmlns="http://schemas.openxmlformats.org/package/2006/content-types">'
+    '<Default Extension="rels" ContentType="application/vnd.openxmlformats-package.relationships+xml"/>'
+    '<Default Extension="xml" ContentType="application/xml"/>'
+    '<Override PartName="/xl/workbook.xml" '
+    'ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet.main+xml"/>'
+    '{sheets}</Types>'
+)
+XLSX_SHEET_TYPE = ('<Override PartName="/xl/worksheets/sheet{n}.xml" '
+                   'ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.worksheet+xml"/>')
+XLSX_ROOT_RELS = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+    '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+    '<Relationship Id="rId1" '
+    'Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/officeDocument" '
+    'Target="xl/workbook.xml"/></Relationships>'
+)
+XLSX_WORKBOOK = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+    '<workbook xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main" '
+    'xmlns:r="http://schemas.openxmlformats.org/officeDocument/2006/relationships">'
+    '<sheets>{sheets}</sheets></workbook>'
+)
+XLSX_WORKBOOK_RELS = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+    '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">{rels}</Relationships>'
+)
+XLSX_SHEET_HEAD = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+    '<worksheet xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main"><sheetData>'
+)
+XLSX_SHEET_TAIL = '</sheetData></worksheet>'
+
+
+def xlsx_cells(values) -> List[str]:
+    """Cell XML for one column; cells carry no references, so they fill in order"""
+    if values.dtype == bool:
+        return ['<c t="b"><v>1</v></c>' if v else '<c t="b"><v>0</v></c>' for v in values.tolist()]
+    if np.issubdtype(values.dtype, np.number):
+        cells = [f"<c><v>{v!r}</v></c>" for v in values.tolist()]
+        for i in np.nonzero(~np.isfinite(values))[0]:
+            cells[i] = "<c/>"
+        return cells
+    known: Dict[Any, str] = {}  # object columns repeat values (chart names, column names)
+    cells = []
+    for v in values:
+        cell = known.get(v) if isinstance(v, str) else None
+        if cell is None:
+            cell = xlsx_cell(v)
+            if isinstance(v, str):
+                known[v] = cell
+        cells.append(cell)
+    return cells
+
+
+def xlsx_cell(v: Any) -> str:
+    if v is None or isinstance(v, float) and not np.isfinite(v):
+        return "<c/>"
+    if isinstance(v, (bool, np.bool_)):
+        return f'<c t="b"><v>{int(v)}</v></c>'
+    if isinstance(v, (int, float, np.number)):
+        return f"<c><v>{v}</v></c>" if np.isfinite(v) else "<c/>"
+    return f'<c t="inlineStr"><is><t>{escape(str(v))}</t></is></c>'
+
+
+def xlsx_rows(frame: pd.DataFrame) -> str:
+    columns = [xlsx_cells(frame[col].to_numpy()) for col in frame.columns]
+    return "".join("<row>" + "".join(cells) + "</row>" for cells in zip(*columns))
+
+
+def xlsx_header(columns) -> str:
+    return "<row>" + "".join(f'<c t="inlineStr"><is><t>{escape(str(c))}</t></is></c>' for c in columns) + "</row>"
+
+
+def xlsx_sheets(archive: zipfile.ZipFile, sink: ChunkSink, record: Dict, table: str,
+                names: List[str]) -> Iterator[bytes]:
+    """Write one table as worksheets, starting a new sheet every XLSX_MAX_ROWS rows"""
+    part, rows, columns = None, 0, None
+    for frame in table_chunks(record, table):
+        columns = list(frame.columns) if columns is None else columns
+        for start in range(0, max(len(frame), 1), XLSX_CHUNK_ROWS):
+            piece = frame.iloc[start:start + XLSX_CHUNK_ROWS]
+            if part is None or rows + len(piece) > XLSX_MAX_ROWS:
+                if part is not None:
+                    part.write(XLSX_SHEET_TAIL.encode())
+                    part.close()
+                count = sum(1 for name in names if name.split(" ")[0] == table)
+                names.append(table if count == 0 else f"{table} {count + 1}")
+                part = archive.open(f"xl/worksheets/sheet{len(names)}.xml", "w", force_zip64=True)
+                part.write((XLSX_SHEET_HEAD + xlsx_header(columns)).encode())
+                rows = 1
+            part.write(xlsx_rows(piece).encode())
+            rows += len(piece)
+            yield sink.drain()
+    if part is not None:
+        part.write(XLSX_SHEET_TAIL.encode())
+        part.close()
+
+
+def xlsx_stream(record: Dict) -> Iterator[bytes]:
+    """
+    Workbook with a summary sheet and the series on as many sheets as its rows need
+    The zip is written sequentially (data descriptors, no seeking); the workbook
+    parts that list the sheets come last, once their number is known.
+    """
+    sink = ChunkSink()
+    names: List[str] = []
+    with zipfile.ZipFile(sink, "w", zipfile.ZIP_DEFLATED, compresslevel=1) as archive:
+        for table in TABLES:
+            yield from xlsx_sheets(archive, sink, record, table, names)
+        numbers = range(1, len(names) + 1)
+        archive.writestr("[Content_Types].xml", XLSX_CONTENT_TYPES.format(
+            sheets="".join(XLSX_SHEET_TYPE.format(n=n) for n in numbers)))
+        archive.writestr("_rels/.rels", XLSX_ROOT_RELS)
+        archive.writestr("xl/workbook.xml", XLSX_WORKBOOK.format(sheets="".join(
+            f'<sheet name="{escape(name)}" sheetId="{n}" r:id="rId{n}"/>' for n, name in zip(numbers, names))))
+        archive.writestr("xl/_rels/workbook.xml.rels", XLSX_WORKBOOK_RELS.format(rels="".join(
+            f'<Relationship Id="rId{n}" '
+            f'Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/worksheet" '
+            f'Target="worksheets/sheet{n}.xml"/>' for n in numbers)))
+    yield sink.drain()
+
+
+# ==================== REPORT ====================
+
+REPORT_POINTS = 1000  # chart points drawn per series; out-of-control points are always drawn
+
+REPORT_TEMPLATE = """<!DOCTYPE html>
+<html><head><meta charset="utf-8"><title>{{ record.analysis_type }} {{ record.analysis_id }}</title>
+<style>
+body { font-family: sans-serif; margin: 2em; color: #222; }
+table { border-collapse: collapse; margin-bottom: 1.5em; font-size: 0.85em; }
+th, td { border: 1px solid #ccc; padding: 0.25em 0.5em; text-align: left; }
+th { background: #f3f3f3; }
+svg { border: 1px solid #ddd; margin-bottom: 1.5em; }
+</style></head><body>
+<h1>{{ record.analysis_type }} analysis {{ record.analysis_id }}</h1>
+<table>
+<tr><th>Created</th><td>{{ record.timestamp }}</td></tr>
+{% for key, value in record.metadata.items() %}<tr><th>{{ key }}</th><td>{{ value }}</td></tr>
+{% endfor %}</table>
+<h2>Summary</h2>
+<table>
+<tr>{% for column in summary.columns %}<th>{{ column }}</th>{% endfor %}</tr>
+{% for row in summary.itertuples(index=False) %}<tr>{% for value in row %}<td>{{ cell(value) }}</td>{% endfor %}</tr>
+{% endfor %}</table>
+{% for chart in charts %}
+<h2>Item {{ chart.item }}{% if chart.column %} ({{ chart.column }}){% endif %}: {{ chart.chart_type }} {{ chart.name }} chart</h2>
+<p>{{ chart.total }} points{% if chart.drawn < chart.total %}, {{ chart.drawn }} drawn{% endif %};
+{{ chart.ooc }} out of control</p>
+<svg width="{{ width }}" height="{{ height }}" viewBox="0 0 {{ width }} {{ height }}">
+{% for name, y in chart.lines %}<line x1="0" x2="{{ width }}" y1="{{ y }}" y2="{{ y }}" stroke="{{ '#2a7' if name == 'center' else '#c33' }}" stroke-dasharray="4 3"/>
+{% endfor %}<polyline fill="none" stroke="#36c" stroke-width="1" points="{{ chart.points }}"/>
+{% for x, y in chart.flagged %}<circle cx="{{ x }}" cy="{{ y }}" r="3" fill="#c33"/>
+{% endfor %}</svg>
+{% endfor %}
+</body></html>
+"""
+
+@lru_cache(maxsize=None)
+def report_template():
+    return jinja2.Environment(autoescape=True).from_string(REPORT_TEMPLATE)
+
+
+def report_cell(value: Any) -> str:
+    if isinstance(value, float):
+        return "" if value != value else f"{value:.6g}"
+    return "" if value is None else str(value)
+
+
+def report_charts(record: Dict, width: int, height: int) -> Iterator[Dict]:
+    """SVG geometry per chart, drawn from at most REPORT_POINTS points"""
+    for item, name, chart in charts(record):
+        values = np.asarray(chart["data_points"], dtype=float)
+        index = np.asarray(chart["point_index"]) if chart.get("point_index") is not None else np.arange(len(values))
+        flagged = np.nonzero(np.isin(index, np.asarray(chart.get("out_of_control_points") or [], dtype=np.int64)))[0]
+        keep = downsample_indices(values, REPORT_POINTS, "minmax", flagged)
+        keep = keep[np.isfinite(values[keep])]
+        levels = {"center": chart.get("center_line"), "ucl": chart.get("ucl"), "lcl": chart.get("lcl")}
+        levels = {key: float(v) for key, v in levels.items() if v is not None and np.isfinite(v)}
+        bounds = list(levels.values()) + ([float(values[keep].min()), float(values[keep].max())] if len(keep) else [])
+        low, high = (min(bounds), max(bounds)) if bounds else (0.0, 1.0)
+        span = (high - low) or 1.0
+        last = max(int(index[-1]) if len(index) else 1, 1)
+
+        def xs(positions):
+            return np.round(width * index[positions] / last, 1).tolist()
+
+        def ys(levels):
+            return np.round(height - 10 - (height - 20) * (np.asarray(levels) - low) / span, 1).tolist()
+
+        yield {
+            "item": item,
+            "name": "" if name == "main" else name,
+            "column": chart.get("column"),
+            "chart_type": chart.get("chart_type", ""),
+            "total": len(values),
+            "drawn": len(keep),
+            "ooc": len(flagged),
+            "lines": list(zip(levels, ys(list(levels.values())))),
+            "points": " ".join(f"{x},{y}" for x, y in zip(xs(keep), ys(values[keep]))),
+            "flagged": list(zip(xs(flagged), ys(values[flagged]))),
+        }
+
+
+def report_stream(record: Dict, width: int = 900, height: int = 240) -> Iterator[bytes]:
+    """HTML report of the summary table and every chart, rendered as it is sent"""
+    pending, size = [], 0
+    for text in report_template().generate(
+            record=record, summary=summary_frame(record), charts=report_charts(record, width, height),
+            cell=report_cell, width=width, height=height):
+        pending.append(text)
+        size += len(text)
+        if size >= REPORT_BUFFER:
+            yield "".join(pending).encode()
+            pending, size = [], 0
+    yield "".join(pending).encode()
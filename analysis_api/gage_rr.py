@@ -0,0 +1,346 @@
+"""
+Measurement system analysis (Gage R&R)
+Each balanced study is laid out as a parts x operators x replicates cube
+(operators x parts-within-operator x replicates for a nested study), and studies
+of the same shape are stacked, so sums of squares, F tests and variance
+components for hundreds of studies come from a handful of array reductions.
+"""
+
+from __future__ import annotations
+
+from typing import Dict, List, Optional
+
+import numpy as np
+
+from control_charts import d2
+from lazy import lazy_import
+
+pd = lazy_import("pandas")
+stats = lazy_import("scipy.stats")
+
+
+DESIGNS = ("crossed", "nested")
+METHODS = ("anova", "xbar-r")
+
+# Minitab's default; an interaction with a larger p-value is pooled into repeatability
+INTERACTION_ALPHA = 0.05
+STUDY_VAR = 6.0  # study variation is this many standard deviations (5.15 in older AIAG editions)
+
+# AIAG guidance on %Tolerance (or %StudyVar without a tolerance)
+ACCEPTABLE_PCT = 10.0
+MARGINAL_PCT = 30.0
+
+
+# ==================== LAYOUT ====================
+
+def rank_within(codes: pd.Series, within: pd.Series) -> np.ndarray:
+    """Dense 0-based rank of codes inside each `within` group, in sorted order"""
+    return (codes - codes.groupby(within).transform("min")).to_numpy()
+
+
+def study_cubes(df: pd.DataFrame, part: str, operator: str, measurement: str, study: Optional[str],
+                design: str):
+    """
+    Balanced studies stacked into cubes by shape
+    Returns (study labels, {(a, b, r): (study indices, cube)}, {study index: error}),
+    where axis 1 is parts (crossed) or operators (nested).
+    """
+    columns = [part, operator, measurement] + ([study] if study else [])
+    data = df[list(dict.fromkeys(columns))].dropna()
+    values = pd.to_numeric(data[measurement], errors="coerce").to_numpy(dtype=float)
+    if study:
+        study_codes, labels = pd.factorize(data[study], sort=True)
+        labels = labels.tolist()
+    else:
+        study_codes, labels = np.zeros(len(data), dtype=np.int64), [None]
+    keys = pd.DataFrame({"study": study_codes, "part": data[part].to_numpy(), "operator": data[operator].to_numpy()})
+    outer, inner = ("part", "operator") if design == "crossed" else ("operator", "part")
+
+    outer_codes = pd.Series(keys.groupby(["study", outer], sort=True).ngroup().to_numpy())
+    a = rank_within(outer_codes, keys["study"])
+    inner_within = ["study"] if design == "crossed" else ["study", outer]
+    inner_codes = pd.Series(keys.groupby(inner_within + [inner], sort=True).ngroup().to_numpy())
+    b = rank_within(inner_codes, pd.Series(keys.groupby(inner_within, sort=True).ngroup().to_numpy()))
+    cells = keys.groupby(["study", outer, inner], sort=True)
+    r = cells.cumcount().to_numpy()
+
+    n_studies = len(labels)
+    shape = pd.DataFrame({"study": study_codes, "a": a, "b": b}).groupby("study").max() + 1
+    cell_counts = cells.size().groupby(level="study")
+    sizes = pd.DataFrame({
+        "a": shape["a"], "b": shape["b"],
+        "cells": cell_counts.size(), "r_min": cell_counts.min(), "r_max": cell_counts.max(),
+    }).reindex(range(n_studies))
+
+    errors: Dict[int, str] = {}
+    numeric = np.isfinite(values)
+    if not numeric.all():
+        for s in np.unique(study_codes[~numeric]):
+            errors[int(s)] = f"Column '{measurement}' must be numeric"
+    for s, row in sizes.iterrows():
+        if s in errors:
+            continue
+        if row.isna().any():
+            errors[s] = "No complete measurements"
+        elif row["cells"] != row["a"] * row["b"] or row["r_min"] != row["r_max"]:
+            errors[s] = "Study is unbalanced; every part needs the same number of measurements by each operator"
+        elif min(row["a"], row["b"]) < 2 or row["r_max"] < 2:
+            errors[s] = "Need at least 2 parts, 2 operators and 2 replicates"
+
+    good = sizes.drop(index=list(errors)).astype(int)
+    cubes = {}
+    for dims, members in good.groupby(["a", "b", "r_max"]).groups.items():
+        members = np.asarray(members)
+        local = np.full(n_studies, -1)
+        local[members] = np.arange(len(members))
+        rows = np.flatnonzero(local[study_codes] >= 0)
+        cube = np.empty((len(members),) + tuple(int(d) for d in dims))
+        cube[local[study_codes[rows]], a[rows], b[rows], r[rows]] = values[rows]
+        cubes[tuple(int(d) for d in dims)] = (members, cube)
+    return labels, cubes, errors
+
+
+# ==================== VARIANCE COMPONENTS ====================
+# Every function takes a stack of cubes (studies first) and returns per-study arrays.
+
+def anova_row(source: str, df, ss, ms=None, f=None, p=None) -> Dict:
+    return {"source": source, "df": int(df), "ss": ss, "ms": ms, "f": f, "p_value": p}
+
+
+def crossed_anova(cube: np.ndarray, interaction_alpha: float = INTERACTION_ALPHA) -> Dict:
+    """Two-way random-effects ANOVA with interaction, pooled when not significant"""
+    _, p, o, r = cube.shape
+    grand = cube.mean(axis=(1, 2, 3))[:, None]
+    cell = cube.mean(axis=3)
+    part_means, operator_means = cell.mean(axis=2), cell.mean(axis=1)
+    ss_part = o * r * ((part_means - grand) ** 2).sum(axis=1)
+    ss_operator = p * r * ((operator_means - grand) ** 2).sum(axis=1)
+    interaction = cell - part_means[:, :, None] - operator_means[:, None, :] + grand[:, :, None]
+    ss_interaction = r * (interaction ** 2).sum(axis=(1, 2))
+    ss_error = ((cube - cell[..., None]) ** 2).sum(axis=(1, 2, 3))
+    df_part, df_operator = p - 1, o - 1
+    df_interaction, df_error = df_part * df_operator, p * o * (r - 1)
+
+    with np.errstate(invalid="ignore", divide="ignore"):
+        ms_part, ms_operator = ss_part / df_part, ss_operator / df_operator
+        ms_interaction, ms_error = ss_interaction / df_interaction, ss_error / df_error
+        f_interaction = ms_interaction / ms_error
+        p_interaction = stats.f.sf(f_interaction, df_interaction, df_error)
+        keep = p_interaction <= interaction_alpha
+        ms_pooled = (ss_interaction + ss_error) / (df_interaction + df_error)
+        denominator = np.where(keep, ms_interaction, ms_pooled)
+        df_denominator = np.where(keep, df_interaction, df_interaction + df_error)
+        f_part, f_operator = ms_part / denominator, ms_operator / denominator
+        p_part = stats.f.sf(f_part, df_part, df_denominator)
+        p_operator = stats.f.sf(f_operator, df_operator, df_denominator)
+
+    components = {
+        "repeatability": np.where(keep, ms_error, ms_pooled),
+        "operator": np.maximum((ms_operator - denominator) / (p * r), 0.0),
+        "part*operator": np.where(keep, np.maximum((ms_interaction - ms_error) / r, 0.0), 0.0),
+        "part": np.maximum((ms_part - denominator) / (o * r), 0.0),
+    }
+    ss_total = ((cube - grand[:, :, None, None]) ** 2).sum(axis=(1, 2, 3))
+    tables = []
+    for s in range(cube.shape[0]):
+        rows = [anova_row("part", df_part, ss_part[s], ms_part[s], f_part[s], p_part[s]),
+                anova_row("operator", df_operator, ss_operator[s], ms_operator[s], f_operator[s], p_operator[s])]
+        if keep[s]:
+            rows += [anova_row("part*operator", df_interaction, ss_interaction[s], ms_interaction[s],
+                               f_interaction[s], p_interaction[s]),
+                     anova_row("repeatability", df_error, ss_error[s], ms_error[s])]
+        else:
+            rows.append(anova_row("repeatability", df_interaction + df_error, ss_interaction[s] + ss_error[s],
+                                  ms_pooled[s]))
+        rows.append(anova_row("total", p * o * r - 1, ss_total[s]))
+        tables.append({"anova": rows, "interaction_p_value": p_interaction[s], "interaction_removed": not keep[s]})
+    return {"components": components, "tables": tables}
+
+
+def nested_anova(cube: np.ndarray) -> Dict:
+    """Hierarchical ANOVA with parts nested within operators"""
+    _, o, p, r = cube.shape
+    grand = cube.mean(axis=(1, 2, 3))[:, None]
+    cell = cube.mean(axis=3)
+    operator_means = cell.mean(axis=2)
+    ss_operator = p * r * ((operator_means - grand) ** 2).sum(axis=1)
+    ss_part = r * ((cell - operator_means[:, :, None]) ** 2).sum(axis=(1, 2))
+    ss_error = ((cube - cell[..., None]) ** 2).sum(axis=(1, 2, 3))
+    df_operator, df_part, df_error = o - 1, o * (p - 1), o * p * (r - 1)
+
+    with np.errstate(invalid="ignore", divide="ignore"):
+        ms_operator, ms_part, ms_error = ss_operator / df_operator, ss_part / df_part, ss_error / df_error
+        f_operator, f_part = ms_operator / ms_part, ms_part / ms_error
+        p_operator = stats.f.sf(f_operator, df_operator, df_part)
+        p_part = stats.f.sf(f_part, df_part, df_error)
+
+    components = {
+        "repeatability": ms_error,
+        "operator": np.maximum((ms_operator - ms_part) / (p * r), 0.0),
+        "part": np.maximum((ms_part - ms_error) / r, 0.0),
+    }
+    ss_total = ss_operator + ss_part + ss_error
+    tables = [{"anova": [
+        anova_row("operator", df_operator, ss_operator[s], ms_operator[s], f_operator[s], p_operator[s]),
+        anova_row("part(operator)", df_part, ss_part[s], ms_part[s], f_part[s], p_part[s]),
+        anova_row("repeatability", df_error, ss_error[s], ms_error[s]),
+        anova_row("total", o * p * r - 1, ss_total[s]),
+    ]} for s in range(cube.shape[0])]
+    return {"components": components, "tables": tables}
+
+
+def xbar_r(cube: np.ndarray) -> Dict:
+    """Average and range method: repeatability from the average range, the rest from ranges of means"""
+    _, p, o, r = cube.shape
+    r_bar = (cube.max(axis=3) - cube.min(axis=3)).mean(axis=(1, 2))
+    repeatability = (r_bar / d2(r)) ** 2
+    operator_means, part_means = cube.mean(axis=(1, 3)), cube.mean(axis=(2, 3))
+    operator_range = operator_means.max(axis=1) - operator_means.min(axis=1)
+    part_range = part_means.max(axis=1) - part_means.min(axis=1)
+    components = {
+        "repeatability": repeatability,
+        "operator": np.maximum((operator_range / d2(o)) ** 2 - repeatability / (p * r), 0.0),
+        "part": (part_range / d2(p)) ** 2,
+    }
+    return {"components": components, "tables": [{} for _ in range(cube.shape[0])]}
+
+
+# ==================== SUMMARY ====================
+
+def component_table(components: Dict[str, np.ndarray], tolerance, study_var: float) -> Dict[str, np.ndarray]:
+    """Variance, %Contribution, StdDev, StudyVar, %StudyVar and %Tolerance of each source"""
+    reproducibility = components["operator"] + components.get("part*operator", 0.0)
+    gage = components["repeatability"] + reproducibility
+    sources = {
+        "total_gage_rr": gage,
+        "repeatability": components["repeatability"],
+        "reproducibility": reproducibility,
+        "operator": components["operator"],
+    }
+    if "part*operator" in components:
+        sources["part*operator"] = components["part*operator"]
+    sources["part_to_part"] = components["part"]
+    sources["total_variation"] = gage + components["part"]
+
+    total_var = sources["total_variation"]
+    total_sd = np.sqrt(total_var)
+    table = {}
+    with np.errstate(invalid="ignore", divide="ignore"):
+        for name, variance in sources.items():
+            sd = np.sqrt(variance)
+            table[name] = {
+                "variance": variance,
+                "contribution_pct": 100 * variance / total_var,
+                "std_dev": sd,
+                "study_var": study_var * sd,
+                "study_var_pct": 100 * sd / total_sd,
+                "tolerance_pct": 100 * study_var * sd / tolerance,
+            }
+    return table
+
+
+def assessment(pct: float) -> str:
+    if not np.isfinite(pct):
+        return "undetermined"
+    if pct < ACCEPTABLE_PCT:
+        return "acceptable"
+    return "marginal" if pct <= MARGINAL_PCT else "unacceptable"
+
+
+def finite(value, digits: int):
+    """Rounded float, or None for missing, NaN and infinite values"""
+    if value is None or not np.isfinite(value):
+        return None
+    return round(float(value), digits)
+
+
+def study_result(label, design: str, method: str, dims, table: Dict, extra: Dict, tolerance: float,
+                 s: int) -> Dict:
+    """Result dict of the study at position s of a stacked component table"""
+    a, b, r = dims
+    parts, operators = (a, b) if design == "crossed" else (b, a)
+    components = {
+        name: {
+            "variance": finite(values["variance"][s], 6),
+            "contribution_pct": finite(values["contribution_pct"][s], 2),
+            "std_dev": finite(values["std_dev"][s], 6),
+            "study_var": finite(values["study_var"][s], 6),
+            "study_var_pct": finite(values["study_var_pct"][s], 2),
+            "tolerance_pct": finite(values["tolerance_pct"][s], 2) if np.isfinite(tolerance) else None,
+        }
+        for name, values in table.items()
+        if not (name == "part*operator" and extra.get("interaction_removed"))
+    }
+    gage_sd, part_sd = float(table["total_gage_rr"]["std_dev"][s]), float(table["part_to_part"]["std_dev"][s])
+    ndc = max(int(np.floor(np.sqrt(2) * part_sd / gage_sd)), 1) if gage_sd > 0 else None
+    gage = components["total_gage_rr"]
+    judged = gage["tolerance_pct"] if gage["tolerance_pct"] is not None else gage["study_var_pct"]
+    result = {
+        "study": label,
+        "design": design,
+        "method": method,
+        "parts": parts,
+        "operators": operators,
+        "replicates": r,
+        "tolerance": float(tolerance) if np.isfinite(tolerance) else None,
+        "components": components,
+        "ndc": ndc,
+        "assessment": assessment(judged if judged is not None else np.nan),
+    }
+    if "anova" in extra:
+        result["anova"] = [
+            {**row, "ss": finite(row["ss"], 4), "ms": finite(row["ms"], 4), "f": finite(row["f"], 4),
+             "p_value": finite(row["p_value"], 6)}
+            for row in extra["anova"]
+        ]
+    if "interaction_removed" in extra:
+        result["interaction_p_value"] = finite(extra["interaction_p_value"], 6)
+        result["interaction_removed"] = bool(extra["interaction_removed"])
+    return result
+
+
+def gage_rr_studies(df: pd.DataFrame, part: str, operator: str, measurement: str, study: Optional[str] = None,
+                    design: str = "crossed", method: str = "anova", tolerance: Optional[float] = None,
+                    tolerance_column: Optional[str] = None, study_var: float = STUDY_VAR,
+                    interaction_alpha: float = INTERACTION_ALPHA) -> List[Dict]:
+    """
+    Gage R&R of every study in the dataset (one study when study is None)
+    Returns one dict per study, with an "error" key for studies that cannot be analyzed.
+    """
+    labels, cubes, errors = study_cubes(df, part, operator, measurement, study, design)
+    tolerances = np.full(len(labels), np.nan if tolerance is None else float(tolerance))
+    if tolerance_column:
+        # The first tolerance given in each study's rows
+        given = pd.to_numeric(df[tolerance_column], errors="coerce")
+        if study:
+            tolerances = given.groupby(df[study]).first().reindex(labels).to_numpy(dtype=float)
+        else:
+            tolerances[:] = given.dropna().iloc[0] if given.notna().any() else np.nan
+
+    results: List[Dict] = [None] * len(labels)
+    for s, message in errors.items():
+        results[s] = {"study": labels[s], "error": message}
+    for dims, (members, cube) in cubes.items():
+        if method == "xbar-r":
+            fitted = xbar_r(cube)
+        elif design == "crossed":
+            fitted = crossed_anova(cube, interaction_alpha)
+        else:
+            fitted = nested_anova(cube)
+        table = component_table(fitted["components"], tolerances[members], study_var)
+        for j, s in enumerate(members):
+            results[s] = study_result(labels[s], design, method, dims, table, fitted["tables"][j], tolerances[s], j)
+    return results
+
+
+def gage_rr_batch(df: pd.DataFrame, specs: List[Dict]) -> List[Dict]:
+    """Every study of every {part, operator, measurement, study, ...} spec, in spec then study order"""
+    items = []
+    for spec in specs:
+        needed = [spec[key] for key in ("study", "part", "operator", "measurement", "tolerance_column") if spec.get(key)]
+        missing = [col for col in needed if col not in df.columns]
+        if missing:
+            items.append({"study": None, "error": f"Column '{missing[0]}' not found"})
+        else:
+            items.extend(gage_rr_studies(df, **spec))
+    return items
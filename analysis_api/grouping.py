@@ -0,0 +1,277 @@
+"""
+Grouped (stratified) analyses
+Rows are coded by their group key once and sorted by that code, so every
+per-group statistic is a segment reduction (np.add.reduceat, bincount, or an
+index into the sorted array) over one array instead of a Python loop per group.
+Ten thousand groups cost little more than ten.
+"""
+
+from __future__ import annotations
+
+from dataclasses import dataclass
+from typing import Dict, List, Optional
+
+import numpy as np
+
+from capability import CAPABLE_CPK, capability_indices
+from control_charts import (
+    ATTRIBUTE_CHARTS, RULE_WINDOW, attribute_points, chart_constants, nelson_rules, parse_rules, subgroup_spread
+)
+from lazy import lazy_import
+
+pd = lazy_import("pandas")
+
+
+QUARTILES = (0.25, 0.5, 0.75)
+
+
+@dataclass
+class Groups:
+    keys: List[str]
+    labels: Dict[str, list]  # key column -> its value for each group, in group order
+    codes: np.ndarray  # group of each row; -1 where a key is missing
+    count: int
+
+    def table(self, repeat: int = 1) -> Dict[str, list]:
+        """Key columns of a table with `repeat` consecutive rows per group"""
+        if repeat == 1:
+            return dict(self.labels)
+        return {key: [value for value in values for _ in range(repeat)] for key, values in self.labels.items()}
+
+
+def parse_group_by(group_by: Optional[str]) -> List[str]:
+    """Comma-separated key columns, or [] when not grouping"""
+    return list(dict.fromkeys(key.strip() for key in (group_by or "").split(",") if key.strip()))
+
+
+def group_rows(df: pd.DataFrame, keys: List[str]) -> Groups:
+    """
+    Code every row by the combination of its key values, ordered by those values
+    Rows with a missing key belong to no group, as in pandas groupby; blank text
+    counts as missing, whichever reader parsed the file.
+    """
+    combined = np.zeros(len(df), dtype=np.int64)
+    missing = np.zeros(len(df), dtype=bool)
+    for key in keys:
+        codes, uniques = pd.factorize(df[key], sort=True)
+        blank = [i for i, value in enumerate(uniques) if isinstance(value, str) and not value.strip()]
+        missing |= (codes < 0) | np.isin(codes, blank)
+        combined = combined * len(uniques) + codes
+        # Re-densify after each key so the product of cardinalities never overflows
+        combined = np.unique(combined, return_inverse=True)[1].reshape(-1)
+    present = np.flatnonzero(~missing)
+    _, first, inverse = np.unique(combined[present], return_index=True, return_inverse=True)
+    codes = np.full(len(df), -1, dtype=np.int64)
+    codes[present] = inverse.reshape(-1)
+    rows = present[first]
+    labels = {key: df[key].iloc[rows].tolist() for key in keys}
+    return Groups(keys=keys, labels=labels, codes=codes, count=len(rows))
+
+
+def segment_starts(counts: np.ndarray) -> np.ndarray:
+    return np.concatenate([[0], np.cumsum(counts)[:-1]]).astype(np.int64)
+
+
+def grouped_sorted(values: np.ndarray, codes: np.ndarray, n_groups: int):
+    """
+    Values sorted by (group, value) with NaN last in each group
+    Returns the sorted values, each group's start and row count, and its count of valid values.
+    """
+    keep = codes >= 0
+    values, codes = values[keep], codes[keep]
+    order = np.lexsort((values, codes))
+    rows = np.bincount(codes, minlength=n_groups)
+    valid = np.bincount(codes, weights=~np.isnan(values), minlength=n_groups).astype(np.int64)
+    return values[order], segment_starts(rows), rows, valid
+
+
+def segment_sums(values: np.ndarray, starts: np.ndarray, rows: np.ndarray) -> np.ndarray:
+    """Sum of each non-empty segment (NaN counted as zero)"""
+    sums = np.zeros(len(starts))
+    nonempty = rows > 0
+    if values.size:
+        sums[nonempty] = np.add.reduceat(np.nan_to_num(values, nan=0.0), starts[nonempty])
+    return sums
+
+
+def sorted_quantiles(ordered: np.ndarray, starts: np.ndarray, valid: np.ndarray, q: float) -> np.ndarray:
+    """Linear-interpolation quantile (pandas' default) of each group's sorted valid values"""
+    position = q * np.maximum(valid - 1, 0)
+    low = np.floor(position).astype(np.int64)
+    high = np.minimum(low + 1, np.maximum(valid - 1, 0))
+    lower, upper = ordered[starts + low], ordered[starts + high]
+    return np.where(valid > 0, lower + (upper - lower) * (position - low), np.nan)
+
+
+def grouped_moments(values: np.ndarray, groups: Groups) -> Dict[str, np.ndarray]:
+    """Count, mean, sample variance, min, max and quartiles of one column for every group"""
+    # Every group has at least one row, so starts index real elements even where valid is 0
+    ordered, starts, rows, valid = grouped_sorted(values, groups.codes, groups.count)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        mean = segment_sums(ordered, starts, rows) / valid
+        resid = ordered - np.repeat(mean, rows)
+        variance = np.where(valid > 1, segment_sums(resid ** 2, starts, rows) / (valid - 1), np.nan)
+    moments = {
+        "count": valid,
+        "mean": mean,
+        "std": np.sqrt(variance),
+        "min": np.where(valid > 0, ordered[starts], np.nan),
+        "max": np.where(valid > 0, ordered[starts + np.maximum(valid - 1, 0)], np.nan),
+        "variance": variance,
+    }
+    for name, q in zip(("q1", "median", "q3"), QUARTILES):
+        moments[name] = sorted_quantiles(ordered, starts, valid, q)
+    return moments
+
+
+# ==================== ANALYSES ====================
+
+DESCRIPTIVE_FIELDS = ("count", "mean", "std", "min", "max", "median", "q1", "q3", "variance")
+
+
+def grouped_descriptive(df: pd.DataFrame, groups: Groups, columns: List[str]) -> Dict[str, object]:
+    """One row per (group, column), group-major, with the fields of /analyze/descriptive"""
+    stats = [grouped_moments(df[col].to_numpy(dtype=float), groups) for col in columns]
+    table = {**groups.table(len(columns)), "column": columns * groups.count}
+    for name in DESCRIPTIVE_FIELDS:
+        stacked = np.stack([s[name] for s in stats], axis=1).reshape(-1) if stats else np.empty(0)
+        table[name] = stacked.astype(np.int64) if name == "count" else np.round(stacked, 4)
+    return table
+
+
+def grouped_capability(df: pd.DataFrame, groups: Groups, column: str, usl: float, lsl: float) -> Dict[str, object]:
+    """Normal-theory capability indices of one column for every group"""
+    moments = grouped_moments(df[column].to_numpy(dtype=float), groups)
+    mean, std = moments["mean"], moments["std"]
+    with np.errstate(invalid="ignore", divide="ignore"):
+        indices = capability_indices(mean, np.where(std > 0, std, np.nan), usl, lsl)
+    table = {**groups.table(), "count": moments["count"], "mean": np.round(mean, 4), "std": np.round(std, 4)}
+    for name, digits in (("cp", 3), ("cpk", 3), ("cpu", 3), ("cpl", 3),
+                         ("ppm_above_usl", 1), ("ppm_below_lsl", 1), ("sigma_level", 2)):
+        table[name] = np.round(indices[name], digits)
+    table["capable"] = np.nan_to_num(indices["cpk"], nan=-np.inf) >= CAPABLE_CPK
+    return table
+
+
+def group_series(values: np.ndarray, sizes: np.ndarray, groups: Groups):
+    """Valid points in row order within each group, concatenated group by group"""
+    valid = (groups.codes >= 0) & ~np.isnan(values) & ~np.isnan(sizes)
+    rows = np.flatnonzero(valid)
+    rows = rows[np.argsort(groups.codes[rows], kind="stable")]
+    return values[rows], sizes[rows], groups.codes[rows]
+
+
+def padded_rules(points: np.ndarray, point_groups: np.ndarray, center, ucl, lcl, rules: List[int]) -> Dict[int, np.ndarray]:
+    """
+    Rule flags for every point of all groups' series in one nelson_rules call
+    Series are laid end to end with RULE_WINDOW NaN rows between them, which no
+    rule pattern can span, so no window mixes two groups.
+    """
+    position = np.arange(len(points)) + point_groups * RULE_WINDOW
+    length = (int(position[-1]) + 1) if len(points) else 0
+
+    def padded(values):
+        out = np.full((length, 1), np.nan)
+        out[position, 0] = np.broadcast_to(values, points.shape)
+        return out
+
+    flags = nelson_rules(padded(points), padded(center), padded(ucl), padded(lcl), np.array([length]), rules)
+    return {rule: hit[position, 0] for rule, hit in flags.items()}
+
+
+def grouped_chart_limits(chart_type: str, values: np.ndarray, sizes: np.ndarray, codes: np.ndarray,
+                         n_groups: int, n: int) -> Dict[str, np.ndarray]:
+    """Per-group limits from one concatenated series, with the plotted points and their group"""
+    counts = np.bincount(codes, minlength=n_groups)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        if chart_type == "imr":
+            k = chart_constants(2)
+            center = np.bincount(codes, weights=values, minlength=n_groups) / counts
+            same = codes[1:] == codes[:-1]
+            mr, mr_groups = np.abs(np.diff(values))[same], codes[1:][same]
+            mr_bar = np.bincount(mr_groups, weights=mr, minlength=n_groups) / (counts - 1)
+            sigma = mr_bar / k["d2"]
+            return {"points": values, "groups": codes, "counts": counts, "center": center,
+                    "ucl": center + 3 * sigma, "lcl": center - 3 * sigma, "sigma": sigma,
+                    "subgroup_size": np.ones(n_groups),
+                    "spread": mr, "spread_groups": mr_groups, "spread_center": mr_bar,
+                    "spread_ucl": k["D4"] * mr_bar, "spread_lcl": k["D3"] * mr_bar}
+
+        if chart_type in ATTRIBUTE_CHARTS:
+            if chart_type == "c":
+                sizes = np.ones(len(values))
+            total_size = np.bincount(codes, weights=sizes, minlength=n_groups)
+            rate = np.bincount(codes, weights=values, minlength=n_groups) / total_size
+            mean_size = total_size / counts
+            points, point_center, point_ucl, point_lcl = attribute_points(chart_type, values, sizes, rate[codes])
+            _, center, ucl, lcl = attribute_points(chart_type, rate, mean_size, rate)
+            return {"points": points, "groups": codes, "counts": counts, "center": center,
+                    "ucl": ucl, "lcl": lcl, "sigma": (ucl - center) / 3, "subgroup_size": mean_size,
+                    "point_center": point_center, "point_ucl": point_ucl, "point_lcl": point_lcl}
+
+        # Consecutive complete subgroups of n within each group; a trailing partial subgroup is dropped
+        k = chart_constants(n)
+        rank = np.arange(len(values)) - segment_starts(counts)[codes]
+        full = rank < (counts // n * n)[codes]
+        subgroups = values[full].reshape(-1, n)
+        sub_groups = codes[full][::n]
+        n_subgroups = np.bincount(sub_groups, minlength=n_groups)
+        xbar = subgroups.mean(axis=1)
+        spread = subgroup_spread(subgroups, chart_type)
+        center = np.bincount(sub_groups, weights=xbar, minlength=n_groups) / n_subgroups
+        spread_bar = np.bincount(sub_groups, weights=spread, minlength=n_groups) / n_subgroups
+        if chart_type == "xbar-r":
+            sigma, lower, upper = spread_bar / k["d2"], k["D3"], k["D4"]
+        else:
+            sigma, lower, upper = spread_bar / k["c4"], k["B3"], k["B4"]
+        width = 3 * sigma / np.sqrt(n)
+        return {"points": xbar, "groups": sub_groups, "counts": n_subgroups, "center": center,
+                "ucl": center + width, "lcl": center - width, "sigma": sigma,
+                "subgroup_size": np.full(n_groups, float(n)),
+                "spread": spread, "spread_groups": sub_groups, "spread_center": spread_bar,
+                "spread_ucl": upper * spread_bar, "spread_lcl": lower * spread_bar}
+
+
+def grouped_control_chart(df: pd.DataFrame, groups: Groups, column: str, chart_type: str, n: int,
+                          size_column: Optional[str] = None, rules=None) -> Dict[str, object]:
+    """Limits, out-of-control counts and rule-violation counts of one chart per group"""
+    rules = parse_rules(rules)
+    values = df[column].to_numpy(dtype=float)
+    sizes = df[size_column].to_numpy(dtype=float) if size_column else np.full(len(values), float(n))
+    values, sizes, codes = group_series(values, sizes, groups)
+    if chart_type in ("p", "np") and (values > sizes).any():
+        raise ValueError("Defective counts cannot exceed the sample size")
+
+    limits = grouped_chart_limits(chart_type, values, sizes, codes, groups.count, n)
+    points, point_groups = limits["points"], limits["groups"]
+    if "point_center" in limits:
+        center, ucl, lcl = limits["point_center"], limits["point_ucl"], limits["point_lcl"]
+    else:
+        center, ucl, lcl = (limits[name][point_groups] for name in ("center", "ucl", "lcl"))
+    flags = padded_rules(points, point_groups, center, ucl, lcl, sorted(set(rules) | {1}))
+
+    def per_group(hit):
+        return np.bincount(point_groups[hit], minlength=groups.count)
+
+    table = {
+        **groups.table(),
+        "points": limits["counts"],
+        "center_line": np.round(limits["center"], 4),
+        "ucl": np.round(limits["ucl"], 4),
+        "lcl": np.round(limits["lcl"], 4),
+        "sigma": np.round(limits["sigma"], 4),
+        "subgroup_size": np.round(limits["subgroup_size"], 2),
+        "out_of_control": per_group(flags[1]),
+    }
+    for rule in rules:
+        table[f"rule_{rule}"] = per_group(flags[rule])
+    if "spread" in limits:
+        spread, spread_groups = limits["spread"], limits["spread_groups"]
+        upper, lower = limits["spread_ucl"][spread_groups], limits["spread_lcl"][spread_groups]
+        table["dispersion_center_line"] = np.round(limits["spread_center"], 4)
+        table["dispersion_ucl"] = np.round(limits["spread_ucl"], 4)
+        table["dispersion_lcl"] = np.round(limits["spread_lcl"], 4)
+        table["dispersion_out_of_control"] = np.bincount(
+            spread_groups[(spread > upper) | (spread < lower)], minlength=groups.count
+        )
+    return table
@@ -0,0 +1,316 @@
+"""
+Background jobs for long-running analyses
+An analysis submitted in job mode runs as an asyncio task; clients poll
+/jobs/{job_id} or follow /jobs/{job_id}/events until it finishes. With the
+SQLite backend every worker on the host sees every job: the worker running a
+job mirrors its state into a shared table and picks up cancellations from it.
+"""
+
+import asyncio
+import json
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from dataclasses import dataclass, field
+from datetime import datetime
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+
+from fastapi import HTTPException
+
+
+TERMINAL_STATES = ("completed", "failed", "cancelled")
+
+# An analysis coroutine receives a progress callback, progress(stage, fraction),
+# and returns a response carrying the stored analysis_id
+ProgressCallback = Callable[[str, float], None]
+AnalysisRunner = Callable[[ProgressCallback], Awaitable[Any]]
+
+
+@dataclass
+class Job:
+    job_id: str
+    client_id: str
+    analysis_type: str
+    status: str = "queued"
+    stage: str = "queued"
+    progress: float = 0.0
+    analysis_id: Optional[str] = None
+    error: Optional[Any] = None
+    created: str = field(default_factory=lambda: datetime.now().isoformat())
+    finished: Optional[str] = None
+    finished_at: Optional[float] = None
+    version: int = 0
+    task: Optional[asyncio.Task] = field(default=None, repr=False)
+    changed: asyncio.Event = field(default_factory=asyncio.Event, repr=False)
+    listener: Optional[Callable[["Job"], None]] = field(default=None, repr=False)
+
+    @property
+    def done(self) -> bool:
+        return self.status in TERMINAL_STATES
+
+    def update(self, stage: str, progress: float, status: str = "running"):
+        self.status = status
+        self.stage = stage
+        self.progress = round(progress, 3)
+        self.version += 1
+        self.changed.set()
+        self.changed.clear()
+        if self.listener is not None:
+            self.listener(self)
+
+    def summary(self) -> Dict:
+        return {
+            "job_id": self.job_id,
+            "analysis_type": self.analysis_type,
+            "status": self.status,
+            "stage": self.stage,
+            "progress": self.progress,
+            "analysis_id": self.analysis_id,
+            "error": self.error,
+            "created": self.created,
+            "finished": self.finished,
+        }
+
+
+class JobManager:
+    """Tracks analysis jobs and caps concurrent jobs per client"""
+
+    def __init__(self, max_per_client: int = 4, ttl_seconds: float = 3600):
+        self.max_per_client = max_per_client
+        self.ttl_seconds = ttl_seconds
+        self._jobs: Dict[str, Job] = {}
+
+    def get(self, job_id: str) -> Job:
+        job = self._jobs.get(job_id)
+        if job is None:
+            raise HTTPException(status_code=404, detail="Job not found")
+        return job
+
+    def list(self, client_id: Optional[str] = None) -> List[Dict]:
+        return [
+            job.summary() for job in self._jobs.values()
+            if client_id is None or job.client_id == client_id
+        ]
+
+    def active_count(self, client_id: str) -> int:
+        return sum(1 for job in self._jobs.values() if job.client_id == client_id and not job.done)
+
+    def submit(self, client_id: str, analysis_type: str, runner: AnalysisRunner) -> Job:
+        """Start runner in the background, or raise 429 if the client is at its cap"""
+        self._prune()
+        if self.active_count(client_id) >= self.max_per_client:
+            raise HTTPException(
+                status_code=429,
+                detail=f"Client already has {self.max_per_client} active jobs",
+                headers={"Retry-After": "5"}
+            )
+        job = Job(job_id=uuid.uuid4().hex[:12], client_id=client_id, analysis_type=analysis_type)
+        self._jobs[job.job_id] = job
+        self._track(job)
+        job.task = asyncio.create_task(self._run(job, runner))
+        return job
+
+    def _track(self, job: Job):
+        """Hook for backends that mirror jobs outside this process"""
+
+    async def events(self, job_id: str, heartbeat: float = 15.0):
+        """Yield job snapshots as they change, ending once the job is finished"""
+        job = self.get(job_id)
+        seen = -1
+        while True:
+            if job.version != seen:
+                seen = job.version
+                yield job.summary()
+                if job.done:
+                    return
+            try:
+                await asyncio.wait_for(job.changed.wait(), timeout=heartbeat)
+            except asyncio.TimeoutError:
+                yield job.summary()
+
+    def cancel(self, job_id: str) -> Job:
+        job = self.get(job_id)
+        if not job.done and job.task is not None:
+            job.task.cancel()
+        return job
+
+    async def _run(self, job: Job, runner: AnalysisRunner):
+        try:
+            response = await runner(job.update)
+            job.analysis_id = response.analysis_id
+            self._finish(job, "completed", stage="done", progress=1.0)
+        except asyncio.CancelledError:
+            self._finish(job, "cancelled")
+        except HTTPException as exc:
+            job.error = exc.detail
+            self._finish(job, "failed")
+        except Exception as exc:
+            job.error = f"{type(exc).__name__}: {exc}"
+            self._finish(job, "failed")
+
+    def _finish(self, job: Job, status: str, stage: Optional[str] = None, progress: Optional[float] = None):
+        job.finished = datetime.now().isoformat()
+        job.finished_at = time.monotonic()
+        job.update(stage or job.stage, job.progress if progress is None else progress, status=status)
+
+    def _prune(self):
+        cutoff = time.monotonic() - self.ttl_seconds
+        expired = [
+            job_id for job_id, job in self._jobs.items()
+            if job.finished_at is not None and job.finished_at < cutoff
+        ]
+        for job_id in expired:
+            del self._jobs[job_id]
+
+
+class SharedJobManager(JobManager):
+    """
+    Jobs mirrored into a WAL-mode SQLite table shared by every worker on the host
+    Jobs run in the worker that accepted them; any worker can report, follow or
+    cancel them. A cancel received by another worker is flagged in the table and
+    applied by the owner within poll_seconds. Rows of jobs whose worker stopped
+    updating them for ttl_seconds no longer count against the per-client cap.
+    """
+
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS jobs (
+            job_id TEXT PRIMARY KEY,
+            client_id TEXT NOT NULL,
+            owner INTEGER NOT NULL,
+            done INTEGER NOT NULL,
+            cancel INTEGER NOT NULL DEFAULT 0,
+            version INTEGER NOT NULL,
+            updated REAL NOT NULL,
+            summary TEXT NOT NULL
+        );
+        CREATE INDEX IF NOT EXISTS jobs_client ON jobs (client_id, done);
+        CREATE INDEX IF NOT EXISTS jobs_owner ON jobs (owner, cancel, done);
+    """
+
+    def __init__(self, path: str, max_per_client: int = 4, ttl_seconds: float = 3600,
+                 poll_seconds: float = 1.0):
+        super().__init__(max_per_client, ttl_seconds)
+        self.path = path
+        self.poll_seconds = poll_seconds
+        self.owner = os.getpid()
+        self._local = threading.local()
+        self._watcher: Optional[asyncio.Task] = None
+        with self._connect() as conn:
+            conn.executescript(self.SCHEMA)
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def _row(self, job_id: str) -> Optional[tuple]:
+        return self._connect().execute(
+            "SELECT version, summary, client_id FROM jobs WHERE job_id = ?", (job_id,)
+        ).fetchone()
+
+    def _track(self, job: Job):
+        job.listener = self._save
+        self._save(job)
+        if self._watcher is None or self._watcher.done():
+            self._watcher = asyncio.create_task(self._watch())
+
+    def _save(self, job: Job):
+        with self._connect() as conn:
+            conn.execute(
+                "INSERT INTO jobs (job_id, client_id, owner, done, version, updated, summary) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?) ON CONFLICT (job_id) DO UPDATE SET "
+                "done = excluded.done, version = excluded.version, updated = excluded.updated, "
+                "summary = excluded.summary",
+                (job.job_id, job.client_id, self.owner, int(job.done), job.version, time.time(),
+                 json.dumps(job.summary(), default=str))
+            )
+
+    def get(self, job_id: str) -> Job:
+        """The local job, or a detached snapshot of a job owned by another worker"""
+        job = self._jobs.get(job_id)
+        if job is not None:
+            return job
+        row = self._row(job_id)
+        if row is None:
+            raise HTTPException(status_code=404, detail="Job not found")
+        version, summary, client = row
+        summary = json.loads(summary)
+        summary.pop("job_id")
+        return Job(job_id=job_id, client_id=client, version=version, **summary)
+
+    def list(self, client_id: Optional[str] = None) -> List[Dict]:
+        query, params = "SELECT summary FROM jobs", ()
+        if client_id is not None:
+            query, params = query + " WHERE client_id = ?", (client_id,)
+        return [json.loads(summary) for summary, in self._connect().execute(query + " ORDER BY rowid", params)]
+
+    def active_count(self, client_id: str) -> int:
+        return self._connect().execute(
+            "SELECT COUNT(*) FROM jobs WHERE client_id = ? AND done = 0 AND updated > ?",
+            (client_id, time.time() - self.ttl_seconds)
+        ).fetchone()[0]
+
+    async def events(self, job_id: str, heartbeat: float = 15.0):
+        """Follow a local job by its events, a remote one by polling the shared table"""
+        if job_id in self._jobs:
+            async for snapshot in super().events(job_id, heartbeat):
+                yield snapshot
+            return
+        job = self.get(job_id)
+        seen, waited = job.version, 0.0
+        yield job.summary()
+        while not job.done:
+            await asyncio.sleep(self.poll_seconds)
+            waited += self.poll_seconds
+            job = self.get(job_id)
+            if job.version != seen or waited >= heartbeat:
+                seen, waited = job.version, 0.0
+                yield job.summary()
+
+    def cancel(self, job_id: str) -> Job:
+        if job_id in self._jobs:
+            return super().cancel(job_id)
+        job = self.get(job_id)
+        if not job.done:
+            with self._connect() as conn:
+                conn.execute("UPDATE jobs SET cancel = 1 WHERE job_id = ?", (job_id,))
+        return job
+
+    async def _watch(self):
+        """Apply cancellations flagged by other workers while this worker has running jobs"""
+        while any(not job.done for job in self._jobs.values()):
+            await asyncio.sleep(self.poll_seconds)
+            flagged = self._connect().execute(
+                "SELECT job_id FROM jobs WHERE owner = ? AND cancel = 1 AND done = 0", (self.owner,)
+            ).fetchall()
+            for job_id, in flagged:
+                if job_id in self._jobs:
+                    super().cancel(job_id)
+
+    def _prune(self):
+        super()._prune()
+        with self._connect() as conn:
+            conn.execute("DELETE FROM jobs WHERE updated < ? AND (done = 1 OR updated < ?)",
+                         (time.time() - self.ttl_seconds, time.time() - 2 * self.ttl_seconds))
+
+
+def create_job_manager() -> JobManager:
+    """
+    Build the job manager from ANALYSIS_JOB_STORE (memory or sqlite), ANALYSIS_JOB_DB,
+    ANALYSIS_MAX_JOBS_PER_CLIENT and ANALYSIS_JOB_TTL_SECONDS
+    """
+    backend = os.environ.get("ANALYSIS_JOB_STORE", "memory")
+    max_per_client = int(os.environ.get("ANALYSIS_MAX_JOBS_PER_CLIENT", 4))
+    ttl_seconds = float(os.environ.get("ANALYSIS_JOB_TTL_SECONDS", 3600))
+    if backend == "memory":
+        return JobManager(max_per_client=max_per_client, ttl_seconds=ttl_seconds)
+    if backend == "sqlite":
+        return SharedJobManager(os.environ.get("ANALYSIS_JOB_DB", "analysis_jobs.db"),
+                                max_per_client=max_per_client, ttl_seconds=ttl_seconds)
+    raise ValueError(f"Unknown ANALYSIS_JOB_STORE '{backend}'; use 'memory' or 'sqlite'")
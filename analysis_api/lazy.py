@@ -0,0 +1,60 @@
+"""
+Deferred imports of heavy dependencies
+pandas, SciPy and Jinja2 account for most of the API's import time. Modules bind
+them through lazy_import, which returns a stand-in that imports the real module
+on first attribute access, so the server starts quickly and the first request
+that needs a library pays for loading it - or warm_up does, ahead of traffic.
+"""
+
+import importlib
+import threading
+import time
+from types import ModuleType
+from typing import Dict
+
+
+_modules: Dict[str, "LazyModule"] = {}
+_lock = threading.RLock()
+
+
+class LazyModule(ModuleType):
+    """Stand-in for a module that is imported on first attribute access"""
+
+    def __getattr__(self, attr: str):
+        return getattr(load(self), attr)
+
+
+def lazy_import(name: str) -> ModuleType:
+    """Module name, imported when one of its attributes is first used"""
+    with _lock:
+        if name not in _modules:
+            _modules[name] = LazyModule(name)
+        return _modules[name]
+
+
+def load(module: ModuleType) -> ModuleType:
+    """Import the module behind a stand-in; later lookups hit the stand-in's own namespace"""
+    real = module.__dict__.get("__wrapped__")
+    if real is None:
+        with _lock:  # one import per module even when threads race for it
+            real = module.__dict__.get("__wrapped__")
+            if real is None:
+                real = importlib.import_module(module.__name__)
+                module.__dict__.update(real.__dict__)
+                module.__dict__["__wrapped__"] = real
+    return real
+
+
+def loaded() -> Dict[str, bool]:
+    """Whether each lazily imported module has been loaded yet"""
+    return {name: "__wrapped__" in module.__dict__ for name, module in _modules.items()}
+
+
+def warm_up() -> Dict[str, float]:
+    """Import every lazily imported module now; seconds spent per module, 0 for those already loaded"""
+    seconds = {}
+    for name, module in list(_modules.items()):
+        start = time.perf_counter()
+        load(module)
+        seconds[name] = round(time.perf_counter() - start, 4)
+    return seconds
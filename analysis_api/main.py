@@ -3,20 +3,50 @@ Six Sigma Analysis API
 FastAPI backend for automated statistical analysis
 """
 
-from fastapi import FastAPI, UploadFile, File, Form, HTTPException
+from __future__ import annotations
+
+from fastapi import FastAPI, UploadFile, File, Form, HTTPException, Request
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import JSONResponse, FileResponse
+from fastapi.responses import JSONResponse, PlainTextResponse, Response, StreamingResponse
 from pydantic import BaseModel
-from typing import Optional, List, Dict, Any
-import pandas as pd
+from typing import Optional, List, Dict, Any, Tuple, Union
 import numpy as np
-from scipy import stats
-import statsmodels.api as sm
-import statsmodels.formula.api as smf
-from io import BytesIO
+import base64
+import functools
+import hashlib
+import inspect
 import json
+import os
+import tempfile
+import time
 import uuid
+import weakref
 from datetime import datetime
+from starlette.concurrency import run_in_threadpool
+from starlette.routing import Match
+
+from batch import control_chart_batch, ttest_batch
+from capability import DEFAULT_RESAMPLES, MAX_SEED, capability_batch, check_seed
+from chart_store import baseline_chart, create_chart_store
+from dataset_store import DatasetEntry, content_digest, create_dataset_store, file_digest
+from distributions import fit_cache
+from engine import (
+    COLUMNAR_FORMATS, HAS_PYARROW, BatchResult, capability_results, check_capability_grouping, check_chunk_rows,
+    compute_descriptive_streaming, compute_regression_streaming, control_chart_results, descriptive_results,
+    doe_results, gage_rr_results, gage_rr_spec, parse_content, regression_formula, regression_results,
+    ttest_results
+)
+from export import TABLES as EXPORT_TABLES, csv_stream, parquet_stream, report_stream, xlsx_stream
+from downsample import METHODS as DOWNSAMPLE_METHODS, downsample_results
+from execution import create_executor
+from gage_rr import gage_rr_batch
+from grouping import parse_group_by
+from jobs import ProgressCallback, create_job_manager
+from lazy import loaded, warm_up
+from memo import create_memo, etag_matches, memo_key
+from metrics import RequestTimings, bytes_parsed, current_timings, registry, request_seconds, requests_total, rows_processed, stage
+from result_store import create_result_store
+from serialization import ETAG_SUFFIX, encoded_response, negotiate
 
 app = FastAPI(
     title="Six Sigma Analysis API",
@@ -33,66 +63,118 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-# In-memory storage for analysis results
-analysis_store: Dict[str, Dict] = {}
+# Multi-worker mode: N processes on one host share datasets (memory-mapped files),
+# results, jobs and live charts (SQLite); explicit ANALYSIS_*_STORE settings win
+WORKERS = int(os.environ.get("ANALYSIS_WORKERS", 1))
+SHARED_BACKENDS = {
+    "ANALYSIS_DATASET_STORE": "shared",
+    "ANALYSIS_RESULT_STORE": "sqlite",
+    "ANALYSIS_JOB_STORE": "sqlite",
+    "ANALYSIS_CHART_STORE": "sqlite",
+}
+if WORKERS > 1:
+    for name, value in SHARED_BACKENDS.items():
+        os.environ.setdefault(name, value)
+
+# Analysis results, bounded by size and TTL (memory or SQLite backend)
+analysis_store = create_result_store()
+
+# Parsed uploads, keyed by content hash (dataset_id)
+dataset_store = create_dataset_store()
+
+# Worker pool for parsing and statistics, keeps the event loop responsive
+executor = create_executor()
+
+# Background analyses submitted with mode=job
+jobs = create_job_manager()
+
+# Live control charts with frozen phase I limits
+charts = create_chart_store()
+
+# Responses of repeated analyses, keyed by dataset hash, analysis and parameters
+memo = create_memo()
+
+# pandas, SciPy and Jinja2 load on first use; ANALYSIS_WARMUP=1 loads them before serving
+WARMUP = os.environ.get("ANALYSIS_WARMUP", "0") == "1"
+
+@app.on_event("startup")
+async def warm_up_modules():
+    # Before the first request, so process pool workers forked later inherit the loaded modules
+    if WARMUP:
+        await run_in_threadpool(warm_up)
+
+@app.on_event("shutdown")
+async def shutdown_executor():
+    executor.shutdown()
+
+# ==================== METRICS ====================
+
+def route_template(scope: Dict) -> str:
+    """Path template of the matching route (e.g. /results/{analysis_id}), to keep label cardinality low"""
+    for route in app.router.routes:
+        match, _ = route.matches(scope)
+        if match == Match.FULL:
+            return getattr(route, "path", scope["path"])
+    return "unmatched"
+
+def cache_gauges(caches: Dict[str, Dict]) -> Dict:
+    """(cache, result) -> lookups for stats dicts with hits and misses"""
+    values = {}
+    for name, stats_ in caches.items():
+        values[(name, "hit")] = stats_["hits"]
+        values[(name, "miss")] = stats_["misses"]
+    return values
+
+def cache_ratios(caches: Dict[str, Dict]) -> Dict:
+    values = {}
+    for name, stats_ in caches.items():
+        lookups = stats_["hits"] + stats_["misses"]
+        values[(name,)] = stats_["hits"] / lookups if lookups else None
+    return values
+
+def cache_stats() -> Dict[str, Dict]:
+    return {"datasets": dataset_store.stats(), "memo": memo.stats(), "distribution_fits": fit_cache.stats()}
+
+registry.gauge("analysis_result_store_entries", "Stored analysis results",
+               lambda: {(): analysis_store.usage()[0]})
+registry.gauge("analysis_result_store_bytes", "Serialized size of stored results",
+               lambda: {(): analysis_store.usage()[1]})
+registry.gauge("analysis_dataset_cache_entries", "Cached parsed datasets",
+               lambda: {(): dataset_store.stats()["datasets"]})
+registry.gauge("analysis_dataset_cache_bytes", "In-memory size of cached datasets",
+               lambda: {(): dataset_store.stats()["bytes"]})
+registry.gauge("analysis_cache_lookups", "Cache lookups by cache and result",
+               lambda: cache_gauges(cache_stats()), ("cache", "result"))
+registry.gauge("analysis_cache_hit_ratio", "Fraction of cache lookups that hit",
+               lambda: cache_ratios(cache_stats()), ("cache",))
+registry.gauge("analysis_executor_pending", "Tasks running or queued in the worker pool",
+               lambda: {(): executor.pending})
+registry.gauge("analysis_live_charts", "Live control charts", lambda: {(): len(charts)})
+
+@app.middleware("http")
+async def record_metrics(request: Request, call_next):
+    """Count and time every request and report its stages in a Server-Timing header"""
+    endpoint = route_template(request.scope)
+    timings = RequestTimings(endpoint)
+    token = current_timings.set(timings)
+    start = time.perf_counter()
+    status_code = 500
+    try:
+        response = await call_next(request)
+        status_code = response.status_code
+    finally:
+        elapsed = time.perf_counter() - start
+        current_timings.reset(token)
+        requests_total.inc(endpoint, request.method, str(status_code))
+        request_seconds.observe(elapsed, endpoint)
+    response.headers["Server-Timing"] = timings.server_timing(elapsed)
+    return response
 
 # ==================== MODELS ====================
 
-class DescriptiveResult(BaseModel):
-    column: str
-    count: int
-    mean: float
-    std: float
-    min: float
-    max: float
-    median: float
-    q1: float
-    q3: float
-    variance: float
-
-class CapabilityResult(BaseModel):
-    column: str
-    usl: float
-    lsl: float
-    target: Optional[float]
-    mean: float
-    std: float
-    cp: float
-    cpk: float
-    cpu: float
-    cpl: float
-    ppm_above_usl: float
-    ppm_below_lsl: float
-    sigma_level: float
-    capable: bool
-
-class RegressionResult(BaseModel):
-    r_squared: float
-    adj_r_squared: float
-    f_statistic: float
-    f_pvalue: float
-    coefficients: Dict[str, Dict[str, float]]
-    residual_std_error: float
-    observations: int
-
-class TTestResult(BaseModel):
-    test_type: str
-    t_statistic: float
-    p_value: float
-    df: float
-    mean_difference: Optional[float]
-    confidence_interval: List[float]
-    significant: bool
-    alpha: float
-
-class ControlChartResult(BaseModel):
-    chart_type: str
-    center_line: float
-    ucl: float
-    lcl: float
-    subgroup_size: int
-    out_of_control_points: List[int]
-    data_points: List[float]
+class ChartPoints(BaseModel):
+    values: List[float]  # measurements, or defective/defect counts for attribute charts
+    sizes: Optional[List[float]] = None  # sample sizes for charts created with a size_column
 
 class AnalysisResponse(BaseModel):
     analysis_id: str
@@ -103,35 +185,281 @@ class AnalysisResponse(BaseModel):
 
 # ==================== UTILITIES ====================
 
-def parse_file(file: UploadFile) -> pd.DataFrame:
-    """Parse uploaded CSV or Excel file"""
-    content = file.file.read()
-    file.file.seek(0)
+async def ingest_content(content: Union[bytes, str], filename: str, columns: Optional[List[str]] = None,
+                         dataset_id: Optional[str] = None) -> DatasetEntry:
+    """
+    Parse an upload, as bytes or a spooled file, once and cache it under its content hash
+    With columns, only those not already cached are parsed (as floats) and merged in.
+    """
+    if dataset_id is None:
+        dataset_id = (await run_in_threadpool(file_digest if isinstance(content, str) else content_digest, content))[:16]
     
-    if file.filename.endswith('.csv'):
-        df = pd.read_csv(BytesIO(content))
-    elif file.filename.endswith(('.xlsx', '.xls')):
-        df = pd.read_excel(BytesIO(content))
-    else:
-        raise HTTPException(status_code=400, detail="Unsupported file format. Use CSV or Excel.")
+    entry = dataset_store.get(dataset_id)
+    if entry is not None and (entry.complete or columns is not None and set(columns) <= set(entry.df.columns)):
+        return entry
+    
+    bytes_parsed.inc(amount=len(content) if isinstance(content, bytes) else os.path.getsize(content))
+    columnar = filename.endswith(COLUMNAR_FORMATS)  # already one array per column, possibly memory-mapped
+    if columns is None:
+        with stage("parse"):
+            df = await executor.run(parse_content, content, filename)
+        return await run_in_threadpool(dataset_store.put, dataset_id, filename, df, columnar=columnar)
     
-    return df
+    missing = [col for col in columns if entry is None or col not in entry.df.columns]
+    with stage("parse"):
+        df = await executor.run(parse_content, content, filename, missing, missing)
+    return await run_in_threadpool(dataset_store.extend, dataset_id, filename, df, columnar=columnar)
 
-def store_result(analysis_type: str, results: Any, metadata: Dict = None) -> str:
-    """Store analysis results and return ID"""
-    analysis_id = str(uuid.uuid4())[:8]
-    analysis_store[analysis_id] = {
+async def ingest_file(file: UploadFile) -> DatasetEntry:
+    """Parse an upload once and cache it under its content hash"""
+    path, digest = await spool_hashed(file)
+    try:
+        return await ingest_content(path, file.filename, dataset_id=digest)
+    finally:
+        remove_file(path)
+
+def copy_upload(file: UploadFile, hasher=None) -> str:
+    """Copy an upload to a named temporary file in 1 MB blocks, feeding hasher on the way"""
+    suffix = os.path.splitext(file.filename or "")[1]
+    with tempfile.NamedTemporaryFile(delete=False, suffix=suffix) as out:
+        file.file.seek(0)
+        while block := file.file.read(1 << 20):
+            if hasher is not None:
+                hasher.update(block)
+            out.write(block)
+        return out.name
+
+async def spool_upload(file: UploadFile) -> str:
+    """Copy an upload to a named temporary file; the caller removes it"""
+    return await run_in_threadpool(copy_upload, file)
+
+async def spool_hashed(file: UploadFile) -> Tuple[str, str]:
+    """Spool an upload to disk and hash it in the same pass; returns (path, dataset_id)"""
+    hasher = hashlib.sha256()
+    path = await run_in_threadpool(copy_upload, file, hasher)
+    return path, hasher.hexdigest()[:16]
+
+def remove_file(path: str):
+    try:
+        os.remove(path)
+    except OSError:
+        pass
+
+class DatasetSource:
+    """Analysis input resolved lazily, so job mode can parse after the request returns"""
+    
+    def __init__(self, dataset_id: Optional[str] = None, path: Optional[str] = None,
+                 filename: Optional[str] = None, columns: Optional[List[str]] = None,
+                 digest: Optional[str] = None):
+        self.dataset_id = dataset_id
+        self.path = path  # spooled upload, removed once parsed or when the source is dropped (e.g. a memo hit)
+        self.filename = filename
+        self.columns = columns
+        self.digest = digest or dataset_id  # content hash, the dataset_id an upload will get
+        self._cleanup = weakref.finalize(self, remove_file, path) if path else None
+    
+    async def load(self) -> DatasetEntry:
+        if self.dataset_id:
+            entry = dataset_store.get(self.dataset_id)
+            if entry is None:
+                raise HTTPException(status_code=404, detail=f"Dataset '{self.dataset_id}' not found; upload it again")
+            if not entry.complete and (self.columns is None or not set(self.columns) <= set(entry.df.columns)):
+                raise HTTPException(
+                    status_code=404,
+                    detail=f"Dataset '{self.dataset_id}' is only partially cached; upload it via /upload"
+                )
+            return entry
+        try:
+            return await ingest_content(self.path, self.filename, self.columns, self.digest)
+        finally:
+            self._cleanup()
+
+async def read_source(file: Optional[UploadFile], dataset_id: Optional[str],
+                      columns: Optional[List[str]] = None) -> DatasetSource:
+    """
+    Capture the dataset for an analysis from either an upload or a dataset_id
+    columns names what the analysis reads, so uploads parse only those; None parses everything.
+    Uploads are spooled to disk rather than read into memory.
+    """
+    if dataset_id:
+        if dataset_id not in dataset_store:
+            raise HTTPException(status_code=404, detail=f"Dataset '{dataset_id}' not found; upload it again")
+        return DatasetSource(dataset_id=dataset_id, columns=columns)
+    if file is None:
+        raise HTTPException(status_code=400, detail="Provide either a file or a dataset_id")
+    with stage("read"):
+        path, digest = await spool_hashed(file)
+    return DatasetSource(path=path, filename=file.filename, columns=columns, digest=digest)
+
+async def load_and_compute(source: DatasetSource, progress: ProgressCallback, compute, *args):
+    """Resolve the dataset and run compute(df, *args) in the executor"""
+    progress("loading", 0.1)
+    dataset = await source.load()
+    progress("computing", 0.3)
+    rows_processed.inc(compute.__name__.removeprefix("compute_").removesuffix("_results"), amount=len(dataset.df))
+    with stage("compute"):
+        result = await executor.run(compute, dataset.df, *args)
+    progress("storing", 0.9)
+    return dataset, result
+
+def ignore_progress(stage: str, fraction: float):
+    pass
+
+def client_id(request: Request) -> str:
+    """Identify the caller for per-client job limits"""
+    return request.headers.get("X-Client-Id") or (request.client.host if request.client else "anonymous")
+
+# Form fields that select the input or how it runs rather than what is computed
+UNKEYED_PARAMS = {"request", "file", "dataset_id", "mode"}
+
+@functools.lru_cache(maxsize=None)
+def endpoint_defaults(endpoint) -> Dict[str, Any]:
+    """Form parameters of an endpoint with their defaults, so omitted and explicit defaults key alike"""
+    defaults = {}
+    for name, param in inspect.signature(endpoint).parameters.items():
+        if name not in UNKEYED_PARAMS:
+            defaults[name] = getattr(param.default, "default", param.default)
+    return defaults
+
+async def request_memo_key(request: Request, analysis_type: str, source: DatasetSource) -> str:
+    form = await request.form()
+    params = {
+        name: form.get(name, default)
+        for name, default in endpoint_defaults(request.scope["endpoint"]).items()
+    }
+    return memo_key(source.digest, analysis_type, params)
+
+def memoized(runner, key: str):
+    """Wrap a runner so its response is remembered under key"""
+    async def run(progress: ProgressCallback):
+        response = await runner(progress)
+        memo.put(key, dict(response))
+        return response
+    return run
+
+async def dispatch(request: Request, mode: str, analysis_type: str, runner,
+                   source: Optional[DatasetSource] = None):
+    """
+    Run an analysis inline (mode=sync) or as a background job (mode=job)
+    With a source, a repeat of an earlier analysis returns its stored response, and
+    If-None-Match with the response's ETag returns 304. Sync responses are encoded
+    as the Accept header asks (JSON, MessagePack or Arrow).
+    """
+    if mode not in ("sync", "job"):
+        raise HTTPException(status_code=400, detail="mode must be 'sync' or 'job'")
+    encoding = negotiate(request.headers.get("Accept"))
+    
+    key = None
+    if source is not None and source.digest and memo.enabled:
+        key = await request_memo_key(request, analysis_type, source)
+        tag = key + ETAG_SUFFIX[encoding]
+        headers = {"ETag": f'"{tag}"', "Vary": "Accept"}
+        cached = memo.lookup(key, lambda response: response["analysis_id"] in analysis_store)
+        if cached is not None:
+            if etag_matches(request.headers.get("If-None-Match"), tag):
+                return Response(status_code=304, headers=headers)
+            with stage("serialize"):
+                return encoded_response(cached, encoding, headers={**headers, "X-Cache": "hit"})
+    
+    if mode == "sync":
+        content = dict(await runner(ignore_progress))
+        if key is None:
+            with stage("serialize"):
+                return encoded_response(content, encoding)
+        memo.put(key, content)
+        with stage("serialize"):
+            return encoded_response(content, encoding, headers={**headers, "X-Cache": "miss"})
+    
+    if key is not None:
+        runner = memoized(runner, key)
+    job = jobs.submit(client_id(request), analysis_type, runner)
+    return JSONResponse(status_code=202, content={
+        **job.summary(),
+        "status_url": f"/jobs/{job.job_id}",
+        "events_url": f"/jobs/{job.job_id}/events",
+        "result_url": f"/jobs/{job.job_id}/result"
+    })
+
+def new_analysis_id() -> str:
+    return str(uuid.uuid4())[:8]
+
+def make_record(analysis_id: str, analysis_type: str, results: Any, metadata: Dict = None) -> Dict:
+    return {
         "analysis_id": analysis_id,
         "timestamp": datetime.now().isoformat(),
         "analysis_type": analysis_type,
         "results": results,
         "metadata": metadata or {}
     }
+
+def store_result(analysis_type: str, results: Any, metadata: Dict = None) -> str:
+    """Store analysis results and return ID"""
+    analysis_id = new_analysis_id()
+    with stage("store"):
+        analysis_store.put(make_record(analysis_id, analysis_type, results, metadata))
     return analysis_id
 
-def calculate_sigma_level(cpk: float) -> float:
-    """Convert Cpk to approximate sigma level"""
-    return cpk * 3 + 1.5  # Approximate with 1.5 sigma shift
+def store_batch_items(analysis_type: str, items: List[Dict], metadata: Dict) -> List[Dict]:
+    """Store each successful batch item as its own analysis; returns items tagged with analysis_id"""
+    records, tagged = [], []
+    for item in items:
+        if "error" in item:
+            tagged.append({"analysis_id": None, **item})
+            continue
+        analysis_id = new_analysis_id()
+        records.append(make_record(analysis_id, analysis_type, item, metadata))
+        tagged.append({"analysis_id": analysis_id, **item})
+    with stage("store"):
+        analysis_store.put_many(records)
+    return tagged
+
+def get_stored_result(analysis_id: str) -> Dict:
+    """Fetch a stored analysis or raise 404"""
+    record = analysis_store.get(analysis_id)
+    if record is None:
+        raise HTTPException(status_code=404, detail="Analysis not found")
+    return record
+
+MAX_PAGE_SIZE = 1000
+
+def encode_cursor(summary: Dict) -> str:
+    return base64.urlsafe_b64encode(json.dumps([summary["timestamp"], summary["analysis_id"]]).encode()).decode()
+
+def decode_cursor(cursor: str) -> Tuple[str, str]:
+    try:
+        timestamp, analysis_id = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+        return str(timestamp), str(analysis_id)
+    except (ValueError, TypeError):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+def parse_time(value: Optional[str], name: str) -> Optional[str]:
+    """Normalize an ISO 8601 bound to the naive local form stored timestamps use"""
+    if not value:
+        return None
+    try:
+        parsed = datetime.fromisoformat(value)
+    except ValueError:
+        raise HTTPException(status_code=400, detail=f"{name} must be an ISO 8601 timestamp")
+    if parsed.tzinfo is not None:
+        parsed = parsed.astimezone().replace(tzinfo=None)
+    return parsed.isoformat()
+
+def parse_specs(specs: str, required: List[str]) -> List[Dict]:
+    """Decode a JSON list of batch specs, checking each has the required keys"""
+    try:
+        parsed = json.loads(specs)
+    except json.JSONDecodeError as exc:
+        raise HTTPException(status_code=400, detail=f"specs is not valid JSON: {exc.msg}")
+    if not isinstance(parsed, list) or not all(isinstance(spec, dict) for spec in parsed):
+        raise HTTPException(status_code=400, detail="specs must be a JSON list of objects")
+    for i, spec in enumerate(parsed):
+        missing = [key for key in required if spec.get(key) is None]
+        if missing:
+            raise HTTPException(status_code=400, detail=f"specs[{i}] is missing {', '.join(missing)}")
+        seed = spec.get("seed")
+        if seed is not None and (not isinstance(seed, int) or isinstance(seed, bool) or not 0 <= seed < MAX_SEED):
+            raise HTTPException(status_code=400, detail=f"specs[{i}] seed must be an integer between 0 and 2**53 - 1")
+    return parsed
 
 # ==================== ENDPOINTS ====================
 
@@ -142,22 +470,64 @@ async def root():
         "version": "1.0.0",
         "endpoints": [
             "/upload",
+            "/datasets",
             "/analyze/descriptive",
             "/analyze/capability",
             "/analyze/regression",
+            "/analyze/doe",
             "/analyze/ttest",
             "/analyze/control-chart",
+            "/analyze/gage-rr",
+            "/analyze/capability/batch",
+            "/analyze/control-chart/batch",
+            "/analyze/ttest/batch",
+            "/analyze/gage-rr/batch",
+            "/charts",
+            "/charts/{chart_id}/points",
             "/export/json/{analysis_id}",
-            "/export/csv/{analysis_id}"
+            "/export/csv/{analysis_id}",
+            "/export/xlsx/{analysis_id}",
+            "/export/parquet/{analysis_id}",
+            "/export/report/{analysis_id}",
+            "/jobs/{job_id}",
+            "/status",
+            "/warmup"
         ]
     }
 
+@app.get("/metrics")
+async def metrics():
+    """Request, stage, cache and store metrics in the Prometheus text format"""
+    return PlainTextResponse(registry.render(), media_type="text/plain; version=0.0.4")
+
+@app.get("/status")
+async def status():
+    """Worker pool and cache utilisation; memo and executor figures are for the answering worker"""
+    return {
+        "worker": {"pid": os.getpid(), "workers": WORKERS},
+        "modules": loaded(),
+        "executor": executor.stats(),
+        "datasets": dataset_store.stats(),
+        "results": analysis_store.stats(),
+        "charts": charts.stats(),
+        "distribution_fits": fit_cache.stats(),
+        "memo": memo.stats()
+    }
+
+@app.post("/warmup")
+async def warmup():
+    """Load the lazily imported libraries now rather than on the first request that needs them"""
+    seconds = await run_in_threadpool(warm_up)
+    return {"seconds": seconds, "modules": loaded()}
+
 @app.post("/upload")
 async def upload_file(file: UploadFile = File(...)):
-    """Upload and preview a data file"""
-    df = parse_file(file)
+    """Upload and preview a data file; the returned dataset_id can replace the file in /analyze/*"""
+    dataset = await ingest_file(file)
+    df = dataset.df
     
     return {
+        "dataset_id": dataset.dataset_id,
         "filename": file.filename,
         "rows": len(df),
         "columns": list(df.columns),
@@ -168,366 +538,646 @@ async def upload_file(file: UploadFile = File(...)):
 
 @app.post("/analyze/descriptive")
 async def analyze_descriptive(
-    file: UploadFile = File(...),
-    columns: Optional[str] = Form(None)  # Comma-separated column names
+    request: Request,
+    file: Optional[UploadFile] = File(None),
+    dataset_id: Optional[str] = Form(None),
+    columns: Optional[str] = Form(None),  # Comma-separated column names
+    streaming: bool = Form(False),  # Chunked CSV pass in constant memory
+    exact_quantiles: bool = Form(False),  # With streaming: exact instead of sketched quartiles
+    chunk_rows: int = Form(100_000),
+    group_by: Optional[str] = Form(None),  # Comma-separated key columns, e.g. machine,shift
+    mode: str = Form("sync")  # sync, job
 ):
-    """Calculate descriptive statistics for numeric columns"""
-    df = parse_file(file)
+    """Calculate descriptive statistics for numeric columns, optionally per group"""
+    check_chunk_rows(chunk_rows)
+    cols = [c.strip() for c in columns.split(',')] if columns else None
+    keys = parse_group_by(group_by)
     
-    if columns:
-        cols = [c.strip() for c in columns.split(',')]
-    else:
-        cols = list(df.select_dtypes(include=[np.number]).columns)
-    
-    results = []
-    for col in cols:
-        if col in df.columns:
-            data = df[col].dropna()
-            results.append(DescriptiveResult(
-                column=col,
-                count=int(len(data)),
-                mean=round(float(data.mean()), 4),
-                std=round(float(data.std()), 4),
-                min=round(float(data.min()), 4),
-                max=round(float(data.max()), 4),
-                median=round(float(data.median()), 4),
-                q1=round(float(data.quantile(0.25)), 4),
-                q3=round(float(data.quantile(0.75)), 4),
-                variance=round(float(data.var()), 4)
-            ))
-    
-    analysis_id = store_result("descriptive", [r.dict() for r in results], {
-        "filename": file.filename,
-        "columns_analyzed": cols
-    })
+    def respond(content: Any, filename: str, source_id: Optional[str], extra: Dict):
+        items = content["overall"] if keys else content
+        analysis_id = store_result("descriptive", content, {
+            "filename": filename,
+            "dataset_id": source_id,
+            "columns_analyzed": cols or [item["column"] for item in items],
+            **extra
+        })
+        
+        return AnalysisResponse(
+            analysis_id=analysis_id,
+            timestamp=datetime.now().isoformat(),
+            analysis_type="descriptive",
+            results=content,
+            metadata={"filename": filename, "dataset_id": source_id, **extra}
+        )
     
-    return AnalysisResponse(
-        analysis_id=analysis_id,
-        timestamp=datetime.now().isoformat(),
-        analysis_type="descriptive",
-        results=[r.dict() for r in results],
-        metadata={"filename": file.filename}
-    )
+    if streaming and file is not None and not dataset_id:
+        if keys:
+            raise HTTPException(status_code=400, detail="group_by is not supported with streaming")
+        if not file.filename.endswith('.csv'):
+            raise HTTPException(status_code=400, detail="Streaming statistics require a CSV file")
+        with stage("read"):
+            path = await spool_upload(file)
+        
+        async def run_streaming(progress: ProgressCallback) -> AnalysisResponse:
+            progress("computing", 0.1)
+            try:
+                bytes_parsed.inc(amount=os.path.getsize(path))
+                with stage("compute"):
+                    results = await executor.run(compute_descriptive_streaming, path, cols, chunk_rows, exact_quantiles)
+            finally:
+                os.remove(path)
+            progress("storing", 0.9)
+            return respond([r.dict() for r in results], file.filename, None, {
+                "streaming": True,
+                "quantiles": "exact" if exact_quantiles else "kll-sketch"
+            })
+        
+        return await dispatch(request, mode, "descriptive", run_streaming)
+    
+    source = await read_source(file, dataset_id, cols + keys if cols else None)
+    
+    async def run(progress: ProgressCallback) -> AnalysisResponse:
+        dataset, results = await load_and_compute(source, progress, descriptive_results, columns, group_by)
+        return respond(results, dataset.filename, dataset.dataset_id, {"group_by": keys} if keys else {})
+    
+    return await dispatch(request, mode, "descriptive", run, source)
 
 @app.post("/analyze/capability")
 async def analyze_capability(
-    file: UploadFile = File(...),
+    request: Request,
+    file: Optional[UploadFile] = File(None),
+    dataset_id: Optional[str] = Form(None),
     column: str = Form(...),
     usl: float = Form(...),
     lsl: float = Form(...),
-    target: Optional[float] = Form(None)
+    target: Optional[float] = Form(None),
+    intervals: Optional[str] = Form(None),  # exact, bootstrap, parametric, comma-separated or all
+    confidence: float = Form(0.95),
+    resamples: int = Form(DEFAULT_RESAMPLES),  # Bootstrap / Monte Carlo draws
+    seed: Optional[int] = Form(None),  # Fix for reproducible resampling
+    distribution: str = Form("normal"),  # normal, auto, or candidate names such as weibull,lognormal
+    criterion: str = Form("ad"),  # ad, aic: how the best candidate is chosen
+    group_by: Optional[str] = Form(None),  # Comma-separated key columns, e.g. machine,shift
+    mode: str = Form("sync")  # sync, job
 ):
-    """Calculate process capability indices (Cp, Cpk)"""
-    df = parse_file(file)
-    
-    if column not in df.columns:
-        raise HTTPException(status_code=400, detail=f"Column '{column}' not found")
-    
-    data = df[column].dropna().values
-    mean = float(np.mean(data))
-    std = float(np.std(data, ddof=1))
-    
-    if std == 0:
-        raise HTTPException(status_code=400, detail="Standard deviation is zero")
-    
-    cp = (usl - lsl) / (6 * std)
-    cpu = (usl - mean) / (3 * std)
-    cpl = (mean - lsl) / (3 * std)
-    cpk = min(cpu, cpl)
-    
-    # Calculate PPM
-    z_upper = (usl - mean) / std
-    z_lower = (mean - lsl) / std
-    ppm_above = (1 - stats.norm.cdf(z_upper)) * 1_000_000
-    ppm_below = stats.norm.cdf(-z_lower) * 1_000_000
-    
-    result = CapabilityResult(
-        column=column,
-        usl=usl,
-        lsl=lsl,
-        target=target,
-        mean=round(mean, 4),
-        std=round(std, 4),
-        cp=round(cp, 3),
-        cpk=round(cpk, 3),
-        cpu=round(cpu, 3),
-        cpl=round(cpl, 3),
-        ppm_above_usl=round(ppm_above, 1),
-        ppm_below_lsl=round(ppm_below, 1),
-        sigma_level=round(calculate_sigma_level(cpk), 2),
-        capable=cpk >= 1.33
-    )
+    """Calculate process capability indices (Cp, Cpk), optionally per group"""
+    keys = parse_group_by(group_by)
+    check_capability_grouping(keys, intervals, distribution)
+    try:
+        check_seed(seed)
+    except ValueError as exc:
+        raise HTTPException(status_code=400, detail=str(exc))
+    source = await read_source(file, dataset_id, [column] + keys)
     
-    analysis_id = store_result("capability", result.dict(), {
-        "filename": file.filename,
-        "specs": {"usl": usl, "lsl": lsl, "target": target}
-    })
+    async def run(progress: ProgressCallback) -> AnalysisResponse:
+        dataset, results = await load_and_compute(
+            source, progress, capability_results, column, usl, lsl, target, intervals, confidence, resamples,
+            seed, distribution, criterion, group_by
+        )
+        
+        analysis_id = store_result("capability", results, {
+            "filename": dataset.filename,
+            "dataset_id": dataset.dataset_id,
+            "specs": {"usl": usl, "lsl": lsl, "target": target},
+            **({"group_by": keys} if keys else {})
+        })
+        
+        return AnalysisResponse(
+            analysis_id=analysis_id,
+            timestamp=datetime.now().isoformat(),
+            analysis_type="capability",
+            results=results,
+            metadata={"filename": dataset.filename, "dataset_id": dataset.dataset_id, "specs": {"usl": usl, "lsl": lsl}}
+        )
     
-    return AnalysisResponse(
-        analysis_id=analysis_id,
-        timestamp=datetime.now().isoformat(),
-        analysis_type="capability",
-        results=result.dict(),
-        metadata={"filename": file.filename, "specs": {"usl": usl, "lsl": lsl}}
-    )
+    return await dispatch(request, mode, "capability", run, source)
 
 @app.post("/analyze/regression")
 async def analyze_regression(
-    file: UploadFile = File(...),
-    response: str = Form(...),
-    predictors: str = Form(...)  # Comma-separated predictor names
+    request: Request,
+    file: Optional[UploadFile] = File(None),
+    dataset_id: Optional[str] = Form(None),
+    response: str = Form(...),  # Comma-separated for several responses on the same predictors
+    predictors: str = Form(...),  # Comma-separated predictor names
+    streaming: bool = Form(False),  # Chunked CSV pass in constant memory
+    chunk_rows: int = Form(100_000),
+    mode: str = Form("sync")  # sync, job
 ):
     """Perform multiple linear regression"""
-    df = parse_file(file)
-    
+    check_chunk_rows(chunk_rows)
+    responses = [r.strip() for r in response.split(',')]
     pred_cols = [p.strip() for p in predictors.split(',')]
+    formula = regression_formula(" + ".join(responses) if len(responses) > 1 else responses[0], pred_cols)
     
-    # Validate columns
-    for col in [response] + pred_cols:
-        if col not in df.columns:
-            raise HTTPException(status_code=400, detail=f"Column '{col}' not found")
-    
-    # Build formula
-    formula = f"{response} ~ " + " + ".join(pred_cols)
-    
-    # Fit model
-    model = smf.ols(formula, data=df.dropna()).fit()
-    
-    # Extract coefficients
-    coefficients = {}
-    for term in model.params.index:
-        coefficients[term] = {
-            "coefficient": round(float(model.params[term]), 4),
-            "std_error": round(float(model.bse[term]), 4),
-            "t_value": round(float(model.tvalues[term]), 4),
-            "p_value": round(float(model.pvalues[term]), 4),
-            "significant": float(model.pvalues[term]) < 0.05
-        }
-    
-    result = RegressionResult(
-        r_squared=round(float(model.rsquared), 4),
-        adj_r_squared=round(float(model.rsquared_adj), 4),
-        f_statistic=round(float(model.fvalue), 4),
-        f_pvalue=round(float(model.f_pvalue), 6),
-        coefficients=coefficients,
-        residual_std_error=round(float(np.sqrt(model.mse_resid)), 4),
-        observations=int(model.nobs)
-    )
+    def respond(results: Dict, filename: str, source_id: Optional[str], extra: Dict):
+        metadata = {"filename": filename, "dataset_id": source_id, "formula": formula, **extra}
+        analysis_id = store_result("regression", results, metadata)
+        
+        return AnalysisResponse(
+            analysis_id=analysis_id,
+            timestamp=datetime.now().isoformat(),
+            analysis_type="regression",
+            results=results,
+            metadata=metadata
+        )
     
-    analysis_id = store_result("regression", result.dict(), {
-        "filename": file.filename,
-        "formula": formula
-    })
+    if streaming and file is not None and not dataset_id:
+        if not file.filename.endswith('.csv'):
+            raise HTTPException(status_code=400, detail="Streaming regression requires a CSV file")
+        with stage("read"):
+            path = await spool_upload(file)
+        
+        async def run_streaming(progress: ProgressCallback) -> AnalysisResponse:
+            progress("computing", 0.1)
+            try:
+                bytes_parsed.inc(amount=os.path.getsize(path))
+                with stage("compute"):
+                    result = await executor.run(compute_regression_streaming, path, responses, pred_cols, chunk_rows)
+            finally:
+                os.remove(path)
+            progress("storing", 0.9)
+            return respond(result.dict(), file.filename, None, {"streaming": True})
+        
+        return await dispatch(request, mode, "regression", run_streaming)
     
-    return AnalysisResponse(
-        analysis_id=analysis_id,
-        timestamp=datetime.now().isoformat(),
-        analysis_type="regression",
-        results=result.dict(),
-        metadata={"filename": file.filename, "formula": formula}
-    )
+    source = await read_source(file, dataset_id, responses + pred_cols)
+    
+    async def run(progress: ProgressCallback) -> AnalysisResponse:
+        dataset, results = await load_and_compute(source, progress, regression_results, response, predictors, chunk_rows)
+        return respond(results, dataset.filename, dataset.dataset_id, {})
+    
+    return await dispatch(request, mode, "regression", run, source)
+
+@app.post("/analyze/doe")
+async def analyze_doe_endpoint(
+    request: Request,
+    file: Optional[UploadFile] = File(None),
+    dataset_id: Optional[str] = Form(None),
+    response: str = Form(...),
+    factors: str = Form(...),  # Comma-separated factor columns
+    model: str = Form("factorial"),  # factorial, quadratic
+    max_order: Optional[int] = Form(None),  # Highest interaction order; default all (2 for quadratic)
+    alpha: float = Form(0.05),
+    mode: str = Form("sync")  # sync, job
+):
+    """Analyze a two-level factorial or response-surface experiment"""
+    factor_cols = [f.strip() for f in factors.split(',')]
+    source = await read_source(file, dataset_id, [response] + factor_cols)
+    
+    async def run(progress: ProgressCallback) -> AnalysisResponse:
+        dataset, results = await load_and_compute(
+            source, progress, doe_results, response, factors, model, max_order, alpha
+        )
+        
+        metadata = {"filename": dataset.filename, "dataset_id": dataset.dataset_id, "model": model}
+        analysis_id = store_result("doe", results, metadata)
+        
+        return AnalysisResponse(
+            analysis_id=analysis_id,
+            timestamp=datetime.now().isoformat(),
+            analysis_type="doe",
+            results=results,
+            metadata=metadata
+        )
+    
+    return await dispatch(request, mode, "doe", run, source)
 
 @app.post("/analyze/ttest")
 async def analyze_ttest(
-    file: UploadFile = File(...),
+    request: Request,
+    file: Optional[UploadFile] = File(None),
+    dataset_id: Optional[str] = Form(None),
     column1: str = Form(...),
     column2: Optional[str] = Form(None),
     test_type: str = Form("two-sample"),  # one-sample, two-sample, paired
     hypothesized_mean: Optional[float] = Form(None),
-    alpha: float = Form(0.05)
+    alpha: float = Form(0.05),
+    mode: str = Form("sync")  # sync, job
 ):
     """Perform t-test analysis"""
-    df = parse_file(file)
-    
-    data1 = df[column1].dropna().values
+    source = await read_source(file, dataset_id, [column1] + ([column2] if column2 else []))
     
-    if test_type == "one-sample":
-        if hypothesized_mean is None:
-            raise HTTPException(status_code=400, detail="hypothesized_mean required for one-sample test")
-        t_stat, p_value = stats.ttest_1samp(data1, hypothesized_mean)
-        df_val = len(data1) - 1
-        mean_diff = float(np.mean(data1)) - hypothesized_mean
+    async def run(progress: ProgressCallback) -> AnalysisResponse:
+        dataset, results = await load_and_compute(
+            source, progress, ttest_results, column1, column2, test_type, hypothesized_mean, alpha
+        )
         
-    elif test_type == "two-sample":
-        if column2 is None:
-            raise HTTPException(status_code=400, detail="column2 required for two-sample test")
-        data2 = df[column2].dropna().values
-        t_stat, p_value = stats.ttest_ind(data1, data2)
-        df_val = len(data1) + len(data2) - 2
-        mean_diff = float(np.mean(data1) - np.mean(data2))
+        analysis_id = store_result("ttest", results, {
+            "filename": dataset.filename,
+            "dataset_id": dataset.dataset_id,
+            "test_type": test_type
+        })
         
-    elif test_type == "paired":
-        if column2 is None:
-            raise HTTPException(status_code=400, detail="column2 required for paired test")
-        data2 = df[column2].dropna().values
-        t_stat, p_value = stats.ttest_rel(data1, data2)
-        df_val = len(data1) - 1
-        mean_diff = float(np.mean(data1 - data2))
-    else:
-        raise HTTPException(status_code=400, detail="Invalid test_type")
-    
-    # Confidence interval
-    se = float(np.std(data1, ddof=1) / np.sqrt(len(data1)))
-    ci_margin = stats.t.ppf(1 - alpha/2, df_val) * se
-    ci = [float(np.mean(data1)) - ci_margin, float(np.mean(data1)) + ci_margin]
-    
-    result = TTestResult(
-        test_type=test_type,
-        t_statistic=round(float(t_stat), 4),
-        p_value=round(float(p_value), 6),
-        df=round(float(df_val), 2),
-        mean_difference=round(mean_diff, 4) if mean_diff else None,
-        confidence_interval=[round(ci[0], 4), round(ci[1], 4)],
-        significant=float(p_value) < alpha,
-        alpha=alpha
-    )
-    
-    analysis_id = store_result("ttest", result.dict(), {
-        "filename": file.filename,
-        "test_type": test_type
-    })
+        return AnalysisResponse(
+            analysis_id=analysis_id,
+            timestamp=datetime.now().isoformat(),
+            analysis_type="ttest",
+            results=results,
+            metadata={"filename": dataset.filename, "dataset_id": dataset.dataset_id}
+        )
     
-    return AnalysisResponse(
-        analysis_id=analysis_id,
-        timestamp=datetime.now().isoformat(),
-        analysis_type="ttest",
-        results=result.dict(),
-        metadata={"filename": file.filename}
-    )
+    return await dispatch(request, mode, "ttest", run, source)
 
 @app.post("/analyze/control-chart")
 async def analyze_control_chart(
-    file: UploadFile = File(...),
+    request: Request,
+    file: Optional[UploadFile] = File(None),
+    dataset_id: Optional[str] = Form(None),
     column: str = Form(...),
-    subgroup_size: int = Form(5),
-    chart_type: str = Form("xbar-r")  # xbar-r, imr, p, c
+    subgroup_size: int = Form(5),  # subgroup size, or sample size for p/np/u charts
+    chart_type: str = Form("xbar-r"),  # xbar-r, xbar-s, imr, p, np, c, u
+    size_column: Optional[str] = Form(None),  # per-point sample sizes for p/np/u charts
+    rules: str = Form("all"),  # Nelson rules to test, e.g. "1,2,5"
+    group_by: Optional[str] = Form(None),  # Comma-separated key columns, e.g. machine,shift
+    mode: str = Form("sync")  # sync, job
 ):
-    """Calculate control chart limits"""
-    df = parse_file(file)
-    data = df[column].dropna().values
-    
-    if chart_type == "xbar-r":
-        n = subgroup_size
-        n_subgroups = len(data) // n
-        subgroups = data[:n_subgroups * n].reshape(n_subgroups, n)
-        
-        xbar = subgroups.mean(axis=1)
-        R = subgroups.ptp(axis=1)
-        
-        xbar_bar = float(xbar.mean())
-        r_bar = float(R.mean())
-        
-        # Control chart constants
-        A2 = {2: 1.880, 3: 1.023, 4: 0.729, 5: 0.577, 6: 0.483, 7: 0.419, 8: 0.373, 9: 0.337, 10: 0.308}.get(n, 0.308)
-        D4 = {2: 3.267, 3: 2.574, 4: 2.282, 5: 2.114, 6: 2.004, 7: 1.924, 8: 1.864, 9: 1.816, 10: 1.777}.get(n, 1.777)
-        
-        ucl = xbar_bar + A2 * r_bar
-        lcl = xbar_bar - A2 * r_bar
+    """Calculate control chart limits and test the Western Electric/Nelson rules, optionally per group"""
+    keys = parse_group_by(group_by)
+    source = await read_source(file, dataset_id, [column] + ([size_column] if size_column else []) + keys)
+    
+    async def run(progress: ProgressCallback) -> AnalysisResponse:
+        dataset, results = await load_and_compute(
+            source, progress, control_chart_results, column, subgroup_size, chart_type, size_column, rules, group_by
+        )
         
-        # Find out of control points
-        ooc = [i for i, x in enumerate(xbar) if x > ucl or x < lcl]
+        analysis_id = store_result("control-chart", results, {
+            "filename": dataset.filename,
+            "dataset_id": dataset.dataset_id,
+            "chart_type": chart_type,
+            **({"group_by": keys} if keys else {})
+        })
         
-        result = ControlChartResult(
-            chart_type=chart_type,
-            center_line=round(xbar_bar, 4),
-            ucl=round(ucl, 4),
-            lcl=round(lcl, 4),
-            subgroup_size=n,
-            out_of_control_points=ooc,
-            data_points=[round(float(x), 4) for x in xbar]
+        return AnalysisResponse(
+            analysis_id=analysis_id,
+            timestamp=datetime.now().isoformat(),
+            analysis_type="control-chart",
+            results=results,
+            metadata={"filename": dataset.filename, "dataset_id": dataset.dataset_id}
+        )
+    
+    return await dispatch(request, mode, "control-chart", run, source)
+
+@app.post("/analyze/gage-rr")
+async def analyze_gage_rr(
+    request: Request,
+    file: Optional[UploadFile] = File(None),
+    dataset_id: Optional[str] = Form(None),
+    part: str = Form(...),
+    operator: str = Form(...),
+    measurement: str = Form(...),
+    design: str = Form("crossed"),  # crossed, nested (each operator measures their own parts)
+    method: str = Form("anova"),  # anova, xbar-r
+    tolerance: Optional[float] = Form(None),  # USL - LSL, for %Tolerance
+    study_var: float = Form(6.0),  # standard deviations in the study variation
+    interaction_alpha: float = Form(0.05),  # part*operator is pooled into repeatability above this p-value
+    mode: str = Form("sync")  # sync, job
+):
+    """Measurement system analysis (Gage R&R)"""
+    gage_rr_spec(part, operator, measurement, design, method, tolerance, study_var, interaction_alpha)  # 400 before reading
+    source = await read_source(file, dataset_id, [part, operator, measurement])
+    
+    async def run(progress: ProgressCallback) -> AnalysisResponse:
+        dataset, results = await load_and_compute(
+            source, progress, gage_rr_results, part, operator, measurement, design, method, tolerance, study_var,
+            interaction_alpha
         )
         
-    elif chart_type == "imr":
-        # Individuals and Moving Range
-        mr = np.abs(np.diff(data))
-        x_bar = float(np.mean(data))
-        mr_bar = float(np.mean(mr))
+        analysis_id = store_result("gage-rr", results, {
+            "filename": dataset.filename,
+            "dataset_id": dataset.dataset_id,
+            "design": design,
+            "method": method
+        })
         
-        ucl = x_bar + 2.66 * mr_bar
-        lcl = x_bar - 2.66 * mr_bar
+        return AnalysisResponse(
+            analysis_id=analysis_id,
+            timestamp=datetime.now().isoformat(),
+            analysis_type="gage-rr",
+            results=results,
+            metadata={"filename": dataset.filename, "dataset_id": dataset.dataset_id}
+        )
+    
+    return await dispatch(request, mode, "gage-rr", run, source)
+
+# ==================== BATCH ENDPOINTS ====================
+
+async def run_batch(request: Request, analysis_type: str, file: Optional[UploadFile], dataset_id: Optional[str],
+                    specs: List[Dict], column_keys: List[str], compute, mode: str):
+    """Run one vectorized batch over a dataset and store every item under its own analysis_id"""
+    columns = list(dict.fromkeys(spec[key] for spec in specs for key in column_keys if spec.get(key)))
+    source = await read_source(file, dataset_id, columns)
+    
+    async def run(progress: ProgressCallback) -> AnalysisResponse:
+        dataset, items = await load_and_compute(source, progress, compute, specs)
         
-        ooc = [i for i, x in enumerate(data) if x > ucl or x < lcl]
+        metadata = {"filename": dataset.filename, "dataset_id": dataset.dataset_id}
+        batch_id = new_analysis_id()
+        tagged = store_batch_items(analysis_type, items, {**metadata, "batch_id": batch_id})
+        result = BatchResult(count=len(tagged), failed=sum(1 for item in tagged if "error" in item), items=tagged)
+        results = result.dict()
+        analysis_store.put(make_record(batch_id, f"{analysis_type}-batch", results, metadata))
         
-        result = ControlChartResult(
-            chart_type=chart_type,
-            center_line=round(x_bar, 4),
-            ucl=round(ucl, 4),
-            lcl=round(lcl, 4),
-            subgroup_size=1,
-            out_of_control_points=ooc,
-            data_points=[round(float(x), 4) for x in data]
+        return AnalysisResponse(
+            analysis_id=batch_id,
+            timestamp=datetime.now().isoformat(),
+            analysis_type=f"{analysis_type}-batch",
+            results=results,
+            metadata=metadata
         )
-    else:
-        raise HTTPException(status_code=400, detail="Unsupported chart type")
     
-    analysis_id = store_result("control-chart", result.dict(), {
-        "filename": file.filename,
-        "chart_type": chart_type
+    return await dispatch(request, mode, f"{analysis_type}-batch", run, source)
+
+@app.post("/analyze/capability/batch")
+async def analyze_capability_batch(
+    request: Request,
+    file: Optional[UploadFile] = File(None),
+    dataset_id: Optional[str] = Form(None),
+    specs: str = Form(...),  # JSON list of {column, usl, lsl, target, distribution, criterion}
+    mode: str = Form("sync")  # sync, job
+):
+    """Process capability for many characteristics of one dataset"""
+    parsed = parse_specs(specs, ["column", "usl", "lsl"])
+    return await run_batch(request, "capability", file, dataset_id, parsed, ["column"], capability_batch, mode)
+
+@app.post("/analyze/control-chart/batch")
+async def analyze_control_chart_batch(
+    request: Request,
+    file: Optional[UploadFile] = File(None),
+    dataset_id: Optional[str] = Form(None),
+    specs: str = Form(...),  # JSON list of {column, chart_type, subgroup_size, size_column, rules}
+    mode: str = Form("sync")  # sync, job
+):
+    """Control charts for many columns of one dataset"""
+    parsed = parse_specs(specs, ["column"])
+    return await run_batch(
+        request, "control-chart", file, dataset_id, parsed, ["column", "size_column"], control_chart_batch, mode
+    )
+
+@app.post("/analyze/ttest/batch")
+async def analyze_ttest_batch(
+    request: Request,
+    file: Optional[UploadFile] = File(None),
+    dataset_id: Optional[str] = Form(None),
+    specs: str = Form(...),  # JSON list of {column1, column2, test_type, hypothesized_mean, alpha}
+    mode: str = Form("sync")  # sync, job
+):
+    """t-tests for many column pairs of one dataset"""
+    parsed = parse_specs(specs, ["column1"])
+    return await run_batch(request, "ttest", file, dataset_id, parsed, ["column1", "column2"], ttest_batch, mode)
+
+@app.post("/analyze/gage-rr/batch")
+async def analyze_gage_rr_batch(
+    request: Request,
+    file: Optional[UploadFile] = File(None),
+    dataset_id: Optional[str] = Form(None),
+    study: str = Form(...),  # column identifying the study, e.g. gauge id
+    part: str = Form(...),
+    operator: str = Form(...),
+    measurement: str = Form(...),
+    design: str = Form("crossed"),  # crossed, nested
+    method: str = Form("anova"),  # anova, xbar-r
+    tolerance: Optional[float] = Form(None),  # USL - LSL for every study
+    tolerance_column: Optional[str] = Form(None),  # or per study, from its first row
+    study_var: float = Form(6.0),
+    interaction_alpha: float = Form(0.05),
+    mode: str = Form("sync")  # sync, job
+):
+    """Gage R&R of every study in one dataset"""
+    spec = gage_rr_spec(part, operator, measurement, design, method, tolerance, study_var, interaction_alpha,
+                        study, tolerance_column)
+    return await run_batch(
+        request, "gage-rr", file, dataset_id, [spec], ["study", "part", "operator", "measurement", "tolerance_column"],
+        gage_rr_batch, mode
+    )
+
+# ==================== LIVE CHART ENDPOINTS ====================
+
+@app.post("/charts")
+async def create_chart(
+    file: Optional[UploadFile] = File(None),
+    dataset_id: Optional[str] = Form(None),
+    column: str = Form(...),
+    subgroup_size: int = Form(5),  # subgroup size, or sample size for p/np/u charts
+    chart_type: str = Form("xbar-r"),  # xbar-r, xbar-s, imr, p, np, c, u
+    size_column: Optional[str] = Form(None),  # per-point sample sizes for p/np/u charts
+    rules: str = Form("all")  # Nelson rules to test, e.g. "1,2,5"
+):
+    """Create a live chart whose limits are frozen from the phase I data"""
+    source = await read_source(file, dataset_id, [column] + ([size_column] if size_column else []))
+    dataset, (baseline, chart) = await load_and_compute(
+        source, ignore_progress, baseline_chart, column, subgroup_size, chart_type, size_column, rules
+    )
+    chart = charts.add(chart)
+    
+    analysis_id = store_result("control-chart", baseline, {
+        "filename": dataset.filename,
+        "dataset_id": dataset.dataset_id,
+        "chart_type": chart_type,
+        "chart_id": chart.chart_id
     })
     
-    return AnalysisResponse(
-        analysis_id=analysis_id,
-        timestamp=datetime.now().isoformat(),
-        analysis_type="control-chart",
-        results=result.dict(),
-        metadata={"filename": file.filename}
-    )
+    return encoded_response({**chart.summary(), "baseline_analysis_id": analysis_id, "baseline": baseline})
 
-# ==================== EXPORT ENDPOINTS ====================
+@app.get("/charts")
+async def list_charts():
+    """List live charts"""
+    return {"charts": charts.list()}
 
-@app.get("/export/json/{analysis_id}")
-async def export_json(analysis_id: str):
-    """Export analysis results as JSON"""
-    if analysis_id not in analysis_store:
-        raise HTTPException(status_code=404, detail="Analysis not found")
+@app.get("/charts/{chart_id}")
+async def get_chart(chart_id: str):
+    """Frozen limits and running violation counts of a live chart"""
+    return charts.get(chart_id).summary()
+
+@app.post("/charts/{chart_id}/points")
+async def append_chart_points(chart_id: str, body: ChartPoints):
+    """Score new measurements against the frozen limits"""
+    charts.get(chart_id)
+    return await run_in_threadpool(charts.append, chart_id, body.values, body.sizes)
+
+@app.delete("/charts/{chart_id}")
+async def delete_chart(chart_id: str):
+    """Stop monitoring a live chart"""
+    if not charts.delete(chart_id):
+        raise HTTPException(status_code=404, detail="Chart not found")
     
-    return JSONResponse(content=analysis_store[analysis_id])
+    return {"deleted": chart_id}
 
-@app.get("/export/csv/{analysis_id}")
-async def export_csv(analysis_id: str):
-    """Export analysis results as CSV"""
-    if analysis_id not in analysis_store:
-        raise HTTPException(status_code=404, detail="Analysis not found")
+# ==================== JOB ENDPOINTS ====================
+
+@app.get("/jobs")
+async def list_jobs(request: Request):
+    """List the caller's analysis jobs"""
+    return {"jobs": jobs.list(client_id(request))}
+
+@app.get("/jobs/{job_id}")
+async def get_job(job_id: str):
+    """Report job status and progress"""
+    return jobs.get(job_id).summary()
+
+@app.get("/jobs/{job_id}/events")
+async def job_events(job_id: str):
+    """Stream job status updates as newline-delimited JSON until the job finishes"""
+    jobs.get(job_id)
     
-    result = analysis_store[analysis_id]
+    async def stream():
+        async for snapshot in jobs.events(job_id):
+            yield json.dumps(snapshot) + "\n"
     
-    # Convert to DataFrame
-    if isinstance(result["results"], list):
-        df = pd.DataFrame(result["results"])
-    elif isinstance(result["results"], dict):
-        df = pd.DataFrame([result["results"]])
+    return StreamingResponse(stream(), media_type="application/x-ndjson")
+
+@app.get("/jobs/{job_id}/result")
+async def get_job_result(request: Request, job_id: str):
+    """Retrieve the stored result of a completed job"""
+    job = jobs.get(job_id)
+    if job.status != "completed":
+        raise HTTPException(status_code=409, detail=f"Job is {job.status}")
+    return encoded_response(get_stored_result(job.analysis_id), negotiate(request.headers.get("Accept")))
+
+@app.delete("/jobs/{job_id}")
+async def cancel_job(job_id: str):
+    """Cancel a queued or running job"""
+    return jobs.cancel(job_id).summary()
+
+# ==================== DATASET ENDPOINTS ====================
+
+@app.get("/datasets")
+async def list_datasets():
+    """List cached datasets and cache usage"""
+    return {
+        "cache": dataset_store.stats(),
+        "datasets": dataset_store.list()
+    }
+
+@app.get("/datasets/{dataset_id}")
+async def get_dataset(dataset_id: str):
+    """Describe a cached dataset"""
+    entry = dataset_store.get(dataset_id)
+    if entry is None:
+        raise HTTPException(status_code=404, detail="Dataset not found")
     
-    # Save to temp file
-    output_path = f"/tmp/{analysis_id}.csv"
-    df.to_csv(output_path, index=False)
+    return entry.summary()
+
+@app.delete("/datasets/{dataset_id}")
+async def delete_dataset(dataset_id: str):
+    """Drop a dataset from the cache"""
+    if not dataset_store.delete(dataset_id):
+        raise HTTPException(status_code=404, detail="Dataset not found")
     
-    return FileResponse(output_path, filename=f"analysis_{analysis_id}.csv", media_type="text/csv")
+    return {"deleted": dataset_id}
+
+# ==================== EXPORT ENDPOINTS ====================
+
+@app.get("/export/json/{analysis_id}")
+async def export_json(analysis_id: str):
+    """Export analysis results as JSON"""
+    return encoded_response(get_stored_result(analysis_id))
+
+EXPORT_MEDIA_TYPES = {
+    "csv": "text/csv",
+    "xlsx": "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
+    "parquet": "application/vnd.apache.parquet",
+}
+
+def export_response(chunks, analysis_id: str, extension: str, suffix: str = "") -> StreamingResponse:
+    return StreamingResponse(chunks, media_type=EXPORT_MEDIA_TYPES[extension], headers={
+        "Content-Disposition": f'attachment; filename="analysis_{analysis_id}{suffix}.{extension}"'
+    })
+
+def export_table(table: str) -> str:
+    if table not in EXPORT_TABLES:
+        raise HTTPException(status_code=400, detail=f"table must be one of {', '.join(EXPORT_TABLES)}")
+    return table
+
+@app.get("/export/csv/{analysis_id}")
+async def export_csv(
+    analysis_id: str,
+    table: str = "summary"  # summary (one row per result or batch item), series (one row per chart point)
+):
+    """Export analysis results as CSV, streamed"""
+    result = get_stored_result(analysis_id)
+    suffix = "" if table == "summary" else f"_{table}"
+    return export_response(csv_stream(result, export_table(table)), analysis_id, "csv", suffix)
+
+@app.get("/export/xlsx/{analysis_id}")
+async def export_xlsx(analysis_id: str):
+    """Export analysis results as an Excel workbook with summary and series sheets, streamed"""
+    return export_response(xlsx_stream(get_stored_result(analysis_id)), analysis_id, "xlsx")
+
+@app.get("/export/parquet/{analysis_id}")
+async def export_parquet(
+    analysis_id: str,
+    table: str = "summary"  # summary, series
+):
+    """Export analysis results as Parquet, streamed one row group at a time"""
+    if not HAS_PYARROW:
+        raise HTTPException(status_code=400, detail="Parquet export requires pyarrow")
+    result = get_stored_result(analysis_id)
+    suffix = "" if table == "summary" else f"_{table}"
+    return export_response(parquet_stream(result, export_table(table)), analysis_id, "parquet", suffix)
+
+@app.get("/export/report/{analysis_id}")
+async def export_report(analysis_id: str):
+    """HTML report with the summary table and every control chart, streamed"""
+    return StreamingResponse(report_stream(get_stored_result(analysis_id)), media_type="text/html")
 
 @app.get("/results/{analysis_id}")
-async def get_result(analysis_id: str):
-    """Retrieve stored analysis results"""
-    if analysis_id not in analysis_store:
-        raise HTTPException(status_code=404, detail="Analysis not found")
-    
-    return analysis_store[analysis_id]
+async def get_result(
+    request: Request,
+    analysis_id: str,
+    max_points: Optional[int] = None,  # downsample chart series longer than this
+    downsample: str = "lttb"  # lttb, minmax
+):
+    """Retrieve stored analysis results, encoded as the Accept header asks"""
+    result = get_stored_result(analysis_id)
+    if max_points is not None:
+        if downsample not in DOWNSAMPLE_METHODS:
+            raise HTTPException(status_code=400, detail=f"downsample must be one of {', '.join(DOWNSAMPLE_METHODS)}")
+        if max_points < 3:
+            raise HTTPException(status_code=400, detail="max_points must be at least 3")
+        result = await run_in_threadpool(downsample_results, result, max_points, downsample)
+    return encoded_response(result, negotiate(request.headers.get("Accept")))
 
 @app.get("/results")
-async def list_results():
-    """List all stored analysis results"""
+async def list_results(
+    analysis_type: Optional[str] = None,  # e.g. "capability" or "control-chart,control-chart-batch"
+    since: Optional[str] = None,  # ISO 8601, inclusive
+    until: Optional[str] = None,  # ISO 8601, exclusive
+    limit: int = 100,
+    cursor: Optional[str] = None,  # next_cursor of the previous page
+    order: str = "asc"  # asc (oldest first), desc
+):
+    """List stored analysis results a page at a time"""
+    if not 1 <= limit <= MAX_PAGE_SIZE:
+        raise HTTPException(status_code=400, detail=f"limit must be between 1 and {MAX_PAGE_SIZE}")
+    if order not in ("asc", "desc"):
+        raise HTTPException(status_code=400, detail="order must be 'asc' or 'desc'")
+    types = {t.strip() for t in analysis_type.split(",") if t.strip()} if analysis_type else None
+    
+    analyses = await run_in_threadpool(
+        analysis_store.list, types, parse_time(since, "since"), parse_time(until, "until"),
+        decode_cursor(cursor) if cursor else None, limit + 1, order == "desc"
+    )
+    more = len(analyses) > limit
+    analyses = analyses[:limit]
     return {
-        "count": len(analysis_store),
-        "analyses": [
-            {
-                "analysis_id": k,
-                "type": v["analysis_type"],
-                "timestamp": v["timestamp"]
-            }
-            for k, v in analysis_store.items()
-        ]
+        "count": len(analyses),
+        "analyses": analyses,
+        "next_cursor": encode_cursor(analyses[-1]) if more else None
     }
 
+@app.delete("/results/{analysis_id}")
+async def delete_result(analysis_id: str):
+    """Delete a stored analysis result"""
+    if not analysis_store.delete(analysis_id):
+        raise HTTPException(status_code=404, detail="Analysis not found")
+    
+    return {"deleted": analysis_id}
+
 # ==================== MAIN ====================
 
 if __name__ == "__main__":
     import uvicorn
-    uvicorn.run(app, host="0.0.0.0", port=8001)
+    if WORKERS > 1:
+        uvicorn.run("main:app", host="0.0.0.0", port=8001, workers=WORKERS)
+    else:
+        uvicorn.run(app, host="0.0.0.0", port=8001)
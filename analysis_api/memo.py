@@ -0,0 +1,111 @@
+"""
+Memoization of analysis responses
+An analysis is identified by the content hash of its dataset, the analysis type
+and its normalized parameters. Repeating one returns the stored response, with
+the same analysis_id, instead of recomputing it; the key doubles as the ETag.
+"""
+
+import hashlib
+import json
+import os
+import threading
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Optional
+
+
+DEFAULT_MAX_ENTRIES = 10_000
+
+
+def normalize_param(value: Any) -> Any:
+    """Canonical form of a parameter, so "10.50" and "10.5" or "a, b" and "a,b" match"""
+    if not isinstance(value, str):
+        return value
+    text = value.strip()
+    if not text:
+        return None  # an empty form field means the default
+    if text[:1] in ("[", "{"):
+        try:
+            return json.loads(text)
+        except ValueError:
+            return text
+    if text.lower() in ("true", "false"):
+        return text.lower() == "true"
+    try:
+        return float(text)
+    except ValueError:
+        pass
+    if "," in text:
+        return ",".join(part.strip() for part in text.split(","))
+    return text
+
+
+def memo_key(digest: str, analysis_type: str, params: Dict[str, Any]) -> str:
+    """Stable key for (dataset content, analysis, parameters)"""
+    normalized = {name: normalize_param(value) for name, value in params.items()}
+    payload = json.dumps([digest, analysis_type, normalized], sort_keys=True, default=str)
+    return hashlib.sha256(payload.encode()).hexdigest()[:32]
+
+
+def etag_matches(if_none_match: Optional[str], key: str) -> bool:
+    """Whether an If-None-Match header names the key (weak or strong, or *)"""
+    if not if_none_match:
+        return False
+    tags = [tag.strip() for tag in if_none_match.split(",")]
+    return "*" in tags or any(tag.removeprefix("W/").strip('"') == key for tag in tags)
+
+
+class ResultMemo:
+    """LRU map of memo key to response, with hit and miss counters"""
+
+    def __init__(self, max_entries: int = DEFAULT_MAX_ENTRIES):
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._entries: "OrderedDict[str, Dict]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_entries > 0
+
+    def lookup(self, key: str, is_valid: Callable[[Dict], bool]) -> Optional[Dict]:
+        """Cached response for key if is_valid still accepts it (e.g. its result was not evicted)"""
+        with self._lock:
+            response = self._entries.get(key)
+        if response is not None and not is_valid(response):
+            with self._lock:
+                self._entries.pop(key, None)
+            response = None
+        with self._lock:
+            if response is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self._entries.move_to_end(key)
+            return response
+
+    def put(self, key: str, response: Dict):
+        with self._lock:
+            self._entries[key] = response
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> Dict:
+        lookups = self.hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "max_entries": self.max_entries,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": round(self.hits / lookups, 4) if lookups else None,
+        }
+
+
+def create_memo() -> ResultMemo:
+    """Build the memo from ANALYSIS_MEMO_ENTRIES (0 disables memoization)"""
+    return ResultMemo(int(os.environ.get("ANALYSIS_MEMO_ENTRIES", DEFAULT_MAX_ENTRIES)))
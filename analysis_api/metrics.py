@@ -0,0 +1,187 @@
+"""
+Request metrics in the Prometheus text format
+Counters and histograms are kept in-process and rendered on scrape; gauges are
+read from the stores at scrape time. Stage timings of the current request are
+collected through a context variable and also returned as a Server-Timing header.
+"""
+
+import bisect
+import contextvars
+import threading
+import time
+from contextlib import contextmanager
+from typing import Callable, Dict, Iterator, List, Optional, Sequence, Tuple
+
+
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+Labels = Tuple[str, ...]
+
+
+def format_labels(names: Sequence[str], values: Sequence[str]) -> str:
+    if not names:
+        return ""
+    escaped = (str(v).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n") for v in values)
+    return "{" + ",".join(f'{name}="{value}"' for name, value in zip(names, escaped)) + "}"
+
+
+def format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Counter:
+    def __init__(self, name: str, help_text: str, labels: Sequence[str] = ()):
+        self.name = name
+        self.help = help_text
+        self.labels = tuple(labels)
+        self._values: Dict[Labels, float] = {}
+        self._lock = threading.Lock()
+
+    def inc(self, *label_values: str, amount: float = 1):
+        key = tuple(label_values)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            items = sorted(self._values.items())
+        lines.extend(f"{self.name}{format_labels(self.labels, key)} {format_value(value)}" for key, value in items)
+        return lines
+
+
+class Histogram:
+    def __init__(self, name: str, help_text: str, labels: Sequence[str] = (),
+                 buckets: Sequence[float] = LATENCY_BUCKETS):
+        self.name = name
+        self.help = help_text
+        self.labels = tuple(labels)
+        self.buckets = tuple(buckets)
+        self._series: Dict[Labels, List] = {}  # labels -> [bucket counts, sum, count]
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, *label_values: str):
+        key = tuple(label_values)
+        slot = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            series[0][slot] += 1
+            series[1] += value
+            series[2] += 1
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            items = sorted((key, [list(series[0]), series[1], series[2]]) for key, series in self._series.items())
+        names = self.labels + ("le",)
+        for key, (counts, total, count) in items:
+            cumulative = 0
+            for bound, bucket in zip(self.buckets + (float("inf"),), counts):
+                cumulative += bucket
+                labels = format_labels(names, key + (format_value(bound),))
+                lines.append(f"{self.name}_bucket{labels} {cumulative}")
+            lines.append(f"{self.name}_sum{format_labels(self.labels, key)} {format_value(total)}")
+            lines.append(f"{self.name}_count{format_labels(self.labels, key)} {count}")
+        return lines
+
+
+class Gauge:
+    """Gauge read at scrape time; the callback returns {label values: value}"""
+
+    def __init__(self, name: str, help_text: str, read: Callable[[], Dict[Labels, float]],
+                 labels: Sequence[str] = ()):
+        self.name = name
+        self.help = help_text
+        self.labels = tuple(labels)
+        self.read = read
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} gauge"]
+        for key, value in sorted(self.read().items()):
+            if value is not None:
+                lines.append(f"{self.name}{format_labels(self.labels, key)} {format_value(value)}")
+        return lines
+
+
+class Registry:
+    def __init__(self):
+        self._metrics = []
+
+    def counter(self, name: str, help_text: str, labels: Sequence[str] = ()) -> Counter:
+        metric = Counter(name, help_text, labels)
+        self._metrics.append(metric)
+        return metric
+
+    def histogram(self, name: str, help_text: str, labels: Sequence[str] = (),
+                  buckets: Sequence[float] = LATENCY_BUCKETS) -> Histogram:
+        metric = Histogram(name, help_text, labels, buckets)
+        self._metrics.append(metric)
+        return metric
+
+    def gauge(self, name: str, help_text: str, read: Callable[[], Dict[Labels, float]],
+              labels: Sequence[str] = ()) -> Gauge:
+        metric = Gauge(name, help_text, read, labels)
+        self._metrics.append(metric)
+        return metric
+
+    def render(self) -> str:
+        lines: List[str] = []
+        for metric in self._metrics:
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+registry = Registry()
+
+requests_total = registry.counter(
+    "analysis_requests_total", "HTTP requests by route, method and status", ("endpoint", "method", "status"))
+request_seconds = registry.histogram(
+    "analysis_request_duration_seconds", "HTTP request latency by route", ("endpoint",))
+stage_seconds = registry.histogram(
+    "analysis_stage_duration_seconds", "Time spent per request stage", ("endpoint", "stage"))
+bytes_parsed = registry.counter("analysis_bytes_parsed_total", "Upload bytes parsed")
+rows_processed = registry.counter(
+    "analysis_rows_processed_total", "Dataset rows passed to an analysis", ("analysis",))
+
+
+class RequestTimings:
+    """Stage durations of one request, in the order they ran"""
+
+    def __init__(self, endpoint: str = ""):
+        self.endpoint = endpoint
+        self.stages: List[Tuple[str, float]] = []
+
+    def add(self, stage: str, seconds: float):
+        self.stages.append((stage, seconds))
+
+    def server_timing(self, total: float) -> str:
+        """Server-Timing header value; repeated stages (e.g. several parses) are summed"""
+        merged: Dict[str, float] = {}
+        for stage, seconds in self.stages:
+            merged[stage] = merged.get(stage, 0.0) + seconds
+        parts = [f"{stage};dur={seconds * 1000:.1f}" for stage, seconds in merged.items()]
+        parts.append(f"total;dur={total * 1000:.1f}")
+        return ", ".join(parts)
+
+
+current_timings: contextvars.ContextVar[Optional[RequestTimings]] = contextvars.ContextVar(
+    "current_timings", default=None)
+
+
+@contextmanager
+def stage(name: str) -> Iterator[None]:
+    """Time a block as a stage of the current request"""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - start
+        timings = current_timings.get()
+        endpoint = timings.endpoint if timings is not None else ""
+        stage_seconds.observe(elapsed, endpoint, name)
+        if timings is not None:
+            timings.add(name, elapsed)
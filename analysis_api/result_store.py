@@ -0,0 +1,332 @@
+"""
+Result stores for the analysis API
+Analysis records are bounded by entry count, serialized size and age. The
+memory backend lives in one process; the SQLite backend survives restarts and
+is shared by every worker on the host.
+"""
+
+import bisect
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Collection, Dict, List, Optional, Tuple
+
+from serialization import dumps, loads, split_arrays
+
+
+def record_size(record: Dict) -> int:
+    """Size of a record in bytes, used for memory accounting; NumPy series count at their in-memory size"""
+    arrays = []
+    rest = split_arrays(record, "", arrays)
+    return len(dumps(rest)) + sum(array.nbytes for _, array in arrays)
+
+
+def encode_record(record: Dict) -> bytes:
+    return dumps(record)
+
+
+def decode_record(payload: bytes) -> Dict:
+    return loads(payload)
+
+
+def record_summary(record: Dict) -> Dict:
+    return {
+        "analysis_id": record["analysis_id"],
+        "type": record["analysis_type"],
+        "timestamp": record["timestamp"]
+    }
+
+
+class ResultStore:
+    """Interface shared by result store backends"""
+
+    backend = "base"
+
+    def __init__(self, max_entries: int = 0, max_bytes: int = 0, ttl_seconds: float = 0):
+        # Zero disables the corresponding limit
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl_seconds = ttl_seconds
+        self.evictions = 0
+
+    def put(self, record: Dict):
+        raise NotImplementedError
+
+    def put_many(self, records: List[Dict]):
+        for record in records:
+            self.put(record)
+
+    def get(self, analysis_id: str) -> Optional[Dict]:
+        raise NotImplementedError
+
+    def delete(self, analysis_id: str) -> bool:
+        raise NotImplementedError
+
+    def list(self, analysis_types: Optional[Collection[str]] = None, since: Optional[str] = None,
+             until: Optional[str] = None, after: Optional[Tuple[str, str]] = None, limit: int = 0,
+             descending: bool = False) -> List[Dict]:
+        """
+        Summaries of live records ordered by (timestamp, analysis_id), oldest first
+        Filters keep analysis_types and timestamps in [since, until). after is the
+        (timestamp, analysis_id) of the last record of the previous page; limit 0 means all.
+        """
+        raise NotImplementedError
+
+    def usage(self) -> Tuple[int, int]:
+        """(entries, bytes) currently held"""
+        raise NotImplementedError
+
+    def __contains__(self, analysis_id: str) -> bool:
+        return self.get(analysis_id) is not None
+
+    def __len__(self) -> int:
+        return self.usage()[0]
+
+    def expiry(self, now: float) -> float:
+        return now + self.ttl_seconds if self.ttl_seconds else float("inf")
+
+    def stats(self) -> Dict:
+        entries, nbytes = self.usage()
+        return {
+            "backend": self.backend,
+            "entries": entries,
+            "bytes": nbytes,
+            "max_entries": self.max_entries,
+            "max_bytes": self.max_bytes,
+            "ttl_seconds": self.ttl_seconds,
+            "evictions": self.evictions,
+        }
+
+
+class MemoryResultStore(ResultStore):
+    """In-process store with LRU eviction by entry count and bytes, plus TTL"""
+
+    backend = "memory"
+
+    def __init__(self, max_entries: int = 0, max_bytes: int = 0, ttl_seconds: float = 0):
+        super().__init__(max_entries, max_bytes, ttl_seconds)
+        self.total_bytes = 0
+        # analysis_id -> (record, nbytes, expires_at)
+        self._entries: "OrderedDict[str, Tuple[Dict, int, float]]" = OrderedDict()
+        self._index: List[Tuple[str, str]] = []  # sorted (timestamp, analysis_id), for paging
+        self._lock = threading.Lock()
+
+    def put(self, record: Dict):
+        nbytes = record_size(record)
+        with self._lock:
+            self._pop(record["analysis_id"])
+            self._entries[record["analysis_id"]] = (record, nbytes, self.expiry(time.time()))
+            bisect.insort(self._index, (record["timestamp"], record["analysis_id"]))
+            self.total_bytes += nbytes
+            self._evict()
+
+    def get(self, analysis_id: str) -> Optional[Dict]:
+        with self._lock:
+            entry = self._entries.get(analysis_id)
+            if entry is None:
+                return None
+            if entry[2] <= time.time():
+                self._pop(analysis_id)
+                self.evictions += 1
+                return None
+            self._entries.move_to_end(analysis_id)
+            return entry[0]
+
+    def delete(self, analysis_id: str) -> bool:
+        with self._lock:
+            return self._pop(analysis_id)
+
+    def list(self, analysis_types: Optional[Collection[str]] = None, since: Optional[str] = None,
+             until: Optional[str] = None, after: Optional[Tuple[str, str]] = None, limit: int = 0,
+             descending: bool = False) -> List[Dict]:
+        summaries = []
+        with self._lock:
+            self._expire(time.time())
+            index = self._index
+            lo = bisect.bisect_left(index, (since,)) if since else 0
+            hi = bisect.bisect_left(index, (until,)) if until else len(index)
+            if after and descending:
+                hi = min(hi, bisect.bisect_left(index, tuple(after)))
+            elif after:
+                lo = max(lo, bisect.bisect_right(index, tuple(after)))
+            for i in (range(hi - 1, lo - 1, -1) if descending else range(lo, hi)):
+                record = self._entries[index[i][1]][0]
+                if analysis_types and record["analysis_type"] not in analysis_types:
+                    continue
+                summaries.append(record_summary(record))
+                if len(summaries) == limit:
+                    break
+        return summaries
+
+    def usage(self) -> Tuple[int, int]:
+        return len(self._entries), self.total_bytes
+
+    def _pop(self, analysis_id: str) -> bool:
+        entry = self._entries.pop(analysis_id, None)
+        if entry is None:
+            return False
+        position = bisect.bisect_left(self._index, (entry[0]["timestamp"], analysis_id))
+        del self._index[position]
+        self.total_bytes -= entry[1]
+        return True
+
+    def _expire(self, now: float):
+        expired = [key for key, (_, _, expires) in self._entries.items() if expires <= now]
+        for key in expired:
+            self._pop(key)
+        self.evictions += len(expired)
+
+    def _evict(self):
+        if self.ttl_seconds:
+            self._expire(time.time())
+        while len(self._entries) > 1 and (
+            (self.max_entries and len(self._entries) > self.max_entries)
+            or (self.max_bytes and self.total_bytes > self.max_bytes)
+        ):
+            key = next(iter(self._entries))
+            self._pop(key)
+            self.evictions += 1
+
+
+class SQLiteResultStore(ResultStore):
+    """On-disk store in a WAL-mode SQLite database, safe to share between processes"""
+
+    backend = "sqlite"
+
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS results (
+            analysis_id TEXT PRIMARY KEY,
+            analysis_type TEXT NOT NULL,
+            timestamp TEXT NOT NULL,
+            expires_at REAL NOT NULL,
+            nbytes INTEGER NOT NULL,
+            payload BLOB NOT NULL
+        );
+        CREATE INDEX IF NOT EXISTS results_timestamp ON results (timestamp);
+        CREATE INDEX IF NOT EXISTS results_expires ON results (expires_at);
+        CREATE INDEX IF NOT EXISTS results_type_timestamp ON results (analysis_type, timestamp);
+    """
+
+    def __init__(self, path: str, max_entries: int = 0, max_bytes: int = 0, ttl_seconds: float = 0):
+        super().__init__(max_entries, max_bytes, ttl_seconds)
+        self.path = path
+        self._local = threading.local()
+        with self._connect() as conn:
+            conn.executescript(self.SCHEMA)
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def put(self, record: Dict):
+        payload = encode_record(record)
+        with self._connect() as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO results VALUES (?, ?, ?, ?, ?, ?)",
+                (record["analysis_id"], record["analysis_type"], record["timestamp"],
+                 self.expiry(time.time()), len(payload), payload)
+            )
+            self._evict(conn)
+
+    def put_many(self, records: List[Dict]):
+        """Insert many records in one transaction"""
+        expires_at = self.expiry(time.time())
+        rows = []
+        for record in records:
+            payload = encode_record(record)
+            rows.append((record["analysis_id"], record["analysis_type"], record["timestamp"],
+                         expires_at, len(payload), payload))
+        with self._connect() as conn:
+            conn.executemany("INSERT OR REPLACE INTO results VALUES (?, ?, ?, ?, ?, ?)", rows)
+            self._evict(conn)
+
+    def get(self, analysis_id: str) -> Optional[Dict]:
+        row = self._connect().execute(
+            "SELECT payload FROM results WHERE analysis_id = ? AND expires_at > ?",
+            (analysis_id, time.time())
+        ).fetchone()
+        return decode_record(row[0]) if row else None
+
+    def __contains__(self, analysis_id: str) -> bool:
+        return self._connect().execute(
+            "SELECT 1 FROM results WHERE analysis_id = ? AND expires_at > ?",
+            (analysis_id, time.time())
+        ).fetchone() is not None
+
+    def delete(self, analysis_id: str) -> bool:
+        with self._connect() as conn:
+            return conn.execute("DELETE FROM results WHERE analysis_id = ?", (analysis_id,)).rowcount > 0
+
+    def list(self, analysis_types: Optional[Collection[str]] = None, since: Optional[str] = None,
+             until: Optional[str] = None, after: Optional[Tuple[str, str]] = None, limit: int = 0,
+             descending: bool = False) -> List[Dict]:
+        clauses, params = ["expires_at > ?"], [time.time()]
+        if analysis_types:
+            clauses.append(f"analysis_type IN ({', '.join('?' * len(analysis_types))})")
+            params.extend(analysis_types)
+        if since:
+            clauses.append("timestamp >= ?")
+            params.append(since)
+        if until:
+            clauses.append("timestamp < ?")
+            params.append(until)
+        if after:
+            clauses.append(f"(timestamp, analysis_id) {'<' if descending else '>'} (?, ?)")
+            params.extend(after)
+        direction = "DESC" if descending else "ASC"
+        query = (f"SELECT analysis_id, analysis_type, timestamp FROM results WHERE {' AND '.join(clauses)}"
+                 f" ORDER BY timestamp {direction}, analysis_id {direction}")
+        if limit:
+            query += " LIMIT ?"
+            params.append(limit)
+        rows = self._connect().execute(query, params).fetchall()
+        return [{"analysis_id": r[0], "type": r[1], "timestamp": r[2]} for r in rows]
+
+    def usage(self) -> Tuple[int, int]:
+        entries, nbytes = self._connect().execute(
+            "SELECT COUNT(*), COALESCE(SUM(nbytes), 0) FROM results WHERE expires_at > ?", (time.time(),)
+        ).fetchone()
+        return entries, nbytes
+
+    def _evict(self, conn: sqlite3.Connection):
+        evicted = conn.execute("DELETE FROM results WHERE expires_at <= ?", (time.time(),)).rowcount
+        if self.max_entries:
+            evicted += conn.execute(
+                "DELETE FROM results WHERE analysis_id IN ("
+                " SELECT analysis_id FROM results ORDER BY timestamp DESC LIMIT -1 OFFSET ?)",
+                (self.max_entries,)
+            ).rowcount
+        if self.max_bytes:
+            # Keep the newest records whose cumulative size fits the budget
+            evicted += conn.execute(
+                "DELETE FROM results WHERE analysis_id IN ("
+                " SELECT analysis_id FROM ("
+                "  SELECT analysis_id,"
+                "   SUM(nbytes) OVER (ORDER BY timestamp DESC, analysis_id) AS running,"
+                "   ROW_NUMBER() OVER (ORDER BY timestamp DESC, analysis_id) AS position"
+                "  FROM results) WHERE running > ? AND position > 1)",
+                (self.max_bytes,)
+            ).rowcount
+        self.evictions += evicted
+
+
+def create_result_store() -> ResultStore:
+    """Build the result store from ANALYSIS_RESULT_* environment variables"""
+    backend = os.environ.get("ANALYSIS_RESULT_STORE", "memory")
+    limits = dict(
+        max_entries=int(os.environ.get("ANALYSIS_RESULT_MAX_ENTRIES", 10_000)),
+        max_bytes=int(float(os.environ.get("ANALYSIS_RESULT_MAX_MB", 256)) * 1024 * 1024),
+        ttl_seconds=float(os.environ.get("ANALYSIS_RESULT_TTL_SECONDS", 7 * 24 * 3600)),
+    )
+    if backend == "memory":
+        return MemoryResultStore(**limits)
+    if backend == "sqlite":
+        return SQLiteResultStore(os.environ.get("ANALYSIS_RESULT_DB", "analysis_results.db"), **limits)
+    raise ValueError(f"Unknown ANALYSIS_RESULT_STORE '{backend}'; use 'memory' or 'sqlite'")
@@ -0,0 +1,158 @@
+"""
+Response encodings for analysis results
+Results keep their numeric series (chart points, per-point limits) as NumPy
+arrays, which orjson writes straight from the array buffer instead of building
+a Python float per element. Clients choose JSON (the default), MessagePack or an
+Arrow IPC stream through the Accept header.
+"""
+
+import importlib.util
+from typing import Annotated, Any, Dict, List, Optional, Tuple
+
+import numpy as np
+import orjson
+from fastapi import HTTPException
+from fastapi.responses import Response
+from pydantic import BaseModel, PlainValidator, WithJsonSchema
+
+
+JSON = "application/json"
+MSGPACK = "application/msgpack"
+ARROW = "application/vnd.apache.arrow.stream"
+
+# Accept values understood for each encoding; the first matching entry in the header wins
+MEDIA_TYPES = {
+    JSON: JSON,
+    "application/*": JSON,
+    "*/*": JSON,
+    MSGPACK: MSGPACK,
+    "application/x-msgpack": MSGPACK,
+    ARROW: ARROW,
+}
+
+# ETag suffix per encoding, so a cached JSON body never validates a binary one
+ETAG_SUFFIX = {JSON: "", MSGPACK: "-msgpack", ARROW: "-arrow"}
+
+HAS_MSGPACK = importlib.util.find_spec("msgpack") is not None
+HAS_PYARROW = importlib.util.find_spec("pyarrow") is not None
+
+ORJSON_OPTIONS = orjson.OPT_SERIALIZE_NUMPY | orjson.OPT_NON_STR_KEYS
+
+
+def float_array(value: Any) -> np.ndarray:
+    return np.asarray(value, dtype=float)
+
+
+# A list of floats held as a float64 array; documented as a JSON array of numbers
+FloatArray = Annotated[Any, PlainValidator(float_array), WithJsonSchema({"type": "array", "items": {"type": "number"}})]
+
+
+def fallback(value: Any) -> Any:
+    """Values orjson cannot write natively"""
+    if isinstance(value, np.ndarray):
+        return np.ascontiguousarray(value)  # strided views; orjson only takes C-contiguous arrays
+    if isinstance(value, np.generic):
+        return value.item()
+    if isinstance(value, BaseModel):
+        return dict(value)
+    if isinstance(value, (set, frozenset)):
+        return list(value)
+    return str(value)
+
+
+def dumps(content: Any) -> bytes:
+    """JSON bytes; NaN and infinities become null"""
+    return orjson.dumps(content, default=fallback, option=ORJSON_OPTIONS)
+
+
+def loads(payload: bytes) -> Any:
+    return orjson.loads(payload)
+
+
+def negotiate(accept: Optional[str]) -> str:
+    """Encoding for an Accept header, by quality then order; raises 406 when none is served"""
+    if not accept:
+        return JSON
+    ranges = []
+    for position, part in enumerate(accept.split(",")):
+        media, *params = (piece.strip() for piece in part.split(";"))
+        quality = 1.0
+        for param in params:
+            name, _, value = param.partition("=")
+            if name.strip() == "q":
+                try:
+                    quality = float(value)
+                except ValueError:
+                    quality = 0.0
+        if quality > 0:
+            ranges.append((-quality, position, media.lower()))
+    for _, _, media in sorted(ranges):
+        encoding = MEDIA_TYPES.get(media)
+        if encoding == MSGPACK and not HAS_MSGPACK or encoding == ARROW and not HAS_PYARROW:
+            continue
+        if encoding is not None:
+            return encoding
+    served = [JSON] + [MSGPACK] * HAS_MSGPACK + [ARROW] * HAS_PYARROW
+    raise HTTPException(status_code=406, detail=f"Not acceptable; available: {', '.join(served)}")
+
+
+def to_msgpack(content: Any) -> bytes:
+    import msgpack
+
+    def default(value: Any) -> Any:
+        if isinstance(value, np.ndarray):
+            return value.tolist()
+        return fallback(value)
+
+    return msgpack.packb(content, default=default)
+
+
+def split_arrays(value: Any, path: str, arrays: List[Tuple[str, np.ndarray]]) -> Any:
+    """Copy of value with every array replaced by null, collecting (dotted path, array)"""
+    if isinstance(value, np.ndarray):
+        arrays.append((path, value))
+        return None
+    if isinstance(value, BaseModel):
+        value = dict(value)
+    if isinstance(value, dict):
+        return {key: split_arrays(item, f"{path}.{key}" if path else str(key), arrays) for key, item in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [split_arrays(item, f"{path}.{i}" if path else str(i), arrays) for i, item in enumerate(value)]
+    return value
+
+
+def to_arrow(content: Any) -> bytes:
+    """
+    Arrow IPC stream of one row: each array becomes a list column named by its dotted
+    path (e.g. results.data_points) and the rest of the response is JSON in the
+    schema metadata under "response", with those arrays left as null
+    """
+    import pyarrow as pa
+
+    arrays: List[Tuple[str, np.ndarray]] = []
+    rest = split_arrays(content, "", arrays)
+    columns = {}
+    for path, array in arrays:
+        values = pa.array(np.ascontiguousarray(array))
+        columns[path] = pa.LargeListArray.from_arrays(pa.array([0, len(values)], type=pa.int64()), values)
+    table = pa.table(columns) if columns else pa.table({"_": pa.nulls(1)})
+    table = table.replace_schema_metadata({"response": dumps(rest)})
+    sink = pa.BufferOutputStream()
+    with pa.ipc.new_stream(sink, table.schema) as writer:
+        writer.write_table(table)
+    return sink.getvalue().to_pybytes()
+
+
+def encode(content: Any, encoding: str = JSON) -> bytes:
+    if encoding == MSGPACK:
+        return to_msgpack(content)
+    if encoding == ARROW:
+        return to_arrow(content)
+    return dumps(content)
+
+
+def encoded_response(content: Any, encoding: str = JSON, status_code: int = 200,
+                     headers: Optional[Dict[str, str]] = None) -> Response:
+    """Response with content in the negotiated encoding"""
+    return Response(encode(content, encoding), status_code=status_code, headers=headers, media_type=encoding)
+
@@ -0,0 +1,192 @@
+"""
+Single-pass, mergeable statistics for chunked data
+RunningMoments merges count/mean/variance/min/max with Chan's parallel update,
+RunningComoments does the same for a centered cross-product matrix, and
+KLLSketch estimates quantiles in memory independent of the row count.
+"""
+
+from typing import Dict, Iterable, List, Optional
+
+import numpy as np
+
+
+class RunningMoments:
+    """Count, mean, variance, min and max merged chunk by chunk (Welford/Chan)"""
+
+    def __init__(self):
+        self.count = 0
+        self.mean = 0.0
+        self.m2 = 0.0
+        self.min = np.inf
+        self.max = -np.inf
+
+    def update(self, values: np.ndarray):
+        """Fold a chunk of finite values into the running moments"""
+        n = values.size
+        if n == 0:
+            return
+        mean = float(values.mean())
+        m2 = float(((values - mean) ** 2).sum())
+        self._combine(n, mean, m2, float(values.min()), float(values.max()))
+
+    def merge(self, other: "RunningMoments"):
+        if other.count:
+            self._combine(other.count, other.mean, other.m2, other.min, other.max)
+
+    def _combine(self, n: int, mean: float, m2: float, vmin: float, vmax: float):
+        total = self.count + n
+        delta = mean - self.mean
+        self.mean += delta * n / total
+        self.m2 += m2 + delta * delta * self.count * n / total
+        self.count = total
+        self.min = min(self.min, vmin)
+        self.max = max(self.max, vmax)
+
+    @property
+    def variance(self) -> float:
+        """Sample variance (ddof=1)"""
+        return self.m2 / (self.count - 1) if self.count > 1 else float("nan")
+
+    @property
+    def std(self) -> float:
+        return float(np.sqrt(self.variance))
+
+
+class RunningComoments:
+    """Count, means and centered cross-product matrix of several columns, merged chunk by chunk"""
+
+    def __init__(self, width: int):
+        self.count = 0
+        self.mean = np.zeros(width)
+        self.comoments = np.zeros((width, width))
+
+    def update(self, rows: np.ndarray):
+        """Fold a (rows x width) chunk with no missing values into the running totals"""
+        n = rows.shape[0]
+        if n == 0:
+            return
+        mean = rows.mean(axis=0)
+        centered = rows - mean
+        self._combine(n, mean, centered.T @ centered)
+
+    def merge(self, other: "RunningComoments"):
+        if other.count:
+            self._combine(other.count, other.mean, other.comoments)
+
+    def _combine(self, n: int, mean: np.ndarray, comoments: np.ndarray):
+        total = self.count + n
+        delta = mean - self.mean
+        self.comoments += comoments + np.outer(delta, delta) * self.count * n / total
+        self.mean += delta * n / total
+        self.count = total
+
+
+class KLLSketch:
+    """
+    KLL quantile sketch (Karnin, Lang & Liberty, 2016)
+    Level h holds items of weight 2**h; a full level is sorted and every other
+    item is promoted. Rank error is roughly 1.7 / k with high probability.
+    """
+
+    def __init__(self, k: int = 400, seed: Optional[int] = 0):
+        self.k = k
+        self.count = 0
+        self.levels: List[np.ndarray] = [np.empty(0)]
+        self._rng = np.random.default_rng(seed)
+
+    def capacity(self, level: int) -> int:
+        depth = len(self.levels) - level - 1
+        return max(2, int(np.ceil(self.k * (2 / 3) ** depth)))
+
+    def update(self, values: np.ndarray):
+        if values.size == 0:
+            return
+        self.count += values.size
+        self.levels[0] = np.concatenate([self.levels[0], values.astype(np.float64)])
+        self._compress()
+
+    def merge(self, other: "KLLSketch"):
+        while len(self.levels) < len(other.levels):
+            self.levels.append(np.empty(0))
+        for h, items in enumerate(other.levels):
+            self.levels[h] = np.concatenate([self.levels[h], items])
+        self.count += other.count
+        self._compress()
+
+    def _compress(self):
+        h = 0
+        while h < len(self.levels):
+            items = self.levels[h]
+            if items.size > self.capacity(h):
+                if h + 1 == len(self.levels):
+                    self.levels.append(np.empty(0))
+                items = np.sort(items)
+                # Keep one leftover item when the level is odd-sized
+                keep = items[:items.size % 2]
+                paired = items[items.size % 2:]
+                promoted = paired[self._rng.integers(2)::2]
+                self.levels[h] = keep
+                self.levels[h + 1] = np.concatenate([self.levels[h + 1], promoted])
+            h += 1
+
+    def _weighted(self):
+        items = np.concatenate(self.levels)
+        weights = np.concatenate([np.full(level.size, 2.0 ** h) for h, level in enumerate(self.levels)])
+        order = np.argsort(items, kind="stable")
+        return items[order], np.cumsum(weights[order])
+
+    def quantiles(self, qs: Iterable[float]) -> np.ndarray:
+        """Approximate quantiles with linear interpolation between retained items"""
+        qs = np.asarray(list(qs), dtype=float)
+        if self.count == 0:
+            return np.full(qs.shape, np.nan)
+        items, cum = self._weighted()
+        # Rank of each retained item at the midpoint of its weight, on a 0..n-1 scale
+        ranks = cum - (np.diff(np.concatenate([[0.0], cum])) + 1) / 2
+        return np.interp(qs * (self.count - 1), ranks, items)
+
+    @property
+    def rank_error(self) -> float:
+        """Approximate normalised rank error bound"""
+        return 1.7 / self.k
+
+
+class ColumnSummary:
+    """Moments plus quantile sketch for one column"""
+
+    def __init__(self, k: int = 400):
+        self.moments = RunningMoments()
+        self.sketch = KLLSketch(k)
+
+    def update(self, values: np.ndarray):
+        values = values[np.isfinite(values)]
+        self.moments.update(values)
+        self.sketch.update(values)
+
+
+def exact_quantiles_from_bracket(qs: Iterable[float], count: int, below: int,
+                                 bracket: np.ndarray) -> Optional[np.ndarray]:
+    """
+    Exact linear-interpolated quantiles from the values inside a bracket
+    `below` values fall under the bracket; returns None if a needed rank lies outside it.
+    """
+    bracket = np.sort(bracket)
+    out = []
+    for q in qs:
+        pos = q * (count - 1)
+        lo_rank, hi_rank = int(np.floor(pos)), int(np.ceil(pos))
+        lo_idx, hi_idx = lo_rank - below, hi_rank - below
+        if lo_idx < 0 or hi_idx >= bracket.size:
+            return None
+        frac = pos - lo_rank
+        out.append(bracket[lo_idx] + (bracket[hi_idx] - bracket[lo_idx]) * frac)
+    return np.asarray(out)
+
+
+def summarize_chunks(chunks: Iterable[Dict[str, np.ndarray]], k: int = 400) -> Dict[str, ColumnSummary]:
+    """Fold an iterable of {column: values} chunks into per-column summaries"""
+    summaries: Dict[str, ColumnSummary] = {}
+    for chunk in chunks:
+        for col, values in chunk.items():
+            summaries.setdefault(col, ColumnSummary(k)).update(values)
+    return summaries